@@ -44,9 +44,14 @@ INSTALLED_APPS = [
     'drf_spectacular',  # API documentation
     'user',  # user app
     'recipe',  # recipe app
+    'job',  # background job app
+    'profiling',  # request profiles app
 ]
 
 MIDDLEWARE = [
+    'core.middleware.LoadSheddingMiddleware',
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -90,6 +95,53 @@ DATABASES = {
     }
 }
 
+# Recipe shards. Each name in DB_SHARD_NAMES is a database holding the
+# recipes of some users; `default` is always a shard. A shard is on the
+# primary's host with its credentials, unless DB_SHARD_<NAME>_HOST, _PORT,
+# _USER or _PASSWORD say otherwise, e.g. DB_SHARD_RECIPES2_HOST for the
+# `recipes2` shard. A shared cache backend is needed when running several
+# processes, so the user to shard directory cache is consistent. See
+# core/sharding.py.
+RECIPE_SHARDS = ['default']
+for name in filter(None, os.environ.get('DB_SHARD_NAMES', '').split(',')):
+    alias = f'shard_{name}'
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': name}
+    for key in ['HOST', 'PORT', 'USER', 'PASSWORD']:
+        value = os.environ.get(f'DB_SHARD_{name.upper()}_{key}')
+        if value:
+            DATABASES[alias][key] = value
+    RECIPE_SHARDS.append(alias)
+
+SHARD_DIRECTORY_CACHE_TIMEOUT = 60
+SHARD_ID_BLOCK_SIZE = 100
+
+# Read replicas, as a comma separated list of hosts sharing the primary's
+# credentials. Safe requests read from a replica unless the client wrote
+# within REPLICA_PIN_SECONDS, or every replica lags more than
+# REPLICA_MAX_LAG seconds behind the primary.
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))
+):
+    alias = f'replica{index + 1}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = [
+    'core.sharding.ShardRouter',
+    'core.routers.ReplicaRouter',
+]
+# Clients that wrote are pinned to the primary in this cache, which must be
+# shared by every process; startup fails otherwise.
+REPLICA_PIN_CACHE = 'default'
+REPLICA_PIN_SECONDS = 5
+REPLICA_MAX_LAG = 2
+REPLICA_HEALTH_CHECK_INTERVAL = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -129,13 +181,142 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', BASE_DIR / 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
+
+# Users are deleted in the background, removing this many recipes per
+# transaction so a heavy user never holds locks for long.
+USER_DELETION_BATCH_SIZE = int(os.environ.get('USER_DELETION_BATCH_SIZE', 500))
+
+# Cache shared by every process, holding the recipe detail cache, replica
+# pins and the shard directory: memcached at MEMCACHED_LOCATION, a comma
+# separated list of host:port. Without it each process has its own local
+# memory cache, which only suits a single process such as runserver.
+MEMCACHED_LOCATION = os.environ.get('MEMCACHED_LOCATION')
+if MEMCACHED_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': MEMCACHED_LOCATION.split(','),
+        },
+    }
+
+# Recipe detail cache: an in-process LRU in front of the Django cache.
+RECIPE_CACHE_LOCAL_SIZE = 1024
+RECIPE_CACHE_LOCAL_TTL = 5
+RECIPE_CACHE_TIMEOUT = 300
+
+# Most recipes fetched by one call to the recipe batch endpoint.
+RECIPE_BATCH_MAX_SIZE = 100
+
+# Recipe images, see recipe/images.py. Uploads over RECIPE_IMAGE_MAX_SIZE
+# bytes or RECIPE_IMAGE_MAX_PIXELS pixels are refused. Thumbnails fitting in
+# each of the RECIPE_THUMBNAIL_SIZES squares are rendered by the job worker
+# in a pool of RECIPE_THUMBNAIL_WORKERS processes (0 renders in the worker
+# itself), which a job waits on for at most RECIPE_THUMBNAIL_TIMEOUT
+# seconds, and lists only show those up to RECIPE_LIST_THUMBNAIL_MAX_SIZE.
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+RECIPE_THUMBNAIL_TIMEOUT = 60
+RECIPE_THUMBNAIL_SIZES = [128, 512, 1024]
+RECIPE_THUMBNAIL_WORKERS = int(os.environ.get('RECIPE_THUMBNAIL_WORKERS', 2))
+RECIPE_LIST_THUMBNAIL_MAX_SIZE = 256
+
+# Similar recipes TF-IDF index, shared by all processes via mmap.
+SIMILARITY_INDEX_DIR = os.environ.get(
+    'SIMILARITY_INDEX_DIR', BASE_DIR / 'var' / 'similarity'
+)
+SIMILARITY_MAX_DELTAS = 50
+
+# Background job queue, processed by `manage.py run_worker`. Running jobs
+# refresh their lock every JOB_HEARTBEAT_INTERVAL seconds; jobs whose lock
+# is older than JOB_LOCK_TIMEOUT are retried, or failed once out of
+# attempts, by the next worker sweep every JOB_SWEEP_INTERVAL seconds.
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BACKOFF = 30
+JOB_RETRY_BACKOFF_MAX = 3600
+JOB_HEARTBEAT_INTERVAL = 60
+JOB_LOCK_TIMEOUT = 300
+JOB_SWEEP_INTERVAL = 60
+
+# Responses to requests sent with an Idempotency-Key are replayed to retries
+# for this many seconds; `manage.py clear_idempotency_keys` removes them.
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+# Tombstones of deleted recipes are kept this many seconds for syncing
+# clients; `manage.py prune_tombstones` removes older ones.
+SYNC_TOMBSTONE_TTL = 30 * 24 * 60 * 60
+
+# Production server, `manage.py serve`. SERVE_WORKERS defaults to the CPU
+# count; workers are replaced after SERVE_MAX_REQUESTS requests.
+SERVE_WORKERS = int(os.environ.get('SERVE_WORKERS', 0)) or None
+SERVE_THREADS = 4
+SERVE_MAX_REQUESTS = 1000
+SERVE_MAX_REQUESTS_JITTER = 100
+SERVE_KEEPALIVE = 5
+SERVE_TIMEOUT = 30
+SERVE_GRACEFUL_TIMEOUT = 30
+
+# Request profiling, see core/profiling.py. Off unless PROFILING_ENABLED is
+# set; then requests with a signed X-Profile header and a random
+# PROFILING_SAMPLE_RATE share of the rest are profiled. Profiles show stack
+# frames and SQL, so PROFILING_DIR must not be served: keep it outside
+# MEDIA_ROOT.
+PROFILING_DIR = os.environ.get('PROFILING_DIR', BASE_DIR / 'var' / 'profiles')
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '') == 'true'
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_SAMPLE_INTERVAL = 0.005
+PROFILING_TOKEN_MAX_AGE = 3600
+PROFILING_MAX_PROFILES = 100
+
+# Load shedding, see core/loadshedding.py. Each process admits an adaptive
+# number of concurrent requests between the MIN and MAX limits; the rest
+# wait up to LOAD_SHEDDING_QUEUE_TIMEOUT seconds and are then answered with
+# a 503. Critical paths are never limited, low priority ones get a share.
+# The INITIAL and MAX limits default to the worker's thread count, as no
+# more requests than that can be in flight in one process.
+LOAD_SHEDDING_ENABLED = os.environ.get('LOAD_SHEDDING_ENABLED',
+                                       'true') == 'true'
+LOAD_SHEDDING_INITIAL_LIMIT = None
+LOAD_SHEDDING_MIN_LIMIT = 2
+LOAD_SHEDDING_MAX_LIMIT = None
+LOAD_SHEDDING_TOLERANCE = 1.5
+LOAD_SHEDDING_QUEUE_TIMEOUT = 0.05
+LOAD_SHEDDING_MAX_QUEUE_DELAY = 5.0
+LOAD_SHEDDING_RETRY_AFTER = 1
+LOAD_SHEDDING_LOW_PRIORITY_SHARE = 0.8
+LOAD_SHEDDING_PRIORITIES = [
+    (r'^/api/health/$', 'critical'),
+    (r'^/api/recipe/recipes/(export|batch|changes)/$', 'low'),
+    (r'^/api/recipe/recipes/\d+/similar/$', 'low'),
+]
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
-}
\ No newline at end of file
+    # Reverse proxies in front of the app. Client addresses are taken from
+    # X-Forwarded-For only as far as these proxies appended to it; with 0
+    # the header, which any client can send, is ignored.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+    # Token buckets of core.throttling, as <requests>/<period>[:<burst>].
+    'DEFAULT_THROTTLE_RATES': {
+        'auth': '10/min:20',
+        'recipe-write': '120/min:60',
+    },
+}
+
+# Cache alias sharing throttle buckets between processes, by default the
+# shared cache when memcached is configured. Without one each process keeps
+# its own buckets, so a client may make the rate times the number of worker
+# processes.
+THROTTLE_CACHE = os.environ.get('THROTTLE_CACHE') or (
+    'default' if MEMCACHED_LOCATION else None
+)
\ No newline at end of file
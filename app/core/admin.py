@@ -5,6 +5,8 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
 from core import models
+from core.deletion import schedule_user_deletion
+from core.sharding import get_shards
 
 @admin.register(models.User)
 class UserAdmin(BaseUserAdmin):
@@ -23,4 +25,53 @@ class UserAdmin(BaseUserAdmin):
     )
     readonly_fields = ['last_login']
 
+    def get_deleted_objects(self, objs, request):
+        """Summarise the deletion without collecting related recipes."""
+        objs = list(objs)
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(self.opts.verbose_name)
+        # The users' recipes may be spread over every shard.
+        user_ids = [obj.pk for obj in objs]
+        recipes = sum(
+            models.Recipe.objects.using(alias)
+            .filter(user_id__in=user_ids).count()
+            for alias in get_shards()
+        )
+        model_count = {
+            self.opts.verbose_name_plural: len(objs),
+            models.Recipe._meta.verbose_name_plural: recipes,
+        }
+        return [str(obj) for obj in objs], model_count, perms_needed, []
+
+    def delete_model(self, request, obj):
+        """Deactivate the user and delete their data in the background."""
+        schedule_user_deletion(obj)
+
+    def delete_queryset(self, request, queryset):
+        """Schedule a batched deletion for every selected user."""
+        for user in queryset:
+            schedule_user_deletion(user)
+
+
+@admin.register(models.UserDeletion)
+class UserDeletionAdmin(admin.ModelAdmin):
+    """Read-only progress of background user deletions."""
+    ordering = ['-id']
+    list_display = [
+        'email', 'status', 'deleted_recipes', 'total_recipes',
+        'created_at', 'finished_at',
+    ]
+    list_filter = ['status']
+    readonly_fields = [
+        'user', 'email', 'status', 'total_recipes', 'deleted_recipes',
+        'last_error', 'created_at', 'updated_at', 'finished_at',
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+
 admin.site.register(models.Recipe)
+admin.site.register(models.Tag)
+admin.site.register(models.Ingredient)
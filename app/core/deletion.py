@@ -0,0 +1,98 @@
+"""
+Batched background deletion of users and their recipes.
+
+Deleting a user through the ORM cascades to every recipe they own in a
+single transaction. For users with many recipes that transaction holds
+locks for a long time, so instead the user is deactivated immediately
+and their recipes are removed in small batches, each in its own
+transaction, before the user row itself is deleted. The work runs on the
+job queue (see `core.jobs`).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core import jobs, sync
+from core.models import Ingredient, Recipe, Tag, UserDeletion
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def get_batch_size():
+    """Return the number of recipes deleted per transaction."""
+    return getattr(settings, 'USER_DELETION_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def schedule_user_deletion(user):
+    """Deactivate the user and queue their data for batched deletion."""
+    with transaction.atomic():
+        deletion = UserDeletion.objects.filter(
+            user=user,
+            status__in=[UserDeletion.STATUS_PENDING,
+                        UserDeletion.STATUS_RUNNING],
+        ).first()
+        if deletion is None:
+            deletion = UserDeletion.objects.create(
+                user=user,
+                email=user.email,
+                total_recipes=Recipe.objects.for_user(user).count(),
+            )
+            jobs.enqueue('user.delete', {'deletion_id': deletion.pk})
+        if user.is_active:
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+        Token.objects.filter(user=user).delete()
+    return deletion
+
+
+def run_user_deletion(deletion, batch_size=None):
+    """Delete the user's recipes in batches, then the user itself."""
+    batch_size = batch_size or get_batch_size()
+    deletion.status = UserDeletion.STATUS_RUNNING
+    deletion.save(update_fields=['status', 'updated_at'])
+    try:
+        user_id = deletion.user_id
+        if user_id is not None:
+            while delete_recipe_batch(deletion, user_id, batch_size):
+                pass
+            sync.forget_user(user_id)
+            # Like recipes, these may be on another shard than the user.
+            for model in [Tag, Ingredient]:
+                model.objects.for_user(user_id).delete()
+            with transaction.atomic():
+                deletion.user.delete()
+            deletion.user = None
+    except Exception as exc:
+        deletion.status = UserDeletion.STATUS_FAILED
+        deletion.last_error = str(exc)
+        deletion.save(update_fields=['status', 'last_error', 'updated_at'])
+        raise
+
+    deletion.status = UserDeletion.STATUS_DONE
+    deletion.finished_at = timezone.now()
+    deletion.save(update_fields=['status', 'finished_at', 'updated_at'])
+    return deletion
+
+
+def delete_recipe_batch(deletion, user_id, batch_size):
+    """Delete one batch of recipes and return how many were removed."""
+    with transaction.atomic():
+        recipes = Recipe.objects.for_user(user_id)
+        ids = list(
+            recipes.order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        recipes.filter(id__in=ids).delete()
+        deletion.deleted_recipes += len(ids)
+        deletion.save(update_fields=['deleted_recipes', 'updated_at'])
+    return len(ids)
+
+
+def get_unfinished_deletions(include_running=False):
+    """Return deletions that still have work left to do."""
+    statuses = [UserDeletion.STATUS_PENDING, UserDeletion.STATUS_FAILED]
+    if include_running:
+        statuses.append(UserDeletion.STATUS_RUNNING)
+    return UserDeletion.objects.filter(status__in=statuses).order_by('id')
@@ -0,0 +1,227 @@
+"""
+Idempotency keys for unsafe API requests.
+
+A client retrying a request sends the same `Idempotency-Key` header as the
+original. The first request reserves the key, runs the view and stores its
+response; retries are answered from the stored response without running
+the view again. Keys are scoped to the endpoint and the authenticated user,
+or the client address of anonymous requests, are bound to the request body
+so a reused key cannot fetch another request's response, and expire after
+IDEMPOTENCY_KEY_TTL seconds.
+
+Request bodies are fingerprinted with an HMAC keyed by SECRET_KEY, leaving
+out write-only fields such as passwords, so stored fingerprints cannot be
+used to guess what was sent.
+"""
+import hashlib
+import hmac
+import json
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+
+from core.models import IdempotencyKey
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+def get_ttl():
+    """Return how long stored responses are kept, in seconds."""
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+
+
+def get_lock_timeout():
+    """Return after how long an unfinished request may be taken over."""
+    return getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60)
+
+
+def sign(value):
+    """Return a keyed hash of `value`."""
+    return hmac.new(
+        settings.SECRET_KEY.encode(), value.encode(), hashlib.sha256,
+    ).hexdigest()
+
+
+def get_fingerprint(request, exclude=()):
+    """Return a keyed hash of the request's method, path and body.
+
+    Body fields named in `exclude` are left out.
+    """
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    if isinstance(data, dict):
+        data = {
+            name: value for name, value in data.items()
+            if name not in exclude
+        }
+    body = json.dumps(
+        [request.method, request.path, data],
+        sort_keys=True,
+        default=str,
+    )
+    return sign(body)
+
+
+def encode_response(response):
+    """Return the compressed body of a response."""
+    body = json.dumps(
+        response.data,
+        cls=DjangoJSONEncoder,
+        separators=(',', ':'),
+    )
+    return zlib.compress(body.encode())
+
+
+def decode_response(record):
+    """Return the stored response of a finished request."""
+    data = json.loads(zlib.decompress(bytes(record.response)))
+    return Response(
+        data,
+        status=record.status_code,
+        headers={REPLAYED_HEADER: 'true'},
+    )
+
+
+def reserve(scope, key, fingerprint):
+    """
+    Reserve a key for a new request.
+
+    Return (record, None) when the caller should run the request, or
+    (None, response) when it must be answered without running it.
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                scope=scope,
+                key=key,
+                fingerprint=fingerprint,
+                expires_at=now + timedelta(seconds=get_ttl()),
+            )
+        return record, None
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+    if record is None:
+        # Removed after a failure in the meantime; let the client retry.
+        return None, conflict()
+    stale = now - timedelta(seconds=get_lock_timeout())
+    if record.expires_at <= now or (
+            record.status_code is None and record.created_at <= stale):
+        # Take over an expired key or an abandoned request. The filter on
+        # the old creation time lets only one retry win.
+        taken = IdempotencyKey.objects.filter(
+            pk=record.pk,
+            created_at=record.created_at,
+        ).update(
+            fingerprint=fingerprint,
+            status_code=None,
+            response=None,
+            created_at=now,
+            expires_at=now + timedelta(seconds=get_ttl()),
+        )
+        if not taken:
+            return None, conflict()
+        record.refresh_from_db()
+        return record, None
+    if record.fingerprint != fingerprint:
+        return None, Response(
+            {'detail': 'Idempotency-Key was already used for a different '
+                       'request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record.status_code is None:
+        return None, conflict()
+    return None, decode_response(record)
+
+
+def conflict():
+    return Response(
+        {'detail': 'A request with this Idempotency-Key is in progress.'},
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
+def run_idempotent(request, scope, handler, exclude=()):
+    """Run `handler`, or replay its response for a repeated key.
+
+    Body fields named in `exclude` do not bind the key to the request.
+    """
+    key = request.META.get(HEADER)
+    if key is None:
+        return handler()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return Response(
+            {'detail': 'Idempotency-Key must be 1 to '
+                       f'{MAX_KEY_LENGTH} characters.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    record, response = reserve(
+        scope, key, get_fingerprint(request, exclude),
+    )
+    if response is not None:
+        return response
+    try:
+        response = handler()
+    except Exception:
+        record.delete()
+        raise
+    if response.status_code >= 500:
+        # Server errors are not final, so a retry should run again.
+        record.delete()
+        return response
+    record.status_code = response.status_code
+    record.response = encode_response(response)
+    record.save(update_fields=['status_code', 'response'])
+    return response
+
+
+def clear_expired_keys():
+    """Delete expired keys, returning how many were removed."""
+    deleted, _ = IdempotencyKey.objects.filter(
+        expires_at__lte=timezone.now(),
+    ).delete()
+    return deleted
+
+
+class IdempotentCreateMixin:
+    """Make a view's `create` honour the `Idempotency-Key` header."""
+    idempotency_scope = None
+
+    def get_idempotency_scope(self):
+        """Return the namespace of keys sent to this view."""
+        scope = self.idempotency_scope or type(self).__name__
+        user = self.request.user
+        if user.is_authenticated:
+            return f'{scope}:{user.pk}'
+        # Anonymous clients get a namespace per address, so one cannot
+        # replay the response to another's key.
+        client = BaseThrottle().get_ident(self.request)
+        return f'{scope}:anon:{sign(client)[:32]}'
+
+    def get_idempotency_exclude(self):
+        """Return the body fields left out of fingerprints: secrets."""
+        return [
+            name for name, field in self.get_serializer().fields.items()
+            if field.write_only
+        ]
+
+    def create(self, request, *args, **kwargs):
+        parent = super().create
+        return run_idempotent(
+            request,
+            self.get_idempotency_scope(),
+            lambda: parent(request, *args, **kwargs),
+            exclude=self.get_idempotency_exclude(),
+        )
@@ -0,0 +1,195 @@
+"""
+Database-backed background job queue.
+
+Jobs are rows in the `Job` table. Workers claim them with
+`SELECT ... FOR UPDATE SKIP LOCKED` so any number of worker processes can
+poll the same table without blocking on, or double-running, each other.
+Handlers are registered per job kind in each app's `tasks.py` module.
+
+A running job refreshes its `locked_at` every JOB_HEARTBEAT_INTERVAL
+seconds. Workers periodically return jobs whose heartbeat is older than
+JOB_LOCK_TIMEOUT to the queue, since their worker died; the lost run
+counts as one of the job's attempts.
+"""
+import logging
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from core.models import Job
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+_discovered = False
+
+
+class UnknownJobKind(Exception):
+    """Raised when no handler is registered for a job kind."""
+
+
+def register(kind):
+    """Register the decorated function as the handler for `kind`."""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def autodiscover():
+    """Import every installed app's `tasks` module once."""
+    global _discovered
+    if not _discovered:
+        autodiscover_modules('tasks')
+        _discovered = True
+
+
+def get_handler(kind):
+    """Return the handler registered for `kind`."""
+    autodiscover()
+    try:
+        return _handlers[kind]
+    except KeyError:
+        raise UnknownJobKind(kind)
+
+
+def enqueue(kind, payload=None, user=None, run_at=None, max_attempts=None):
+    """Create and return a queued job."""
+    if max_attempts is None:
+        max_attempts = getattr(settings, 'JOB_MAX_ATTEMPTS', 3)
+    return Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        user=user,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts,
+    )
+
+
+def get_backoff(attempts):
+    """Return the delay before retrying a job that failed `attempts` times."""
+    base = getattr(settings, 'JOB_RETRY_BACKOFF', 30)
+    cap = getattr(settings, 'JOB_RETRY_BACKOFF_MAX', 3600)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), cap))
+
+
+def claim_job(worker_id):
+    """Lock the next due job for this worker, or return None."""
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.STATUS_QUEUED, run_at__lte=now)
+            .order_by('run_at', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = Job.STATUS_RUNNING
+        job.locked_by = worker_id
+        job.locked_at = now
+        job.attempts += 1
+        job.save(update_fields=[
+            'status', 'locked_by', 'locked_at', 'attempts', 'updated_at',
+        ])
+    return job
+
+
+def touch_job(job):
+    """Refresh the lock of a job still held by its worker."""
+    return Job.objects.filter(
+        pk=job.pk,
+        status=Job.STATUS_RUNNING,
+        locked_by=job.locked_by,
+    ).update(locked_at=timezone.now())
+
+
+@contextmanager
+def heartbeat(job, interval=None):
+    """Touch the job's lock every `interval` seconds while it runs."""
+    if interval is None:
+        interval = getattr(settings, 'JOB_HEARTBEAT_INTERVAL', 60)
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                touch_job(job)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(
+        target=beat, name=f'heartbeat-{job.pk}', daemon=True,
+    )
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def fail_attempt(job, error):
+    """Record a failed attempt, retrying the job if it has any left."""
+    job.last_error = error
+    if job.attempts < job.max_attempts:
+        job.status = Job.STATUS_QUEUED
+        job.run_at = timezone.now() + get_backoff(job.attempts)
+        logger.warning('Job %s failed, retrying at %s', job, job.run_at)
+    else:
+        job.status = Job.STATUS_FAILED
+        job.finished_at = timezone.now()
+        logger.error('Job %s failed permanently', job)
+
+
+def run_job(job):
+    """Run a claimed job and record its outcome."""
+    try:
+        with heartbeat(job):
+            result = get_handler(job.kind)(job)
+    except Exception:
+        fail_attempt(job, traceback.format_exc())
+    else:
+        job.status = Job.STATUS_SUCCEEDED
+        job.result = result
+        job.last_error = ''
+        job.finished_at = timezone.now()
+    job.locked_by = ''
+    job.locked_at = None
+    job.save()
+    return job
+
+
+def requeue_stale_jobs(timeout=None):
+    """Retry or fail jobs locked by a worker that died, returning how many."""
+    if timeout is None:
+        timeout = getattr(settings, 'JOB_LOCK_TIMEOUT', 300)
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    with transaction.atomic():
+        stale = list(
+            Job.objects.select_for_update(skip_locked=True).filter(
+                status=Job.STATUS_RUNNING,
+                locked_at__lt=cutoff,
+            )
+        )
+        for job in stale:
+            # claim_job already counted the lost run as an attempt.
+            fail_attempt(job, f'Worker {job.locked_by} stopped responding.')
+            job.locked_by = ''
+            job.locked_at = None
+            job.save()
+    return len(stale)
+
+
+def work_once(worker_id):
+    """Claim and run a single job, returning it or None if idle."""
+    job = claim_job(worker_id)
+    if job is not None:
+        run_job(job)
+    return job
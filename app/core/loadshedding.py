@@ -0,0 +1,218 @@
+"""
+Adaptive concurrency limiting and load shedding.
+
+LoadSheddingMiddleware admits at most `limit` requests at a time into each
+process. The limit adapts to the latency of the requests it admits, in the
+style of a gradient limiter: it compares a short-term moving average of
+latency with a long-term one, grows by about sqrt(limit) while the two
+agree and the limit is in use, and shrinks towards limit * long / short
+when requests start to slow down, which is what happens once the database
+saturates.
+
+A process never has more requests in flight than its worker threads, so
+the limit starts at, and never grows past, the thread count of the worker:
+SERVE_THREADS, or what `manage.py serve` started it with. Requests over it
+queue in the server instead, where X-Request-Start shows their delay.
+
+Requests over the limit wait up to LOAD_SHEDDING_QUEUE_TIMEOUT seconds for
+a slot and are then rejected with a 503 and `Retry-After`, as are requests
+that already spent LOAD_SHEDDING_MAX_QUEUE_DELAY seconds queued upstream
+(from the proxy's `X-Request-Start` header). Paths are given a priority by
+LOAD_SHEDDING_PRIORITIES: `critical` ones, such as the health check, are
+never limited, and `low` ones are only admitted below a share of the limit
+so that cheaper requests get the remaining capacity.
+"""
+import math
+import re
+import threading
+import time
+
+from django.conf import settings
+
+CRITICAL = 'critical'
+NORMAL = 'normal'
+LOW = 'low'
+REQUEST_START_HEADER = 'HTTP_X_REQUEST_START'
+SHORT_WEIGHT = 0.1
+LONG_WEIGHT = 0.01
+
+
+def is_enabled():
+    return getattr(settings, 'LOAD_SHEDDING_ENABLED', True)
+
+
+def get_priority(path):
+    """Return the priority of requests for `path`."""
+    for pattern, priority in getattr(settings, 'LOAD_SHEDDING_PRIORITIES',
+                                     []):
+        if re.match(pattern, path):
+            return priority
+    return NORMAL
+
+
+def get_upstream_delay(request, now=None):
+    """Return the seconds a request spent queued before reaching Django.
+
+    Reads the `X-Request-Start: t=<epoch>` header set by proxies, with the
+    time in seconds, milliseconds or microseconds. Returns None without it.
+    """
+    value = request.META.get(REQUEST_START_HEADER, '')
+    try:
+        start = float(value[2:] if value.startswith('t=') else value)
+    except ValueError:
+        return None
+    # Scale milliseconds and microseconds down to seconds.
+    while start > 1e11:
+        start /= 1000
+    now = time.time() if now is None else now
+    return max(now - start, 0.0)
+
+
+class AdaptiveLimiter:
+    """Process-wide concurrency limit adjusted by observed latency."""
+
+    def __init__(self, initial=20, min_limit=2, max_limit=200,
+                 tolerance=1.5, smoothing=0.2, low_priority_share=0.8):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.low_priority_share = low_priority_share
+        self.in_flight = 0
+        self.waiting = 0
+        self.short_latency = None
+        self.long_latency = None
+        self.queue_wait = 0.0
+        self.admitted = 0
+        self.shed = 0
+        self._cond = threading.Condition()
+
+    def capacity(self, priority):
+        """Return how many requests of `priority` may be in flight."""
+        if priority == LOW:
+            return max(self.limit * self.low_priority_share, 1)
+        return self.limit
+
+    def acquire(self, priority=NORMAL, timeout=0.0):
+        """Wait up to `timeout` seconds for a slot; return if one was got."""
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._cond:
+            if self.in_flight >= self.capacity(priority):
+                # Waiting only helps while the queue can drain in time.
+                if self.waiting >= self.limit:
+                    self.shed += 1
+                    return False
+                self.waiting += 1
+                try:
+                    while self.in_flight >= self.capacity(priority):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.shed += 1
+                            return False
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            self.admitted += 1
+            waited = time.monotonic() - start
+            self.queue_wait += (waited - self.queue_wait) * SHORT_WEIGHT
+            return True
+
+    def release(self, latency):
+        """Free a slot, and adjust the limit for a request's latency."""
+        with self._cond:
+            in_use = self.in_flight
+            self.in_flight -= 1
+            self.update(latency, in_use)
+            self._cond.notify_all()
+
+    def update(self, latency, in_use):
+        """Move the limit by the gradient between recent and usual latency."""
+        if self.short_latency is None:
+            self.short_latency = self.long_latency = latency
+        self.short_latency += (latency - self.short_latency) * SHORT_WEIGHT
+        self.long_latency += (latency - self.long_latency) * LONG_WEIGHT
+        if self.short_latency <= 0:
+            return
+        gradient = self.tolerance * self.long_latency / self.short_latency
+        gradient = max(0.5, min(1.0, gradient))
+        # Only probe for more capacity when the current limit is in use.
+        headroom = math.sqrt(self.limit) if in_use * 2 >= self.limit else 0
+        target = self.limit * gradient + headroom
+        limit = self.limit + (target - self.limit) * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, limit))
+
+    def record_shed(self):
+        """Count a request rejected without asking for a slot."""
+        with self._cond:
+            self.shed += 1
+
+    def stats(self):
+        """Return the limiter's current state and counters."""
+        with self._cond:
+            return {
+                'limit': round(self.limit, 2),
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'short_latency': self.short_latency,
+                'long_latency': self.long_latency,
+                'queue_wait': self.queue_wait,
+                'admitted': self.admitted,
+                'shed': self.shed,
+            }
+
+
+_worker_threads = None
+
+
+def set_worker_threads(threads):
+    """Record how many requests this worker process serves at once."""
+    global _worker_threads
+    _worker_threads = threads
+    reset_limiter()
+
+
+def get_worker_threads():
+    """Return how many requests this process serves at once."""
+    return _worker_threads or getattr(settings, 'SERVE_THREADS', 4)
+
+
+def create_limiter():
+    """Return a limiter configured from the settings and worker threads."""
+    max_limit = (
+        getattr(settings, 'LOAD_SHEDDING_MAX_LIMIT', None)
+        or get_worker_threads()
+    )
+    initial = getattr(settings, 'LOAD_SHEDDING_INITIAL_LIMIT', None)
+    min_limit = getattr(settings, 'LOAD_SHEDDING_MIN_LIMIT', 2)
+    return AdaptiveLimiter(
+        initial=min(initial or max_limit, max_limit),
+        min_limit=min(min_limit, max_limit),
+        max_limit=max_limit,
+        tolerance=getattr(settings, 'LOAD_SHEDDING_TOLERANCE', 1.5),
+        low_priority_share=getattr(
+            settings, 'LOAD_SHEDDING_LOW_PRIORITY_SHARE', 0.8,
+        ),
+    )
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """Return this process's limiter."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = create_limiter()
+        return _limiter
+
+
+def reset_limiter():
+    """Drop this process's limiter, so the next one reads the settings."""
+    global _limiter
+    with _limiter_lock:
+        _limiter = None
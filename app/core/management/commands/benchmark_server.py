@@ -0,0 +1,96 @@
+"""
+Django command to compare the throughput of runserver and serve.
+"""
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.serving import run_load, wait_for_port
+
+SERVERS = {
+    'runserver': ['runserver', '--noreload', '{host}:{port}'],
+    'serve': ['serve', '--bind', '{host}:{port}'],
+}
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the development and production servers."""
+    help = ('Start each server in turn, load it with concurrent keep-alive '
+            'clients and report the throughput.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--servers', nargs='+', choices=list(SERVERS),
+            default=list(SERVERS),
+            help='Servers to compare.',
+        )
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--path', default='/api/recipe/recipes/',
+            help='Path requested; the default answers 401 without touching '
+                 'the database, measuring the serving stack itself.',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Number of concurrent clients.',
+        )
+        parser.add_argument(
+            '--duration', type=float, default=5.0,
+            help='Seconds to load each server for.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        host, port = options['host'], options['port']
+        results = {}
+        for name in options['servers']:
+            command = [
+                arg.format(host=host, port=port) for arg in SERVERS[name]
+            ]
+            self.stdout.write(f'Benchmarking {name}...')
+            # Request logs go to a file, as a full pipe would block the server.
+            log = tempfile.TemporaryFile()
+            server = subprocess.Popen(
+                [sys.executable, 'manage.py', *command],
+                cwd=settings.BASE_DIR,
+                env=os.environ.copy(),
+                stdout=subprocess.DEVNULL,
+                stderr=log,
+            )
+            try:
+                try:
+                    wait_for_port(host, port, server)
+                except RuntimeError as exc:
+                    log.seek(0)
+                    raise CommandError(
+                        f'{name} failed to start: {exc}\n'
+                        f'{log.read().decode()}'
+                    )
+                results[name] = run_load(
+                    host, port, options['path'],
+                    concurrency=options['concurrency'],
+                    duration=options['duration'],
+                )
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=60)
+                log.close()
+
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:>10}: {result["requests_per_second"]:8.1f} req/s, '
+                f'p50 {result["p50"] * 1000:.1f} ms, '
+                f'p99 {result["p99"] * 1000:.1f} ms, '
+                f'{result["errors"]} errors'
+            )
+        if len(results) == len(SERVERS):
+            ratio = (results['serve']['requests_per_second']
+                     / max(results['runserver']['requests_per_second'], 1))
+            self.stdout.write(self.style.SUCCESS(
+                f'serve handled {ratio:.1f}x the requests of runserver!'))
@@ -0,0 +1,17 @@
+"""
+Django command to delete expired idempotency keys.
+"""
+from django.core.management.base import BaseCommand
+
+from core.idempotency import clear_expired_keys
+
+
+class Command(BaseCommand):
+    """Django command to remove stored responses past their expiry."""
+    help = 'Delete idempotency keys whose stored response has expired.'
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        deleted = clear_expired_keys()
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} expired idempotency keys!'))
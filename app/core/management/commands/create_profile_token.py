@@ -0,0 +1,19 @@
+"""
+Django command to create a request profiling token.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.profiling import create_token
+
+
+class Command(BaseCommand):
+    """Django command to print a signed X-Profile header value."""
+    help = ('Print a token; requests sending it in the X-Profile header are '
+            'profiled while PROFILING_ENABLED is set.')
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        max_age = getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600)
+        self.stdout.write(create_token())
+        self.stderr.write(f'Valid for {max_age} seconds.')
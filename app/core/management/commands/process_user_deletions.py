@@ -0,0 +1,46 @@
+"""
+Django command to finish pending batched user deletions.
+"""
+from django.core.management.base import BaseCommand
+
+from core.deletion import get_unfinished_deletions, run_user_deletion
+
+
+class Command(BaseCommand):
+    """Django command to process pending user deletions."""
+    help = 'Delete deactivated users and their recipes in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Number of recipes deleted per transaction.',
+        )
+        parser.add_argument(
+            '--include-running', action='store_true',
+            help='Also resume deletions left running by a dead process.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        deletions = get_unfinished_deletions(
+            include_running=options['include_running'],
+        )
+        failed = 0
+        for deletion in deletions:
+            self.stdout.write(f'Processing {deletion}...')
+            try:
+                run_user_deletion(deletion, batch_size=options['batch_size'])
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f'Failed: {exc}')
+                continue
+            self.stdout.write(
+                f'Deleted {deletion.deleted_recipes} recipes '
+                f'for {deletion.email}.'
+            )
+        if failed:
+            msg = f'{failed} deletion(s) failed.'
+            self.stdout.write(self.style.WARNING(msg))
+        else:
+            msg = 'Pending deletions processed!'
+            self.stdout.write(self.style.SUCCESS(msg))
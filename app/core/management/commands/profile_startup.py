@@ -0,0 +1,56 @@
+"""
+Django command to profile the application's cold start.
+"""
+from django.core.management.base import BaseCommand
+
+from core.startup import group_imports, profile_startup
+
+
+class Command(BaseCommand):
+    """Django command to report import and app-ready times at startup."""
+    help = ('Load the application in a fresh interpreter and report where '
+            'its startup time goes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--settings-module', default=None,
+            help='Settings to profile, defaulting to the current ones.',
+        )
+        parser.add_argument(
+            '--entry-point', choices=['wsgi', 'asgi'], default='wsgi',
+            help='Application loader to profile.',
+        )
+        parser.add_argument(
+            '--top', type=int, default=20,
+            help='Number of packages and modules listed.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        profile = profile_startup(
+            options['settings_module'], options['entry_point'],
+        )
+        top = options['top']
+
+        self.stdout.write('Self import time by package:')
+        for package, seconds in group_imports(profile['imports'])[:top]:
+            self.stdout.write(f'  {seconds * 1000:8.1f} ms  {package}')
+
+        self.stdout.write('Slowest modules (cumulative):')
+        slowest = sorted(profile['imports'], key=lambda row: -row[2])
+        for module, own, cumulative in slowest[:top]:
+            self.stdout.write(
+                f'  {cumulative * 1000:8.1f} ms  {module} '
+                f'(self {own * 1000:.1f} ms)'
+            )
+
+        self.stdout.write('App ready():')
+        ready = sorted(profile['ready'].items(), key=lambda item: -item[1])
+        for label, seconds in ready:
+            self.stdout.write(f'  {seconds * 1000:8.1f} ms  {label}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {len(profile["modules"])} modules; setup took '
+            f'{profile["setup"] * 1000:.1f} ms, '
+            f'{profile["total"] * 1000:.1f} ms with URLs.'
+        ))
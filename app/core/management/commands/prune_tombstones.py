@@ -0,0 +1,26 @@
+"""
+Django command to delete old tombstones of deleted recipes.
+"""
+from django.core.management.base import BaseCommand
+
+from core.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    """Django command to prune the recipe change feed."""
+    help = (
+        'Delete tombstones older than SYNC_TOMBSTONE_TTL. Clients last '
+        'synced before them have to sync from scratch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttl', type=int, default=None,
+            help='Keep tombstones this many seconds instead.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        deleted = prune_tombstones(options['ttl'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} tombstones!'))
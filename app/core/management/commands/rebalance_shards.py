@@ -0,0 +1,71 @@
+"""
+Django command to move users' recipes between shards.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core import sharding
+
+
+class Command(BaseCommand):
+    """Django command to rebalance recipe shards."""
+    help = (
+        'Move one user to another shard with --user and --to, or move '
+        'users from the most to the least loaded shards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Id of a user to move.')
+        parser.add_argument('--to', help='Alias of the destination shard.')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of rows copied per query.',
+        )
+        parser.add_argument(
+            '--grace', type=float, default=None,
+            help='Seconds to keep old rows readable after switching shard.',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.1,
+            help='Acceptable load difference as a fraction of the largest.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only print the planned moves.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        if not sharding.is_sharding_enabled():
+            raise CommandError('Only one shard is configured.')
+
+        if options['user'] is not None or options['to']:
+            if options['user'] is None or not options['to']:
+                raise CommandError('--user and --to must be used together.')
+            source = sharding.get_directory_entry(options['user']).shard
+            moves = [(options['user'], source, options['to'])]
+        else:
+            moves = sharding.plan_rebalance(
+                sharding.get_shard_loads(),
+                tolerance=options['tolerance'],
+            )
+
+        if not moves:
+            self.stdout.write(self.style.SUCCESS('Shards are balanced.'))
+            return
+
+        for user_id, source, target in moves:
+            self.stdout.write(f'User {user_id}: {source} -> {target}')
+            if options['dry_run']:
+                continue
+            try:
+                copied = sharding.move_user(
+                    user_id,
+                    target,
+                    batch_size=options['batch_size'],
+                    grace=options['grace'],
+                )
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(f'Moved {copied} row(s).')
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Rebalance complete!'))
@@ -0,0 +1,111 @@
+"""
+Django command to run background jobs from the database queue.
+"""
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    """Django command to process queued jobs."""
+    help = 'Run background jobs from the database queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Number of worker threads.',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait when the queue is empty.',
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once the queue is empty instead of polling.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        jobs.autodiscover()
+        self.stop = threading.Event()
+        self.burst = options['burst']
+        self.poll_interval = options['poll_interval']
+        concurrency = max(1, options['concurrency'])
+        self.sweep_interval = getattr(settings, 'JOB_SWEEP_INTERVAL', 60)
+        self.sweep_lock = threading.Lock()
+        self.next_sweep = 0
+
+        previous = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                previous[signum] = signal.signal(signum, self.handle_signal)
+
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        self.stdout.write(f'Starting {concurrency} worker(s)...')
+        try:
+            if concurrency == 1:
+                self.work(f'{prefix}:0')
+            else:
+                self.work_in_threads(prefix, concurrency)
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS('Worker stopped.'))
+
+    def work_in_threads(self, prefix, concurrency):
+        """Run `concurrency` workers on their own threads."""
+        threads = [
+            threading.Thread(
+                target=self.work_in_thread,
+                args=(f'{prefix}:{n}',),
+                name=f'worker-{n}',
+            )
+            for n in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def handle_signal(self, signum, frame):
+        """Finish the running jobs, then stop."""
+        self.stop.set()
+
+    def work_in_thread(self, worker_id):
+        """Thread entry point, owning its own database connection."""
+        try:
+            self.work(worker_id)
+        finally:
+            connection.close()
+
+    def sweep(self):
+        """Requeue jobs of dead workers, once per sweep interval."""
+        with self.sweep_lock:
+            now = time.monotonic()
+            if now < self.next_sweep:
+                return
+            self.next_sweep = now + self.sweep_interval
+        requeued = jobs.requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale job(s).')
+
+    def work(self, worker_id):
+        """Process jobs until stopped, or until idle in burst mode."""
+        while not self.stop.is_set():
+            close_old_connections()
+            self.sweep()
+            job = jobs.work_once(worker_id)
+            if job is not None:
+                self.stdout.write(f'{worker_id} ran {job}')
+                continue
+            if self.burst:
+                break
+            self.stop.wait(self.poll_interval)
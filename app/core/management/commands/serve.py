@@ -0,0 +1,85 @@
+"""
+Django command to serve the application in production.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.serving import DjangoApplication, get_options, upgrade
+
+
+class Command(BaseCommand):
+    """Django command to run the preforking gunicorn server."""
+    help = ('Serve the application with preforked gunicorn workers, or '
+            'gracefully replace a running server with --upgrade.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--bind', default='127.0.0.1:8000',
+            help='Address to listen on.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Worker processes, defaulting to the number of CPUs.',
+        )
+        parser.add_argument(
+            '--threads', type=int, default=None,
+            help='Threads per worker; 1 runs synchronous workers.',
+        )
+        parser.add_argument(
+            '--max-requests', type=int, default=None,
+            help='Requests a worker serves before it is replaced.',
+        )
+        parser.add_argument(
+            '--max-requests-jitter', type=int, default=None,
+            help='Random extra requests, so workers restart at different '
+                 'times.',
+        )
+        parser.add_argument(
+            '--keepalive', type=int, default=None,
+            help='Seconds to hold an idle keep-alive connection open.',
+        )
+        parser.add_argument(
+            '--timeout', type=int, default=None,
+            help='Seconds before a silent worker is killed and replaced.',
+        )
+        parser.add_argument(
+            '--graceful-timeout', type=int, default=None,
+            help='Seconds workers get to finish requests when stopping.',
+        )
+        parser.add_argument(
+            '--pidfile', default=None,
+            help='File holding the master pid, needed by --upgrade.',
+        )
+        parser.add_argument(
+            '--no-preload', action='store_false', dest='preload',
+            help='Load the application in each worker instead of once.',
+        )
+        parser.add_argument(
+            '--upgrade', action='store_true',
+            help='Replace the server in --pidfile with freshly loaded code.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        if options['upgrade']:
+            if not options['pidfile']:
+                raise CommandError('--upgrade needs --pidfile.')
+            try:
+                pid = upgrade(options['pidfile'])
+            except (OSError, TimeoutError) as exc:
+                raise CommandError(f'Upgrade failed: {exc}')
+            self.stdout.write(self.style.SUCCESS(
+                f'Server upgraded, new master is {pid}.'))
+            return
+
+        DjangoApplication(get_options(
+            bind=options['bind'],
+            workers=options['workers'],
+            threads=options['threads'],
+            max_requests=options['max_requests'],
+            max_requests_jitter=options['max_requests_jitter'],
+            keepalive=options['keepalive'],
+            timeout=options['timeout'],
+            graceful_timeout=options['graceful_timeout'],
+            pidfile=options['pidfile'],
+            preload=options['preload'],
+        )).run()
@@ -0,0 +1,119 @@
+"""
+Middleware for the core app.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.http import JsonResponse
+
+from core import loadshedding, profiling
+from core.routers import get_replicas, replica_reads
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def is_shared_cache(cache):
+    """Return whether every process sees the same entries in `cache`."""
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+class ReplicaStickinessMiddleware:
+    """Serve safe requests from replicas unless the client just wrote.
+
+    A client's next request may reach any worker process, so the pins are
+    kept in the REPLICA_PIN_CACHE cache, which must be shared.
+    """
+
+    def __init__(self, get_response):
+        if not get_replicas():
+            raise MiddlewareNotUsed
+        alias = getattr(settings, 'REPLICA_PIN_CACHE', 'default')
+        self.cache = caches[alias]
+        if not is_shared_cache(self.cache):
+            raise ImproperlyConfigured(
+                f'Read replicas need a shared cache for client pins; the '
+                f'{alias!r} cache is local to each process.'
+            )
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = self.get_pin_key(request)
+        safe = request.method in SAFE_METHODS
+        use_replica = safe and not (key and self.cache.get(key))
+        with replica_reads(use_replica):
+            response = self.get_response(request)
+        if not safe and key:
+            self.cache.set(
+                key, True, getattr(settings, 'REPLICA_PIN_SECONDS', 5),
+            )
+        return response
+
+    def get_pin_key(self, request):
+        """Return the cache key identifying this client, or None."""
+        # Not the address: clients behind one proxy would share a pin.
+        identity = (
+            request.META.get('HTTP_AUTHORIZATION')
+            or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        )
+        if not identity:
+            return None
+        digest = hashlib.sha256(identity.encode()).hexdigest()[:32]
+        return f'replica-pin:{digest}'
+
+
+class ProfilingMiddleware:
+    """Profile requests selected by a signed header or by sampling."""
+
+    def __init__(self, get_response):
+        if not profiling.is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling.should_profile(request):
+            return self.get_response(request)
+        return profiling.profile_request(request, self.get_response)
+
+
+class LoadSheddingMiddleware:
+    """Limit concurrent requests adaptively and reject the excess early."""
+
+    def __init__(self, get_response):
+        if not loadshedding.is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        priority = loadshedding.get_priority(request.path_info)
+        if priority == loadshedding.CRITICAL:
+            return self.get_response(request)
+        limiter = loadshedding.get_limiter()
+        delay = loadshedding.get_upstream_delay(request)
+        max_delay = getattr(settings, 'LOAD_SHEDDING_MAX_QUEUE_DELAY', 5.0)
+        if delay is not None and delay > max_delay:
+            # The client has most likely given up on this request already.
+            limiter.record_shed()
+            return self.reject()
+        timeout = getattr(settings, 'LOAD_SHEDDING_QUEUE_TIMEOUT', 0.05)
+        if not limiter.acquire(priority, timeout):
+            return self.reject()
+        start = time.monotonic()
+        try:
+            return self.get_response(request)
+        finally:
+            limiter.release(time.monotonic() - start)
+
+    def reject(self):
+        """Return the response for a request that was shed."""
+        retry_after = getattr(settings, 'LOAD_SHEDDING_RETRY_AFTER', 1)
+        response = JsonResponse(
+            {'detail': 'The server is overloaded, please retry shortly.'},
+            status=503,
+        )
+        response['Retry-After'] = str(retry_after)
+        return response
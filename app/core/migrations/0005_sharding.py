@@ -0,0 +1,48 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def assign_existing_users(apps, schema_editor):
+    """Record that every existing user's recipes are on `default`."""
+    User = apps.get_model('core', 'User')
+    UserShard = apps.get_model('core', 'UserShard')
+    alias = schema_editor.connection.alias
+    user_ids = User.objects.using(alias).values_list('id', flat=True)
+    UserShard.objects.using(alias).bulk_create(
+        [UserShard(user_id=user_id, shard='default') for user_id in user_ids],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserShard',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='core.user')),
+                ('shard', models.CharField(max_length=100)),
+                ('locked', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(assign_existing_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:47
+
+import core.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def move_descriptions_out(apps, schema_editor):
+    """Copy every non-empty description into the side table."""
+    Recipe = apps.get_model('core', 'Recipe')
+    RecipeDescription = apps.get_model('core', 'RecipeDescription')
+    alias = schema_editor.connection.alias
+    recipes = (
+        Recipe.objects.using(alias)
+        .exclude(description='')
+        .order_by('id')
+        .values_list('id', 'description')
+    )
+    last_id = 0
+    while True:
+        batch = list(recipes.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            return
+        last_id = batch[-1][0]
+        RecipeDescription.objects.using(alias).bulk_create([
+            RecipeDescription(recipe_id=recipe_id, text=text)
+            for recipe_id, text in batch
+        ])
+
+
+def move_descriptions_back(apps, schema_editor):
+    """Copy descriptions from the side table back onto the recipes."""
+    Recipe = apps.get_model('core', 'Recipe')
+    RecipeDescription = apps.get_model('core', 'RecipeDescription')
+    alias = schema_editor.connection.alias
+    rows = RecipeDescription.objects.using(alias).order_by('recipe_id')
+    last_id = 0
+    while True:
+        batch = list(rows.filter(recipe_id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            return
+        last_id = batch[-1].recipe_id
+        Recipe.objects.using(alias).bulk_update(
+            [Recipe(id=row.recipe_id, description=row.text) for row in batch],
+            ['description'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_recipe_change_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeDescription',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='description_row', serialize=False, to='core.recipe')),
+                ('text', core.models.CompressedTextField()),
+            ],
+        ),
+        migrations.RunPython(move_descriptions_out, move_descriptions_back),
+        migrations.RemoveField(
+            model_name='recipe',
+            name='description',
+        ),
+    ]
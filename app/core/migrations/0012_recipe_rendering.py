@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-19 11:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_tags_ingredients'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeRendering',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rendering', serialize=False, to='core.recipe')),
+                ('change_seq', models.BigIntegerField()),
+                ('version', models.PositiveIntegerField()),
+                ('summary', models.TextField()),
+                ('detail', models.TextField()),
+            ],
+        ),
+    ]
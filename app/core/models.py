@@ -1,10 +1,12 @@
 """
 Database models for the core app.
 """
-
+import zlib
 
 from django.conf import settings
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, models, router, transaction
+from django.dispatch import Signal
+from django.utils import timezone
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -50,17 +52,515 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
 
 
+# Sent by ShardedQuerySet.update() with the (pk, user_id) pairs it changed,
+# the names of the fields it set and the database alias, since
+# QuerySet.update() sends no per-object signals.
+recipes_bulk_updated = Signal()
+
+
+def has_change_seq(model):
+    """Return whether `model` records a change sequence for client sync."""
+    return any(
+        field.name == 'change_seq' for field in model._meta.concrete_fields
+    )
+
+
+class ShardedQuerySet(models.QuerySet):
+    """QuerySet for models stored on their owning user's shard."""
+
+    def for_user(self, user):
+        """Return the objects owned by `user`, read from their shard."""
+        from core.sharding import shard_for_user
+        user_id = getattr(user, 'pk', user)
+        queryset = self.filter(user_id=user_id)
+        alias = shard_for_user(user_id)
+        if alias != DEFAULT_DB_ALIAS:
+            queryset = queryset.using(alias)
+        return queryset
+
+    def update(self, **kwargs):
+        """Update matching rows and announce which ones changed."""
+        if not has_change_seq(self.model):
+            pairs = list(self.values_list('pk', 'user_id'))
+            rows = super().update(**kwargs)
+        else:
+            from core.sync import next_change_seq
+            with transaction.atomic(using=self.db):
+                pairs = list(self.values_list('pk', 'user_id'))
+                by_user = {}
+                for pk, user_id in pairs:
+                    by_user.setdefault(user_id, []).append(pk)
+                rows = 0
+                # Counters are locked in user order so that concurrent
+                # bulk updates cannot deadlock on them.
+                for user_id in sorted(by_user):
+                    seq = next_change_seq(user_id, self.db)
+                    changed = self.filter(pk__in=by_user[user_id])
+                    rows += super(ShardedQuerySet, changed).update(
+                        change_seq=seq, **kwargs,
+                    )
+        if pairs:
+            recipes_bulk_updated.send(
+                sender=self.model, pairs=pairs, fields=set(kwargs),
+                using=self.db,
+            )
+        return rows
+
+    def delete(self):
+        """Delete matching rows, leaving tombstones for client sync."""
+        if not has_change_seq(self.model):
+            return super().delete()
+        from core.sync import bury
+        using = self.db
+        with transaction.atomic(using=using):
+            bury(self.values_list('pk', 'user_id'), using)
+            return super().delete()
+
+    def create(self, **kwargs):
+        """Create an object, on its owner's shard unless `using` was set."""
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
+class NamedQuerySet(ShardedQuerySet):
+    """QuerySet for objects a user refers to by a unique name."""
+
+    def get_or_create_named(self, user, names):
+        """Return {name: object} for `names`, creating missing ones in bulk.
+
+        Takes a fixed number of queries however many names are given.
+        Objects created concurrently by another request are reused.
+        """
+        from core.sharding import assign_sharded_pk, shard_for_user
+        user_id = getattr(user, 'pk', user)
+        queryset = self.using(shard_for_user(user_id, for_write=True))
+        queryset = queryset.filter(user_id=user_id)
+        found = {obj.name: obj for obj in queryset.filter(name__in=names)}
+        missing = [name for name in dict.fromkeys(names) if name not in found]
+        if missing:
+            objs = [self.model(user_id=user_id, name=name) for name in missing]
+            for obj in objs:
+                # bulk_create skips pre_save, which hands out sharded pks.
+                assign_sharded_pk(self.model, obj, raw=False)
+            queryset.bulk_create(objs, ignore_conflicts=True)
+            found.update(
+                (obj.name, obj) for obj in queryset.filter(name__in=missing)
+            )
+        return found
+
+
+class CompressedTextField(models.BinaryField):
+    """Text stored zlib-compressed in a binary column."""
+    # A 4 KiB window and small hash table need ~30 KiB of buffers per value
+    # instead of zlib's default ~260 KiB, for little loss on short texts.
+    WBITS = 12
+    MEM_LEVEL = 5
+
+    def compress(self, text):
+        compressor = zlib.compressobj(
+            wbits=self.WBITS, memLevel=self.MEM_LEVEL,
+        )
+        return compressor.compress(text.encode()) + compressor.flush()
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return zlib.decompress(value).decode()
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if isinstance(value, str):
+            value = self.compress(value)
+        return super().get_db_prep_value(value, connection, prepared)
+
+    def to_python(self, value):
+        return value
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+
+class Tag(models.Model):
+    """Tag for filtering recipes."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    name = models.CharField(max_length=255)
+
+    objects = NamedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'], name='unique_tag_name',
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class Ingredient(models.Model):
+    """Ingredient for recipes."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    name = models.CharField(max_length=255)
+
+    objects = NamedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'], name='unique_ingredient_name',
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
 class Recipe(models.Model):
     """Recipe object."""
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        # Recipes may live on a different shard to the users table.
+        db_constraint=False,
     )
     title = models.CharField(max_length=255)
-    description = models.TextField(blank=True)
     time_minutes = models.IntegerField()
     price = models.DecimalField(max_digits=5, decimal_places=2)
     link = models.CharField(max_length=255, blank=True)
+    # Stored under its content hash by recipe/images.py, which also fills
+    # in {size: name} of the thumbnails in the background.
+    image = models.ImageField(
+        null=True, blank=True, upload_to='recipes', max_length=255,
+    )
+    thumbnails = models.JSONField(default=dict, blank=True)
+    tags = models.ManyToManyField(Tag, blank=True, related_name='recipes')
+    ingredients = models.ManyToManyField(
+        Ingredient, blank=True, related_name='recipes',
+    )
+    # Position of the latest change in the owner's change feed, see
+    # core/sync.py. Set on every save and bulk update.
+    change_seq = models.BigIntegerField(default=0, editable=False)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'change_seq', 'id'])]
 
     def __str__(self):
         return self.title
+
+    @property
+    def description(self):
+        """The recipe's description, loaded from its side table on use."""
+        if '_description' not in self.__dict__:
+            try:
+                self._description = self.description_row.text
+            except RecipeDescription.DoesNotExist:
+                self._description = ''
+        return self._description
+
+    @description.setter
+    def description(self, value):
+        self._description = value
+        self._description_changed = True
+
+    def refresh_from_db(self, using=None, fields=None):
+        """Reload the recipe, dropping any description read or set."""
+        if fields is None or 'description' in fields:
+            self.__dict__.pop('_description', None)
+            self._description_changed = False
+            if fields is not None:
+                fields = [name for name in fields if name != 'description']
+                if not fields:
+                    return
+        super().refresh_from_db(using=using, fields=fields)
+
+    def save(self, *args, **kwargs):
+        """Save the recipe as the next change in its owner's feed."""
+        from core.sync import next_change_seq
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self,
+        )
+        write_description = getattr(self, '_description_changed', False)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            write_description &= 'description' in update_fields
+            update_fields.discard('description')
+            kwargs['update_fields'] = update_fields | {'change_seq'}
+        adding = self._state.adding
+        with transaction.atomic(using=using):
+            self.change_seq = next_change_seq(self.user_id, using)
+            super().save(*args, **kwargs)
+            if write_description:
+                self._save_description(using, adding)
+
+    def _save_description(self, using, adding):
+        """Write the description to the side table."""
+        rows = RecipeDescription.objects.using(using)
+        self._description_changed = False
+        # A cached row would now hold the old text.
+        self._state.fields_cache.pop('description_row', None)
+        if not adding and rows.filter(recipe_id=self.pk).update(
+            text=self._description,
+        ):
+            return
+        if self._description:
+            rows.create(recipe=self, text=self._description)
+
+    def delete(self, using=None, keep_parents=False):
+        """Delete the recipe, leaving a tombstone for client sync."""
+        from core.sync import bury
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            bury([(self.pk, self.user_id)], using)
+            return super().delete(using=using, keep_parents=keep_parents)
+
+
+class RecipeDescription(models.Model):
+    """Compressed description of a recipe, kept out of the recipe row.
+
+    Lists and scans of recipes never need the description, so it lives
+    here rather than widening every row of the recipe table.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='description_row',
+    )
+    text = CompressedTextField()
+
+    def __str__(self):
+        return f'Description of {self.recipe_id}'
+
+
+class RecipeRendering(models.Model):
+    """A recipe's API representations, rendered to JSON ahead of reads.
+
+    The rendering is current while its `change_seq` and `version` match
+    the recipe's and recipe/rendering.py's; see that module.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='rendering',
+    )
+    change_seq = models.BigIntegerField()
+    version = models.PositiveIntegerField()
+    summary = models.TextField()
+    detail = models.TextField()
+
+    def __str__(self):
+        return f'Rendering of {self.recipe_id}'
+
+
+class RecipeTombstone(models.Model):
+    """Record of a deleted recipe, so syncing clients can drop it."""
+    recipe_id = models.BigIntegerField()
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    change_seq = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'change_seq', 'recipe_id'])]
+
+    def __str__(self):
+        return f'Tombstone of {self.recipe_id}'
+
+
+class RecipeChangeCounter(models.Model):
+    """Last change sequence handed out for a user's recipes."""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        db_constraint=False,
+    )
+    last_seq = models.BigIntegerField(default=0)
+    # Tombstones up to this sequence have been pruned, so clients synced
+    # before it must start over.
+    pruned_seq = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.last_seq}'
+
+
+class RecipeSignature(models.Model):
+    """MinHash signature of a recipe's text, used to find duplicates."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='signature',
+    )
+    minhash = models.BinaryField()
+
+    def __str__(self):
+        return f'Signature of {self.recipe_id}'
+
+
+class RecipeLSHBucket(models.Model):
+    """One LSH band of a recipe's signature, for sub-linear lookups."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='lsh_buckets',
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'band', 'bucket'])]
+
+    def __str__(self):
+        return f'{self.recipe_id} band {self.band}'
+
+
+class UserDeletion(models.Model):
+    """Progress of a user's batched background deletion."""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    email = models.EmailField(max_length=255)
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+    )
+    total_recipes = models.PositiveIntegerField(default=0)
+    deleted_recipes = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status'])]
+
+    def __str__(self):
+        return f'Deletion of {self.email} ({self.status})'
+
+
+class Job(models.Model):
+    """Unit of background work picked up by `manage.py run_worker`."""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=STATUS_QUEUED,
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_at'])]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({self.status})'
+
+
+class UserShard(models.Model):
+    """Directory entry recording which shard holds a user's recipes."""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    shard = models.CharField(max_length=100)
+    locked = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f'{self.user_id} on {self.shard}'
+
+
+class IdSequence(models.Model):
+    """Next free primary key for a sharded model, shared by all shards."""
+    name = models.CharField(max_length=100, primary_key=True)
+    next_value = models.BigIntegerField()
+
+    def __str__(self):
+        return f'{self.name}: {self.next_value}'
+
+
+class IdempotencyKey(models.Model):
+    """Stored response of a request made with an `Idempotency-Key`."""
+    scope = models.CharField(max_length=100)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.BinaryField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['scope', 'key'],
+                name='unique_idempotency_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.scope} {self.key}'
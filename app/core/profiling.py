@@ -0,0 +1,210 @@
+"""
+On-demand request profiling.
+
+With PROFILING_ENABLED set, ProfilingMiddleware profiles requests carrying
+a valid signed `X-Profile` header, from `manage.py create_profile_token`,
+plus a random PROFILING_SAMPLE_RATE share of all requests. Each selected
+request runs under cProfile while a background thread samples its stack
+every PROFILING_SAMPLE_INTERVAL seconds. The results are stored as a pstats
+file and as collapsed stacks, the input format of flamegraph.pl and
+speedscope, for download from /api/profiling/profiles/. They are kept in
+PROFILING_DIR, a private directory rather than the public media storage,
+so that only admins can read them through the API. With profiling disabled
+the middleware is removed from the stack and costs nothing.
+"""
+import cProfile
+import json
+import marshal
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+
+HEADER = 'HTTP_X_PROFILE'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+TOKEN_SALT = 'core.profiling'
+TOKEN_VALUE = 'profile'
+PROFILE_ID_RE = re.compile(r'^\d{8}T\d{12}-[0-9a-f]{8}$')
+
+
+def is_enabled():
+    return getattr(settings, 'PROFILING_ENABLED', False)
+
+
+def get_sample_rate():
+    return getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+
+
+def get_sample_interval():
+    return getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.005)
+
+
+def get_storage():
+    """Return the private storage profiles are kept in."""
+    location = getattr(
+        settings, 'PROFILING_DIR', settings.BASE_DIR / 'var' / 'profiles',
+    )
+    # No base_url: profiles are only downloaded through the API.
+    return FileSystemStorage(location=location, base_url=None)
+
+
+def create_token():
+    """Return a signed value for the `X-Profile` header."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(TOKEN_VALUE)
+
+
+def is_valid_token(token):
+    """Return whether `token` is a signed, unexpired profiling token."""
+    max_age = getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600)
+    try:
+        value = signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            token, max_age=max_age,
+        )
+    except signing.BadSignature:
+        return False
+    return value == TOKEN_VALUE
+
+
+def should_profile(request):
+    """Return whether to profile this request."""
+    token = request.META.get(HEADER)
+    if token:
+        return is_valid_token(token)
+    rate = get_sample_rate()
+    return rate > 0 and random.random() < rate
+
+
+class StackSampler:
+    """Count the stacks of one thread, sampled from a background thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f'{code.co_name} ({code.co_filename}:'
+                    f'{code.co_firstlineno})'.replace(';', ':')
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Return the samples in collapsed stack format."""
+        return ''.join(
+            f'{stack} {count}\n' for stack, count in self.stacks.items()
+        )
+
+
+def profile_request(request, get_response):
+    """Return the response to `request`, storing a profile of it."""
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident(), get_sample_interval())
+    started = time.perf_counter()
+    sampler.start()
+    profiler.enable()
+    try:
+        response = get_response(request)
+    finally:
+        profiler.disable()
+        sampler.stop()
+    duration = time.perf_counter() - started
+
+    profile_id = (
+        f'{timezone.now():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}'
+    )
+    save_profile(profile_id, profiler, sampler, {
+        'id': profile_id,
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'duration': duration,
+        'samples': sum(sampler.stacks.values()),
+        'created_at': timezone.now().isoformat(),
+    })
+    response[PROFILE_ID_HEADER] = profile_id
+    return response
+
+
+def get_path(profile_id, extension):
+    return f'{profile_id}.{extension}'
+
+
+def save_profile(profile_id, profiler, sampler, metadata):
+    """Store a profile's stats, collapsed stacks and metadata."""
+    storage = get_storage()
+    stats = pstats.Stats(profiler)
+    storage.save(
+        get_path(profile_id, 'prof'),
+        ContentFile(marshal.dumps(stats.stats)),
+    )
+    storage.save(
+        get_path(profile_id, 'folded'),
+        ContentFile(sampler.collapsed().encode()),
+    )
+    storage.save(
+        get_path(profile_id, 'json'),
+        ContentFile(json.dumps(metadata).encode()),
+    )
+    prune_profiles()
+
+
+def list_profile_ids():
+    """Return the ids of stored profiles, newest first.
+
+    Ids start with the time they were taken, so they sort by age without
+    reading the files.
+    """
+    try:
+        _, files = get_storage().listdir('')
+    except FileNotFoundError:
+        return []
+    return sorted(
+        (name[:-len('.json')] for name in files if name.endswith('.json')),
+        reverse=True,
+    )
+
+
+def list_profiles():
+    """Return the metadata of stored profiles, newest first."""
+    storage = get_storage()
+    profiles = []
+    for profile_id in list_profile_ids():
+        with storage.open(get_path(profile_id, 'json')) as handle:
+            profiles.append(json.load(handle))
+    return profiles
+
+
+def prune_profiles():
+    """Delete the oldest profiles beyond PROFILING_MAX_PROFILES."""
+    storage = get_storage()
+    keep = getattr(settings, 'PROFILING_MAX_PROFILES', 100)
+    for profile_id in list_profile_ids()[keep:]:
+        for extension in ['prof', 'folded', 'json']:
+            storage.delete(get_path(profile_id, extension))
@@ -0,0 +1,119 @@
+"""
+Database routers.
+
+Reads made while serving a safe (GET/HEAD/OPTIONS) request are sent to a
+read replica; everything else uses the primary. A client that has just
+written is pinned to the primary for a short window so it always reads
+its own writes, and replicas that lag too far behind are skipped.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_health = {}
+
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+"""
+
+
+def get_replicas():
+    """Return the aliases of the configured read replicas."""
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def get_pool():
+    """Return the aliases of the primary and its replicas."""
+    return {DEFAULT_DB_ALIAS, *get_replicas()}
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Allow reads inside the block to be served by a replica."""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def get_replica_lag(alias):
+    """Return the replication lag of `alias` in seconds, or None if down."""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(REPLICA_LAG_SQL)
+            return float(cursor.fetchone()[0])
+    except DatabaseError:
+        return None
+
+
+def replica_is_healthy(alias):
+    """Return whether `alias` is reachable and within the allowed lag."""
+    interval = getattr(settings, 'REPLICA_HEALTH_CHECK_INTERVAL', 5)
+    now = time.monotonic()
+    checked_at, healthy = _health.get(alias, (None, False))
+    if checked_at is None or now - checked_at >= interval:
+        lag = get_replica_lag(alias)
+        max_lag = getattr(settings, 'REPLICA_MAX_LAG', 2)
+        healthy = lag is not None and lag <= max_lag
+        _health[alias] = (now, healthy)
+    return healthy
+
+
+def reset_replica_health():
+    """Forget cached replica health checks."""
+    _health.clear()
+
+
+def choose_replica():
+    """Return a healthy replica alias, or None to fall back to primary."""
+    replicas = [alias for alias in get_replicas() if replica_is_healthy(alias)]
+    if not replicas:
+        return None
+    return random.choice(replicas)
+
+
+class ReplicaRouter:
+    """Send safe reads to read replicas and everything else to primary."""
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in get_pool():
+            return instance._state.db
+        if not _replica_reads.get():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return choose_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            if instance._state.db not in get_pool():
+                return instance._state.db
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = get_pool()
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            return False
+        return None
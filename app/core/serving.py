@@ -0,0 +1,226 @@
+"""
+Production HTTP serving with gunicorn.
+
+`manage.py serve` runs a gunicorn master that loads the application once
+and forks a pool of worker processes sized to the CPU count. Loading before
+the fork lets the workers share the imported code copy-on-write; the master
+also freezes the garbage collector's view of those objects so the first
+collection in each worker does not touch, and copy, every shared page.
+Workers are recycled after SERVE_MAX_REQUESTS requests, with jitter so they
+do not all restart at once.
+
+Code is reloaded without dropping requests by `serve --upgrade`: it sends
+USR2 to the running master, which starts a new master and workers on the
+same listening socket, then gracefully stops the old master once the new
+one is up. Requests arriving meanwhile wait in the socket backlog.
+"""
+import gc
+import http.client
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.urls import get_resolver
+from gunicorn.app.base import BaseApplication
+
+from core import loadshedding
+
+
+def get_default_workers():
+    return getattr(settings, 'SERVE_WORKERS', None) or os.cpu_count() or 1
+
+
+def get_options(bind='127.0.0.1:8000', workers=None, threads=None,
+                max_requests=None, max_requests_jitter=None,
+                keepalive=None, timeout=None, graceful_timeout=None,
+                pidfile=None, preload=True):
+    """Return gunicorn settings, filling gaps from the Django settings."""
+    def setting(value, name, default):
+        if value is not None:
+            return value
+        return getattr(settings, name, default)
+
+    threads = setting(threads, 'SERVE_THREADS', 4)
+    return {
+        'bind': [bind],
+        'workers': workers or get_default_workers(),
+        # Threaded workers keep idle keep-alive connections open without
+        # tying up a process; sync workers close every connection.
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        'threads': threads,
+        'max_requests': setting(max_requests, 'SERVE_MAX_REQUESTS', 1000),
+        'max_requests_jitter': setting(
+            max_requests_jitter, 'SERVE_MAX_REQUESTS_JITTER', 100,
+        ),
+        'keepalive': setting(keepalive, 'SERVE_KEEPALIVE', 5),
+        'timeout': setting(timeout, 'SERVE_TIMEOUT', 30),
+        'graceful_timeout': setting(
+            graceful_timeout, 'SERVE_GRACEFUL_TIMEOUT', 30,
+        ),
+        'pidfile': pidfile,
+        'preload_app': preload,
+        'accesslog': '-',
+        'when_ready': when_ready,
+        'pre_fork': pre_fork,
+        'post_fork': post_fork,
+    }
+
+
+def when_ready(server):
+    """Move the preloaded objects out of the collector's reach."""
+    gc.collect()
+    gc.freeze()
+
+
+def pre_fork(server, worker):
+    """Close the master's database connections before forking."""
+    # A connection shared with a child would be closed under the master.
+    connections.close_all()
+
+
+def post_fork(server, worker):
+    """Size the worker's load shedding limit to its threads."""
+    threads = server.cfg.threads
+    if server.cfg.worker_class_str != 'gthread':
+        threads = 1
+    loadshedding.set_worker_threads(threads)
+
+
+class DjangoApplication(BaseApplication):
+    """Gunicorn application serving the Django WSGI handler."""
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        application = get_wsgi_application()
+        # Import the URLconf and views now rather than on the first request,
+        # so preforked workers share them.
+        get_resolver().url_patterns
+        return application
+
+
+def read_pid(pidfile):
+    """Return the pid written to `pidfile`, or None."""
+    try:
+        with open(pidfile) as handle:
+            return int(handle.read().strip() or 0) or None
+    except FileNotFoundError:
+        return None
+
+
+def upgrade(pidfile, timeout=30, poll_interval=0.1):
+    """
+    Replace a running server with a freshly loaded one, dropping nothing.
+
+    Return the new master's pid. Raise TimeoutError if the new master does
+    not start within `timeout` seconds; the old one keeps serving then.
+    """
+    old_pid = read_pid(pidfile)
+    if old_pid is None:
+        raise FileNotFoundError(f'No server pid in {pidfile}.')
+    os.kill(old_pid, signal.SIGUSR2)
+    # The new master writes `<pidfile>.2` once its application is loaded,
+    # and renames it to `pidfile` when the old master has gone.
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        new_pid = read_pid(f'{pidfile}.2')
+        if new_pid and new_pid != old_pid:
+            break
+        time.sleep(poll_interval)
+    else:
+        raise TimeoutError('The new server did not start in time.')
+    # TERM is gunicorn's graceful stop: the old workers finish their
+    # in-flight requests before exiting. QUIT would cut them off.
+    os.kill(old_pid, signal.SIGTERM)
+    return new_pid
+
+
+def wait_for_port(host, port, process=None, timeout=30, poll_interval=0.1):
+    """Wait until the server `process` accepts connections on host:port."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(
+                f'The server exited with status {process.returncode}.')
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(poll_interval)
+    raise TimeoutError(f'Nothing is listening on {host}:{port}.')
+
+
+def run_load(host, port, path, concurrency=8, duration=5.0, keepalive=True):
+    """
+    Request `path` from `concurrency` clients for `duration`.
+
+    Return the requests per second, the error count and the median and
+    99th percentile latency in seconds. Every failed request is an error.
+    A keep-alive client may also see the server close an idle connection
+    just as it reuses it, as when workers restart; pass keepalive=False
+    when any failure must mean a dropped request.
+    """
+    headers = {} if keepalive else {'Connection': 'close'}
+    deadline = time.monotonic() + duration
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def client():
+        connection = http.client.HTTPConnection(host, port, timeout=10)
+        own = []
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 500:
+                    raise http.client.HTTPException(response.status)
+                if response.will_close:
+                    connection.close()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                with lock:
+                    errors[0] += 1
+                continue
+            own.append(time.perf_counter() - start)
+        connection.close()
+        with lock:
+            latencies.extend(own)
+
+    started = time.monotonic()
+    threads = [
+        threading.Thread(target=client) for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+
+    def percentile(fraction):
+        if not latencies:
+            return 0.0
+        return latencies[min(int(len(latencies) * fraction),
+                             len(latencies) - 1)]
+
+    return {
+        'requests_per_second': len(latencies) / elapsed,
+        'errors': errors[0],
+        'p50': percentile(0.5),
+        'p99': percentile(0.99),
+    }
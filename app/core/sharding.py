@@ -0,0 +1,400 @@
+"""
+User-keyed sharding of recipe data.
+
+Every recipe belongs to exactly one user, so all of a user's recipes live
+together on one of the databases listed in `RECIPE_SHARDS`. The
+`UserShard` directory on the primary records where each user lives, which
+lets users be moved between shards without rehashing everyone else.
+With a single shard (the default) none of this does any work.
+
+Primary keys of sharded models are handed out in blocks from `IdSequence`
+on the primary, so they stay unique across shards and survive moves.
+
+A move locks the user in the directory, then waits for in-flight writes
+before copying. Writes lock the user's `RecipeChangeCounter` row on the
+shard for the rest of their transaction and check the directory again
+once they hold it (see `check_writable`), so a write routed before the
+lock either commits before the copy or fails.
+"""
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Count, Max
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from core.models import IdSequence, UserShard
+
+# Models stored on their owner's shard, parents before children.
+SHARDED_MODELS = [
+    'core.tag',
+    'core.ingredient',
+    'core.recipe',
+    'core.recipedescription',
+    'core.reciperendering',
+    'core.recipesignature',
+    'core.recipelshbucket',
+    'core.recipetombstone',
+    'core.recipechangecounter',
+]
+# Sharded models whose primary keys nothing refers to. They keep per-shard
+# ids, and get new ones when a user is moved.
+UNREFERENCED_PK_MODELS = {'core.recipelshbucket', 'core.recipetombstone'}
+
+_blocks = {}
+_blocks_lock = threading.Lock()
+
+
+class UserShardLocked(APIException):
+    """Raised when writing for a user whose data is being moved."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Your recipes are being moved, please retry shortly.'
+    default_code = 'shard_locked'
+
+
+def get_shards():
+    """Return the aliases of the databases holding recipe data."""
+    return getattr(settings, 'RECIPE_SHARDS', [DEFAULT_DB_ALIAS])
+
+
+def is_sharding_enabled():
+    """Return whether recipe data is spread over several databases."""
+    return len(get_shards()) > 1
+
+
+def get_cache_timeout():
+    """Return how long a user's shard may be cached for."""
+    return getattr(settings, 'SHARD_DIRECTORY_CACHE_TIMEOUT', 60)
+
+
+def is_sharded_model(model):
+    """Return whether `model` is stored on its owner's shard."""
+    opts = model._meta
+    if opts.auto_created:
+        return is_sharded_model(opts.auto_created)
+    return opts.label_lower in SHARDED_MODELS
+
+
+def get_sharded_models():
+    """Return the sharded models, including many-to-many tables."""
+    from django.apps import apps
+    models = []
+    for label in SHARDED_MODELS:
+        model = apps.get_model(label)
+        models.append(model)
+        for field in model._meta.local_many_to_many:
+            models.append(field.remote_field.through)
+    return models
+
+
+def get_owner_lookup(model):
+    """Return the lookup filtering `model` rows by owning user id."""
+    opts = model._meta
+    if any(field.name == 'user' for field in opts.fields):
+        return 'user_id'
+    for field in opts.fields:
+        if field.many_to_one or field.one_to_one:
+            if is_sharded_model(field.related_model):
+                return f'{field.name}__user_id'
+    raise ValueError(f'Cannot find the owner of {opts.label}')
+
+
+def keeps_pk(model):
+    """Return whether moved rows of `model` keep their primary key."""
+    opts = model._meta
+    return not (
+        opts.auto_created or opts.label_lower in UNREFERENCED_PK_MODELS
+    )
+
+
+def place_user(user_id):
+    """Return the shard a new user's recipes are stored on."""
+    shards = get_shards()
+    return shards[zlib.crc32(str(user_id).encode()) % len(shards)]
+
+
+def get_directory_entry(user_id):
+    """Return the user's directory entry from the primary."""
+    # Users without an entry predate sharding, so their data is on default.
+    entry, _ = UserShard.objects.using(DEFAULT_DB_ALIAS).get_or_create(
+        user_id=user_id,
+        defaults={'shard': DEFAULT_DB_ALIAS},
+    )
+    return entry
+
+
+def shard_for_user(user_id, for_write=False):
+    """Return the alias of the shard holding the user's recipes."""
+    if not is_sharding_enabled():
+        return DEFAULT_DB_ALIAS
+    if for_write:
+        entry = get_directory_entry(user_id)
+        if entry.locked:
+            raise UserShardLocked()
+        return entry.shard
+    key = f'user-shard:{user_id}'
+    alias = cache.get(key)
+    if alias is None:
+        alias = get_directory_entry(user_id).shard
+        cache.set(key, alias, get_cache_timeout())
+    return alias
+
+
+def check_writable(user_id, using):
+    """
+    Raise UserShardLocked unless the user's data may be written to `using`.
+
+    Called by writers holding the user's change counter lock, inside their
+    transaction: routing happened earlier and may be out of date.
+    """
+    if not is_sharding_enabled():
+        return
+    entry = get_directory_entry(user_id)
+    if entry.locked or entry.shard != using:
+        raise UserShardLocked()
+
+
+def _wait_for_writers(user_id, alias):
+    """Wait for transactions holding the user's change counter on `alias`."""
+    from core.models import RecipeChangeCounter
+    with transaction.atomic(using=alias):
+        list(
+            RecipeChangeCounter.objects.using(alias)
+            .select_for_update()
+            .filter(pk=user_id)
+        )
+
+
+def forget_user_shard(user_id):
+    """Drop the cached shard of a user."""
+    cache.delete(f'user-shard:{user_id}')
+
+
+def _reserve_block(model):
+    """Reserve a block of primary keys for `model` on the primary."""
+    name = model._meta.label_lower
+    size = getattr(settings, 'SHARD_ID_BLOCK_SIZE', 100)
+    sequences = IdSequence.objects.using(DEFAULT_DB_ALIAS)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        sequence = sequences.select_for_update().filter(name=name).first()
+        if sequence is None:
+            start = 1 + max(
+                model._base_manager.using(alias)
+                .aggregate(top=Max('pk'))['top'] or 0
+                for alias in get_shards()
+            )
+            try:
+                with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                    sequence = sequences.create(name=name, next_value=start)
+            except IntegrityError:
+                sequence = sequences.select_for_update().get(name=name)
+        start = sequence.next_value
+        sequence.next_value = start + size
+        sequence.save(update_fields=['next_value'])
+    return start, start + size
+
+
+def allocate_id(model):
+    """Return a primary key for `model` that is unique on every shard."""
+    name = model._meta.label_lower
+    with _blocks_lock:
+        next_id, end = _blocks.get(name, (0, 0))
+        if next_id >= end:
+            next_id, end = _reserve_block(model)
+        _blocks[name] = (next_id + 1, end)
+    return next_id
+
+
+@receiver(pre_save)
+def assign_sharded_pk(sender, instance, raw, **kwargs):
+    """Give new sharded objects a globally unique primary key."""
+    if raw or instance.pk is not None or not is_sharding_enabled():
+        return
+    if is_sharded_model(sender) and keeps_pk(sender):
+        instance.pk = allocate_id(sender)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def place_new_user(sender, instance, created, raw, **kwargs):
+    """Choose the shard for a new user's recipes."""
+    if created and not raw:
+        UserShard.objects.using(DEFAULT_DB_ALIAS).get_or_create(
+            user=instance,
+            defaults={'shard': place_user(instance.pk)},
+        )
+
+
+class ShardRouter:
+    """Route sharded models to the shard of the user owning them."""
+
+    def get_shard(self, instance, for_write=False):
+        if isinstance(instance, get_user_model()):
+            return shard_for_user(instance.pk, for_write=for_write)
+        user_id = getattr(instance, 'user_id', None)
+        if user_id is not None:
+            return shard_for_user(user_id, for_write=for_write)
+        for field in instance._meta.fields:
+            if field.is_relation and is_sharded_model(field.related_model):
+                if field.is_cached(instance):
+                    parent = field.get_cached_value(instance)
+                    return self.get_shard(parent, for_write=for_write)
+        return instance._state.db
+
+    def db_for_read(self, model, **hints):
+        if not is_sharding_enabled() or not is_sharded_model(model):
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if instance._state.db and not isinstance(
+            instance, get_user_model()
+        ):
+            return instance._state.db
+        return self.get_shard(instance)
+
+    def db_for_write(self, model, **hints):
+        if not is_sharding_enabled() or not is_sharded_model(model):
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        return self.get_shard(instance, for_write=True)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_sharded_model(type(obj1)) or is_sharded_model(type(obj2)):
+            return True
+        return None
+
+
+def find_on_shards(model, **lookups):
+    """Return the first `model` object matching `lookups` on any shard."""
+    for alias in get_shards():
+        obj = model._base_manager.using(alias).filter(**lookups).first()
+        if obj is not None:
+            return obj
+    return None
+
+
+def _copy_rows(model, user_id, source, target, batch_size):
+    """Copy a user's rows of `model` from `source` to `target`."""
+    lookup = get_owner_lookup(model)
+    queryset = model._base_manager.using(source).filter(**{lookup: user_id})
+    keep_pk = keeps_pk(model)
+    last_pk = None
+    copied = 0
+    while True:
+        batch = queryset.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        rows = list(batch[:batch_size])
+        if not rows:
+            return copied
+        last_pk = rows[-1].pk
+        if not keep_pk:
+            for row in rows:
+                row.pk = None
+        model._base_manager.using(target).bulk_create(rows)
+        copied += len(rows)
+
+
+def _purge_rows(model, user_id, alias, batch_size):
+    """Delete a user's rows of `model` from `alias` without signals."""
+    lookup = get_owner_lookup(model)
+    queryset = model._base_manager.using(alias).filter(**{lookup: user_id})
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        # Raw delete: these rows still exist on the new shard, so they must
+        # not fire deletion signals or cascades.
+        doomed = model._base_manager.using(alias).filter(pk__in=ids)
+        doomed._raw_delete(alias)
+
+
+def move_user(user_id, target, batch_size=500, grace=None):
+    """Move a user's recipe data to `target` and return rows copied."""
+    if target not in get_shards():
+        raise ValueError(f'Unknown shard {target!r}')
+    entry = get_directory_entry(user_id)
+    source = entry.shard
+    if source == target:
+        return 0
+    if grace is None:
+        grace = get_cache_timeout()
+
+    from core.models import RecipeChangeCounter
+    # With the counter row in place, every write takes its lock.
+    RecipeChangeCounter.objects.using(source).get_or_create(user_id=user_id)
+    directory = UserShard.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id)
+    directory.update(locked=True)
+    models = get_sharded_models()
+    try:
+        # Writes routed before the lock commit, or fail, before the copy.
+        _wait_for_writers(user_id, source)
+        for model in reversed(models):
+            _purge_rows(model, user_id, target, batch_size)
+        copied = 0
+        for model in models:
+            with transaction.atomic(using=target):
+                copied += _copy_rows(
+                    model, user_id, source, target, batch_size,
+                )
+        directory.update(shard=target)
+        forget_user_shard(user_id)
+        # Readers may still have the old shard cached; the old rows stay
+        # readable until the cache entries have expired.
+        time.sleep(grace)
+    finally:
+        directory.update(locked=False)
+
+    for model in reversed(models):
+        _purge_rows(model, user_id, source, batch_size)
+    return copied
+
+
+def get_shard_loads():
+    """Return {alias: {user_id: recipe count}} for every shard."""
+    from django.apps import apps
+    recipe = apps.get_model('core.recipe')
+    loads = {}
+    for alias in get_shards():
+        rows = (
+            recipe._base_manager.using(alias)
+            .values('user_id')
+            .annotate(total=Count('id'))
+        )
+        loads[alias] = {row['user_id']: row['total'] for row in rows}
+    return loads
+
+
+def plan_rebalance(loads, tolerance=0.1):
+    """Return (user_id, source, target) moves that even out shard loads."""
+    totals = {alias: sum(users.values()) for alias, users in loads.items()}
+    users = {alias: dict(counts) for alias, counts in loads.items()}
+    moves = []
+    while True:
+        heaviest = max(totals, key=totals.get)
+        lightest = min(totals, key=totals.get)
+        gap = totals[heaviest] - totals[lightest]
+        if gap <= max(1, tolerance * totals[heaviest]):
+            return moves
+        candidates = [
+            (count, user_id)
+            for user_id, count in users[heaviest].items()
+            if count * 2 <= gap
+        ]
+        if not candidates:
+            return moves
+        count, user_id = max(candidates)
+        del users[heaviest][user_id]
+        users[lightest][user_id] = count
+        totals[heaviest] -= count
+        totals[lightest] += count
+        moves.append((user_id, heaviest, lightest))
@@ -0,0 +1,112 @@
+"""
+Cold start profiling.
+
+`profile_startup` loads the WSGI or ASGI application in a fresh interpreter
+run with `python -X importtime`, the way a new container does, and reports
+how long each module took to import and each app's `ready()` took to run.
+The child process runs `child_main` and prints its timings as JSON.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+CHILD_CODE = 'from core.startup import child_main; child_main()'
+ENTRY_POINTS = {
+    'wsgi': 'django.core.wsgi.get_wsgi_application',
+    'asgi': 'django.core.asgi.get_asgi_application',
+}
+
+
+def child_main():
+    """Load the application, printing its startup timings as JSON."""
+    started = time.perf_counter()
+    from django.apps import AppConfig
+
+    ready = {}
+    create = AppConfig.create.__func__
+
+    def timed_create(cls, entry):
+        config = create(cls, entry)
+        original = config.ready
+
+        def timed_ready():
+            start = time.perf_counter()
+            original()
+            ready[config.label] = time.perf_counter() - start
+
+        config.ready = timed_ready
+        return config
+
+    AppConfig.create = classmethod(timed_create)
+
+    entry_point = ENTRY_POINTS[os.environ['STARTUP_ENTRY_POINT']]
+    module_name, _, name = entry_point.rpartition('.')
+    module = __import__(module_name, fromlist=[name])
+    getattr(module, name)()
+    setup = time.perf_counter() - started
+
+    # The URLconf, and with it every view, is loaded by the first request.
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+    print(json.dumps({
+        'setup': setup,
+        'total': time.perf_counter() - started,
+        'ready': ready,
+        'modules': sorted(sys.modules),
+    }))
+
+
+def parse_importtime(output):
+    """Return (module, self seconds, cumulative seconds) import rows."""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, module = line[len('import time:'):].split('|')
+        rows.append((
+            module.strip(),
+            int(own) / 1e6,
+            int(cumulative) / 1e6,
+        ))
+    return rows
+
+
+def profile_startup(settings_module=None, entry_point='wsgi'):
+    """
+    Profile a cold start of the application in a fresh interpreter.
+
+    Return a dict with the `setup` and `total` wall times, `imports` as
+    (module, self, cumulative) seconds, each app's `ready` time and the
+    `modules` loaded.
+    """
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': (
+            settings_module or os.environ['DJANGO_SETTINGS_MODULE']
+        ),
+        'STARTUP_ENTRY_POINT': entry_point,
+    }
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD_CODE],
+        cwd=settings.BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    profile = json.loads(result.stdout.strip().splitlines()[-1])
+    profile['imports'] = parse_importtime(result.stderr)
+    return profile
+
+
+def group_imports(imports):
+    """Return the total self import time of each top-level package."""
+    totals = defaultdict(float)
+    for module, own, _ in imports:
+        totals[module.split('.')[0]] += own
+    return sorted(totals.items(), key=lambda item: -item[1])
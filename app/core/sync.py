@@ -0,0 +1,176 @@
+"""
+Change feed of each user's recipes, for incremental client sync.
+
+Every write to a recipe takes the next number from its owner's
+`RecipeChangeCounter` and stores it in `Recipe.change_seq`; deleting a
+recipe leaves a `RecipeTombstone` with its number. The counter row stays
+locked until the writing transaction commits, so a user's changes commit
+in sequence order and a client that has seen everything up to a position
+never misses a later change. Rows written by one bulk update or delete
+share a number. Recipes removed by deleting their owner leave no
+tombstones, as there is nobody left to sync.
+
+A sync token is the (change_seq, id) position of the last change a client
+received. Recipes and tombstones after it are read through indexes on
+(user, change_seq, id), so a sync costs as much as the changes since the
+token rather than the size of the collection. Tombstones are pruned after
+`SYNC_TOMBSTONE_TTL`; tokens from before the pruned range are rejected and
+the client has to start over from an empty token.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from core.models import Recipe, RecipeChangeCounter, RecipeTombstone
+from core.sharding import check_writable, get_shards, shard_for_user
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+class InvalidSyncToken(ValueError):
+    """Raised for a sync token that cannot be parsed."""
+
+
+class SyncTokenExpired(Exception):
+    """Raised when changes after a sync token have been pruned."""
+
+
+def get_tombstone_ttl():
+    """Return how long tombstones of deleted recipes are kept for."""
+    return getattr(settings, 'SYNC_TOMBSTONE_TTL', 30 * 24 * 60 * 60)
+
+
+def make_token(seq, pk):
+    """Return the sync token for the change at (seq, pk)."""
+    return f'{seq}.{pk}'
+
+
+def parse_token(token):
+    """Return the (seq, pk) position of a sync token."""
+    if not token:
+        return -1, 0
+    try:
+        seq, pk = (int(part) for part in token.split('.'))
+    except ValueError:
+        raise InvalidSyncToken(f'Invalid sync token {token!r}')
+    if seq < 0 or pk < 0:
+        raise InvalidSyncToken(f'Invalid sync token {token!r}')
+    return seq, pk
+
+
+def next_change_seq(user_id, using):
+    """Return the user's next change sequence, locking their counter.
+
+    Must be called inside a transaction on `using`; the lock is held until
+    it ends. Raises UserShardLocked if the user's data is being moved, or
+    has moved away from `using`.
+    """
+    counters = RecipeChangeCounter.objects.using(using)
+    if not counters.filter(pk=user_id).update(last_seq=F('last_seq') + 1):
+        try:
+            with transaction.atomic(using=using):
+                counters.create(user_id=user_id, last_seq=1)
+            check_writable(user_id, using)
+            return 1
+        except IntegrityError:
+            counters.filter(pk=user_id).update(last_seq=F('last_seq') + 1)
+    check_writable(user_id, using)
+    return counters.values_list('last_seq', flat=True).get(pk=user_id)
+
+
+def bury(pairs, using):
+    """Leave tombstones for deleted (pk, user_id) recipe pairs.
+
+    Must be called in the deleting transaction, before the rows go.
+    """
+    by_user = {}
+    for pk, user_id in pairs:
+        by_user.setdefault(user_id, []).append(pk)
+    tombstones = []
+    for user_id in sorted(by_user):
+        seq = next_change_seq(user_id, using)
+        tombstones += [
+            RecipeTombstone(recipe_id=pk, user_id=user_id, change_seq=seq)
+            for pk in by_user[user_id]
+        ]
+    RecipeTombstone.objects.using(using).bulk_create(tombstones)
+
+
+def get_changes(user_id, token=None, limit=DEFAULT_LIMIT):
+    """Return the user's changes after `token`.
+
+    Returns (recipes, deleted_ids, next_token, has_more). Changed recipes
+    and deletions are merged in feed order and cut at `limit` entries.
+    """
+    seq, pk = parse_token(token)
+    alias = shard_for_user(user_id)
+    if seq >= 0:
+        pruned = (
+            RecipeChangeCounter.objects.using(alias)
+            .filter(pk=user_id)
+            .values_list('pruned_seq', flat=True)
+            .first()
+        )
+        if pruned and seq < pruned:
+            raise SyncTokenExpired()
+
+    recipes = (
+        Recipe.objects.using(alias)
+        .filter(user_id=user_id)
+        .filter(Q(change_seq__gt=seq) | Q(change_seq=seq, id__gt=pk))
+        .select_related('rendering')
+        .order_by('change_seq', 'id')[:limit + 1]
+    )
+    tombstones = (
+        RecipeTombstone.objects.using(alias)
+        .filter(user_id=user_id)
+        .filter(Q(change_seq__gt=seq) | Q(change_seq=seq, recipe_id__gt=pk))
+        .order_by('change_seq', 'recipe_id')
+        .values_list('change_seq', 'recipe_id')[:limit + 1]
+    )
+    entries = [((r.change_seq, r.id), r) for r in recipes]
+    entries += [(position, None) for position in tombstones]
+    entries.sort(key=lambda entry: entry[0])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    changed = [recipe for _, recipe in entries if recipe is not None]
+    deleted = [position[1] for position, recipe in entries if recipe is None]
+    if entries:
+        token = make_token(*entries[-1][0])
+    else:
+        token = make_token(max(seq, 0), pk)
+    return changed, deleted, token, has_more
+
+
+def prune_tombstones(ttl=None):
+    """Delete tombstones older than `ttl` seconds and return how many."""
+    if ttl is None:
+        ttl = get_tombstone_ttl()
+    cutoff = timezone.now() - timedelta(seconds=ttl)
+    deleted = 0
+    for alias in get_shards():
+        with transaction.atomic(using=alias):
+            expired = RecipeTombstone.objects.using(alias).filter(
+                deleted_at__lt=cutoff,
+            )
+            pruned = expired.values('user_id').annotate(
+                top=Max('change_seq'),
+            )
+            for row in pruned:
+                RecipeChangeCounter.objects.using(alias).filter(
+                    pk=row['user_id'], pruned_seq__lt=row['top'],
+                ).update(pruned_seq=row['top'])
+            deleted += expired.delete()[0]
+    return deleted
+
+
+def forget_user(user_id):
+    """Delete the change feed of a user whose recipes have all gone."""
+    alias = shard_for_user(user_id)
+    RecipeTombstone.objects.using(alias).filter(user_id=user_id).delete()
+    RecipeChangeCounter.objects.using(alias).filter(user_id=user_id).delete()
@@ -0,0 +1,16 @@
+"""
+Background job handlers for the core app.
+"""
+from core import jobs
+from core.deletion import run_user_deletion
+from core.models import UserDeletion
+
+
+@jobs.register('user.delete')
+def delete_user(job):
+    """Delete a deactivated user's recipes in batches, then the user."""
+    deletion = UserDeletion.objects.get(pk=job.payload['deletion_id'])
+    if deletion.status == UserDeletion.STATUS_DONE:
+        return {'deleted_recipes': deletion.deleted_recipes}
+    run_user_deletion(deletion)
+    return {'deleted_recipes': deletion.deleted_recipes}
@@ -0,0 +1,117 @@
+"""
+Helpers for performance-contract tests.
+
+Endpoint tests mix in PerformanceContractMixin and call
+`assertPerformance` with a function that grows the test data to a given
+size and a function that makes the request. The request is repeated at each
+of `sizes`; every run must stay within a SQL query count and a tracemalloc
+peak, and the query count must not grow with the data. Failures print the
+captured SQL and a diff against the smallest run, so an N+1 shows up as a
+block of repeated queries.
+"""
+import difflib
+import re
+import tracemalloc
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+LITERAL_RE = re.compile(
+    r"'(?:[^']|'')*'|-?\b\d+(?:\.\d+)?\b|\"s\d+_x\d+\""
+)
+KB = 1024
+
+
+def normalize_sql(sql):
+    """Return `sql` with literals replaced, for comparing runs."""
+    return LITERAL_RE.sub('?', sql)
+
+
+def measure(func, using=DEFAULT_DB_ALIAS):
+    """Call `func`, returning (result, SQL run, peak bytes allocated)."""
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connections[using]) as context:
+            result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    queries = [query['sql'] for query in context.captured_queries]
+    return result, queries, peak
+
+
+def format_queries(queries):
+    return '\n'.join(
+        f'{number}. {sql}' for number, sql in enumerate(queries, start=1)
+    )
+
+
+def diff_queries(expected, actual, expected_label, actual_label):
+    """Return a unified diff of two runs' normalized SQL."""
+    return '\n'.join(difflib.unified_diff(
+        [normalize_sql(sql) for sql in expected],
+        [normalize_sql(sql) for sql in actual],
+        fromfile=expected_label,
+        tofile=actual_label,
+        lineterm='',
+    ))
+
+
+class PerformanceContractMixin:
+    """TestCase mixin asserting query counts and memory across sizes."""
+    sizes = [1, 10, 50]
+    using = DEFAULT_DB_ALIAS
+
+    def assertPerformance(self, grow, request, queries=None,
+                          max_queries=None, memory=256 * KB,
+                          memory_per_item=0, status_code=None, sizes=None):
+        """
+        Assert `request()` meets its budget at each of `sizes`.
+
+        `grow(size)` brings the test data up to `size` items before each
+        run; `sizes` overrides the class default. Pass `queries` for an
+        exact count or `max_queries` for an upper bound; either way the
+        count must be the same at every size. The tracemalloc peak must stay
+        under `memory + memory_per_item * size`.
+        """
+        if (queries is None) == (max_queries is None):
+            raise ValueError('Pass exactly one of queries and max_queries.')
+        baseline = None
+        for size in sizes or self.sizes:
+            grow(size)
+            response, run, peak = measure(request, using=self.using)
+            if status_code is not None:
+                self.assertEqual(response.status_code, status_code)
+            label = f'size {size}'
+            if queries is not None and len(run) != queries:
+                self.fail(
+                    f'Expected {queries} queries at {label}, ran '
+                    f'{len(run)}:\n{format_queries(run)}'
+                    + self._diff(baseline, run, label)
+                )
+            if max_queries is not None and len(run) > max_queries:
+                self.fail(
+                    f'Expected at most {max_queries} queries at {label}, '
+                    f'ran {len(run)}:\n{format_queries(run)}'
+                    + self._diff(baseline, run, label)
+                )
+            if baseline is not None and len(run) != len(baseline[1]):
+                self.fail(
+                    f'Query count grew with the data: {len(baseline[1])} '
+                    f'at {baseline[0]}, {len(run)} at {label}.'
+                    + self._diff(baseline, run, label)
+                )
+            budget = memory + memory_per_item * size
+            if peak > budget:
+                self.fail(
+                    f'Peak memory {peak / KB:.1f} KiB at {label} exceeds '
+                    f'the budget of {budget / KB:.1f} KiB.'
+                )
+            if baseline is None:
+                baseline = (label, run)
+
+    def _diff(self, baseline, run, label):
+        if baseline is None:
+            return ''
+        diff = diff_queries(baseline[1], run, baseline[0], label)
+        return f'\n\nSQL diff against {baseline[0]}:\n{diff}'
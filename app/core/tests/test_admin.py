@@ -1,13 +1,17 @@
 """
 Tests for the Django admin modifications.
 """
+from django.conf import settings
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test.client import Client
 
+from core import models
+
 class AdminSiteTests(TestCase):
     """Tests for Django admin."""
+    databases = set(settings.RECIPE_SHARDS)
 
     def setUp(self):
         """Set up user and client."""
@@ -45,3 +49,18 @@ class AdminSiteTests(TestCase):
         res = self.client.get(url)
 
         self.assertEqual(res.status_code, 200)
+
+    def test_delete_user_schedules_deletion(self):
+        """Test deleting a user in the admin deactivates them."""
+        url = reverse('admin:core_user_delete', args=[self.user.id])
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+
+        res = self.client.post(url, {'post': 'yes'})
+
+        self.assertEqual(res.status_code, 302)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertTrue(
+            models.UserDeletion.objects.filter(user=self.user).exists()
+        )
@@ -0,0 +1,95 @@
+"""
+Tests for batched background user deletion.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+
+from core import models
+from core.deletion import run_user_deletion, schedule_user_deletion
+from core.sharding import get_shards
+
+
+def create_recipes(user, count):
+    """Create and return `count` recipes for the user."""
+    return [
+        models.Recipe.objects.create(
+            user=user,
+            title=f'Recipe {i}',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        for i in range(count)
+    ]
+
+
+def count_on_shards(model):
+    """Return how many `model` objects are stored across the shards."""
+    return sum(model.objects.using(alias).count() for alias in get_shards())
+
+
+class UserDeletionTests(TestCase):
+    """Test deleting users in batches."""
+    databases = set(settings.RECIPE_SHARDS)
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        create_recipes(self.user, 7)
+        create_recipes(self.other, 2)
+
+    def test_schedule_deactivates_user(self):
+        """Test scheduling a deletion deactivates the user at once."""
+        Token.objects.create(user=self.user)
+        deletion = schedule_user_deletion(self.user)
+
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        self.assertEqual(deletion.status, models.UserDeletion.STATUS_PENDING)
+        self.assertEqual(deletion.total_recipes, 7)
+        self.assertEqual(models.Recipe.objects.for_user(self.user).count(), 7)
+
+    def test_schedule_twice_reuses_deletion(self):
+        """Test scheduling an already scheduled user reuses the record."""
+        first = schedule_user_deletion(self.user)
+        second = schedule_user_deletion(self.user)
+
+        self.assertEqual(first.pk, second.pk)
+
+    def test_run_deletes_in_batches(self):
+        """Test recipes are removed in batches before the user."""
+        models.Tag.objects.create(user=self.user, name='Tag')
+        models.Tag.objects.create(user=self.other, name='Tag')
+        deletion = schedule_user_deletion(self.user)
+        run_user_deletion(deletion, batch_size=3)
+
+        deletion.refresh_from_db()
+        self.assertEqual(deletion.status, models.UserDeletion.STATUS_DONE)
+        self.assertEqual(deletion.deleted_recipes, 7)
+        self.assertIsNone(deletion.user)
+        self.assertIsNotNone(deletion.finished_at)
+        self.assertFalse(
+            get_user_model().objects.filter(email='user@example.com').exists()
+        )
+        self.assertEqual(count_on_shards(models.Recipe), 2)
+        self.assertEqual(count_on_shards(models.Tag), 1)
+
+    def test_command_processes_pending(self):
+        """Test the command finishes pending deletions."""
+        schedule_user_deletion(self.user)
+        call_command('process_user_deletions', batch_size=5)
+
+        deletion = models.UserDeletion.objects.get(email='user@example.com')
+        self.assertEqual(deletion.status, models.UserDeletion.STATUS_DONE)
+        self.assertEqual(count_on_shards(models.Recipe), 2)
@@ -0,0 +1,195 @@
+"""
+Tests for idempotency keys.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import idempotency
+from core.models import IdempotencyKey, Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+CREATE_USER_URL = reverse('user:create')
+
+
+class IdempotentRecipeCreateTests(TestCase):
+    """Test retrying recipe creation with an Idempotency-Key."""
+    databases = set(settings.RECIPE_SHARDS)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        self.payload = {
+            'title': 'Sample recipe',
+            'time_minutes': 22,
+            'price': Decimal('5.25'),
+            'description': 'Sample description',
+        }
+
+    def post(self, payload, key='key-1'):
+        return self.client.post(
+            RECIPES_URL, payload, HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_stored_response(self):
+        """Test a retried request returns the original response."""
+        first = self.post(self.payload)
+        with patch('recipe.views.RecipeViewSet.perform_create') as create:
+            second = self.post(self.payload)
+
+        create.assert_not_called()
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Recipe.objects.for_user(self.user).count(), 1)
+
+    def test_without_key_creates_each_time(self):
+        """Test requests without a key are not deduplicated."""
+        self.client.post(RECIPES_URL, self.payload)
+        self.client.post(RECIPES_URL, self.payload)
+
+        self.assertEqual(Recipe.objects.for_user(self.user).count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_key_reused_for_different_body(self):
+        """Test reusing a key with another body returns an error."""
+        self.post(self.payload)
+        res = self.post({**self.payload, 'title': 'Other recipe'})
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Recipe.objects.for_user(self.user).count(), 1)
+
+    def test_keys_scoped_per_user(self):
+        """Test another user's key does not replay this user's response."""
+        self.post(self.payload)
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(other)
+
+        res = self.post(self.payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['user'], other.id)
+
+    def test_in_progress_key_conflicts(self):
+        """Test a retry while the original is still running gets 409."""
+        self.post(self.payload)
+        IdempotencyKey.objects.update(status_code=None, response=None)
+
+        res = self.post(self.payload)
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Recipe.objects.for_user(self.user).count(), 1)
+
+    def test_failed_request_can_be_retried(self):
+        """Test a request that raised does not store a response."""
+        with patch('recipe.views.RecipeViewSet.perform_create',
+                   side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.post(self.payload)
+
+        res = self.post(self.payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Recipe.objects.for_user(self.user).count(), 1)
+
+    def test_expired_key_runs_again(self):
+        """Test an expired key is reused for a new request."""
+        self.post(self.payload)
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+
+        res = self.post(self.payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(Recipe.objects.for_user(self.user).count(), 2)
+
+    def test_clear_idempotency_keys(self):
+        """Test the cleanup command deletes only expired keys."""
+        self.post(self.payload, key='old')
+        self.post({**self.payload, 'title': 'New'}, key='new')
+        IdempotencyKey.objects.filter(key='old').update(
+            expires_at=timezone.now() - timedelta(seconds=1),
+        )
+
+        call_command('clear_idempotency_keys', stdout=StringIO())
+
+        keys = IdempotencyKey.objects.values_list('key', flat=True)
+        self.assertEqual(list(keys), ['new'])
+
+
+class IdempotentUserCreateTests(TestCase):
+    """Test retrying user creation with an Idempotency-Key."""
+
+    def test_retry_skips_password_hashing(self):
+        """Test a retried sign-up replays without creating the user."""
+        client = APIClient()
+        payload = {
+            'email': 'test@example.com',
+            'password': 'testpass123',
+            'name': 'Test Name',
+        }
+        first = client.post(CREATE_USER_URL, payload,
+                            HTTP_IDEMPOTENCY_KEY='signup')
+        with patch('django.contrib.auth.hashers.make_password') as hasher:
+            second = client.post(CREATE_USER_URL, payload,
+                                 HTTP_IDEMPOTENCY_KEY='signup')
+
+        hasher.assert_not_called()
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.json(), first.json())
+        self.assertNotIn('password', second.json())
+        self.assertEqual(get_user_model().objects.count(), 1)
+
+    def test_fingerprint_leaves_out_password(self):
+        """Test stored fingerprints are keyed and skip write-only fields."""
+        payload = {'email': 'test@example.com', 'name': 'Test Name'}
+        APIClient().post(CREATE_USER_URL,
+                         {**payload, 'password': 'testpass123'},
+                         format='json', HTTP_IDEMPOTENCY_KEY='signup')
+        record = IdempotencyKey.objects.get()
+
+        body = json.dumps(['POST', CREATE_USER_URL, payload], sort_keys=True)
+        self.assertEqual(record.fingerprint, idempotency.sign(body))
+        self.assertNotEqual(record.fingerprint,
+                            hashlib.sha256(body.encode()).hexdigest())
+
+    def test_anonymous_keys_scoped_per_client(self):
+        """Test another client's key does not replay this client's sign-up."""
+        payload = {
+            'email': 'test@example.com',
+            'password': 'testpass123',
+            'name': 'Test Name',
+        }
+        APIClient().post(CREATE_USER_URL, payload,
+                         HTTP_IDEMPOTENCY_KEY='signup',
+                         REMOTE_ADDR='10.0.0.1')
+        res = APIClient().post(CREATE_USER_URL, payload,
+                               HTTP_IDEMPOTENCY_KEY='signup',
+                               REMOTE_ADDR='10.0.0.2')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(get_user_model().objects.count(), 1)
@@ -0,0 +1,184 @@
+"""
+Tests for the background job queue.
+"""
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from core import jobs
+from core.deletion import schedule_user_deletion
+from core.models import Job, Recipe, UserDeletion
+from core.sharding import shard_for_user
+
+
+@jobs.register('test.succeed')
+def succeed(job):
+    return {'echo': job.payload.get('value')}
+
+
+@jobs.register('test.fail')
+def fail(job):
+    raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+    """Test enqueuing, claiming and running jobs."""
+    databases = set(settings.RECIPE_SHARDS)
+
+    def test_claim_and_run_job(self):
+        """Test a claimed job runs and stores its result."""
+        job = jobs.enqueue('test.succeed', {'value': 42})
+
+        claimed = jobs.claim_job('worker-1')
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.status, Job.STATUS_RUNNING)
+        self.assertEqual(claimed.attempts, 1)
+        self.assertIsNone(jobs.claim_job('worker-2'))
+
+        jobs.run_job(claimed)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+        self.assertEqual(job.result, {'echo': 42})
+        self.assertIsNotNone(job.finished_at)
+
+    def test_future_jobs_not_claimed(self):
+        """Test jobs scheduled for later are not claimed yet."""
+        jobs.enqueue('test.succeed',
+                     run_at=timezone.now() + timedelta(minutes=5))
+
+        self.assertIsNone(jobs.claim_job('worker-1'))
+
+    def test_failed_job_retried_with_backoff(self):
+        """Test a failing job is requeued with exponential backoff."""
+        job = jobs.enqueue('test.fail', max_attempts=2)
+
+        before = timezone.now()
+        jobs.work_once('worker-1')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_QUEUED)
+        self.assertIn('boom', job.last_error)
+        self.assertGreaterEqual(job.run_at, before + jobs.get_backoff(1))
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        jobs.work_once('worker-1')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_backoff_doubles_and_caps(self):
+        """Test the retry delay doubles up to the configured cap."""
+        with self.settings(JOB_RETRY_BACKOFF=10, JOB_RETRY_BACKOFF_MAX=35):
+            self.assertEqual(jobs.get_backoff(1).total_seconds(), 10)
+            self.assertEqual(jobs.get_backoff(2).total_seconds(), 20)
+            self.assertEqual(jobs.get_backoff(3).total_seconds(), 35)
+
+    def test_unknown_kind_fails(self):
+        """Test a job without a handler fails after its attempts."""
+        job = jobs.enqueue('test.missing', max_attempts=1)
+
+        jobs.work_once('worker-1')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertIn('UnknownJobKind', job.last_error)
+
+    def test_requeue_stale_jobs(self):
+        """Test jobs left running by a dead worker are requeued."""
+        job = jobs.enqueue('test.succeed')
+        jobs.claim_job('worker-1')
+        Job.objects.filter(pk=job.pk).update(
+            locked_at=timezone.now() - timedelta(hours=2),
+        )
+
+        before = timezone.now()
+        self.assertEqual(jobs.requeue_stale_jobs(timeout=60), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('worker-1 stopped responding', job.last_error)
+        self.assertGreaterEqual(job.run_at, before + jobs.get_backoff(1))
+
+    def test_stale_job_out_of_attempts_fails(self):
+        """Test a job that keeps losing its worker fails eventually."""
+        job = jobs.enqueue('test.succeed', max_attempts=1)
+        jobs.claim_job('worker-1')
+        Job.objects.filter(pk=job.pk).update(
+            locked_at=timezone.now() - timedelta(hours=2),
+        )
+
+        self.assertEqual(jobs.requeue_stale_jobs(timeout=60), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(jobs.claim_job('worker-2'))
+
+    def test_heartbeat_refreshes_lock(self):
+        """Test running jobs keep their lock fresh, unless reclaimed."""
+        job = jobs.enqueue('test.succeed')
+        claimed = jobs.claim_job('worker-1')
+        old = timezone.now() - timedelta(hours=2)
+        Job.objects.filter(pk=job.pk).update(locked_at=old)
+
+        self.assertEqual(jobs.touch_job(claimed), 1)
+        self.assertEqual(jobs.requeue_stale_jobs(timeout=60), 0)
+
+        Job.objects.filter(pk=job.pk).update(locked_by='worker-2')
+        self.assertEqual(jobs.touch_job(claimed), 0)
+
+        beat = threading.Event()
+        with patch.object(
+            jobs, 'touch_job', side_effect=lambda job: beat.set(),
+        ):
+            with jobs.heartbeat(claimed, interval=0.01):
+                self.assertTrue(beat.wait(5))
+
+    def test_run_worker_burst(self):
+        """Test the worker command drains the queue in burst mode."""
+        for value in range(3):
+            jobs.enqueue('test.succeed', {'value': value})
+
+        call_command('run_worker', burst=True)
+
+        self.assertEqual(
+            Job.objects.filter(status=Job.STATUS_SUCCEEDED).count(), 3
+        )
+
+    def test_run_worker_sweeps_periodically(self):
+        """Test the worker requeues stale jobs while it runs."""
+        for value in range(2):
+            jobs.enqueue('test.succeed', {'value': value})
+
+        with self.settings(JOB_SWEEP_INTERVAL=0), patch.object(
+            jobs, 'requeue_stale_jobs', return_value=0,
+        ) as sweep:
+            call_command('run_worker', burst=True)
+
+        self.assertEqual(sweep.call_count, 3)
+
+    def test_user_deletion_runs_as_job(self):
+        """Test scheduling a user deletion queues a job that runs it."""
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        Recipe.objects.create(
+            user=user,
+            title='Sample',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        shard = shard_for_user(user.pk)
+        deletion = schedule_user_deletion(user)
+        self.assertTrue(Job.objects.filter(kind='user.delete').exists())
+
+        call_command('run_worker', burst=True)
+
+        deletion.refresh_from_db()
+        self.assertEqual(deletion.status, UserDeletion.STATUS_DONE)
+        self.assertFalse(Recipe.objects.using(shard).exists())
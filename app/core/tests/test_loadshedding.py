@@ -0,0 +1,142 @@
+"""
+Tests for adaptive concurrency limiting and load shedding.
+"""
+import threading
+import time
+
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+
+from core import loadshedding
+from core.loadshedding import AdaptiveLimiter
+
+HEALTH_URL = reverse('health')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class AdaptiveLimiterTests(TestCase):
+    """Test the adaptive limiter."""
+
+    def test_rejects_over_limit(self):
+        """Test requests over the limit are shed once the wait runs out."""
+        limiter = AdaptiveLimiter(initial=2, min_limit=1)
+
+        self.assertTrue(limiter.acquire())
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire(timeout=0.01))
+        limiter.release(0.01)
+        self.assertTrue(limiter.acquire())
+        self.assertEqual(limiter.stats()['shed'], 1)
+
+    def test_waiting_request_gets_freed_slot(self):
+        """Test a queued request is admitted when a slot frees up."""
+        limiter = AdaptiveLimiter(initial=1, min_limit=1)
+        limiter.acquire()
+        results = []
+        waiter = threading.Thread(
+            target=lambda: results.append(limiter.acquire(timeout=5)),
+        )
+        waiter.start()
+        while not limiter.stats()['waiting']:
+            time.sleep(0.001)
+        limiter.release(0.01)
+        waiter.join()
+
+        self.assertEqual(results, [True])
+
+    def test_low_priority_gets_a_share(self):
+        """Test low priority requests leave room for normal ones."""
+        limiter = AdaptiveLimiter(initial=5, low_priority_share=0.6)
+
+        for _ in range(3):
+            self.assertTrue(limiter.acquire(loadshedding.LOW))
+        self.assertFalse(limiter.acquire(loadshedding.LOW))
+        self.assertTrue(limiter.acquire(loadshedding.NORMAL))
+
+    def test_limit_shrinks_when_latency_rises(self):
+        """Test the limit drops when requests slow down."""
+        limiter = AdaptiveLimiter(initial=50, min_limit=2)
+        for _ in range(200):
+            limiter.update(0.01, in_use=50)
+        before = limiter.limit
+        for _ in range(20):
+            limiter.update(0.2, in_use=50)
+
+        self.assertLess(limiter.limit, before / 2)
+        self.assertGreaterEqual(limiter.limit, 2)
+
+    def test_limit_grows_only_when_used(self):
+        """Test steady latency grows the limit while it is in use."""
+        limiter = AdaptiveLimiter(initial=10, max_limit=40)
+        for _ in range(20):
+            limiter.update(0.01, in_use=2)
+        self.assertEqual(limiter.limit, 10)
+
+        for _ in range(200):
+            limiter.update(0.01, in_use=limiter.limit)
+        self.assertEqual(limiter.limit, 40)
+
+    def test_upstream_delay(self):
+        """Test X-Request-Start is read in seconds and milliseconds."""
+        factory = RequestFactory()
+        now = 1700000000.0
+        for value in ['t=1699999998.5', '1699999998500', 't=1699999998500000']:
+            request = factory.get('/', HTTP_X_REQUEST_START=value)
+            self.assertAlmostEqual(
+                loadshedding.get_upstream_delay(request, now), 1.5, places=3,
+            )
+        self.assertIsNone(
+            loadshedding.get_upstream_delay(factory.get('/'), now)
+        )
+
+
+class LoadSheddingMiddlewareTests(TestCase):
+    """Test requests are shed by the middleware."""
+
+    def setUp(self):
+        loadshedding.reset_limiter()
+        self.addCleanup(loadshedding.set_worker_threads, None)
+
+    @override_settings(LOAD_SHEDDING_INITIAL_LIMIT=1,
+                       LOAD_SHEDDING_MIN_LIMIT=1,
+                       LOAD_SHEDDING_QUEUE_TIMEOUT=0)
+    def test_sheds_when_full(self):
+        """Test a full limiter answers 503 but keeps the health check."""
+        limiter = loadshedding.get_limiter()
+        limiter.acquire()
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '1')
+
+        res = self.client.get(HEALTH_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), {'status': 'ok'})
+        self.assertEqual(limiter.stats()['shed'], 1)
+
+        limiter.release(0.01)
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(SERVE_THREADS=4)
+    def test_limit_sized_to_worker_threads(self):
+        """Test the limit starts at, and is capped by, the thread count."""
+        limiter = loadshedding.get_limiter()
+        self.assertEqual((limiter.limit, limiter.max_limit), (4, 4))
+
+        loadshedding.set_worker_threads(1)
+        limiter = loadshedding.get_limiter()
+        self.assertEqual((limiter.limit, limiter.max_limit), (1, 1))
+        self.assertTrue(limiter.acquire())
+        self.assertEqual(self.client.get(RECIPES_URL).status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    @override_settings(LOAD_SHEDDING_MAX_QUEUE_DELAY=1.0)
+    def test_sheds_requests_queued_upstream(self):
+        """Test requests that waited too long at the proxy are shed."""
+        stale = f't={time.time() - 3:.3f}'
+        res = self.client.get(RECIPES_URL, HTTP_X_REQUEST_START=stale)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
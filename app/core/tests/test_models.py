@@ -2,14 +2,18 @@
 Tests for models
 """
 from decimal import Decimal
+from django.conf import settings
+from django.db import connections
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
 from core import models
+from core.sharding import shard_for_user
 
 
 class ModelTests(TestCase):
     """Test models."""
+    databases = set(settings.RECIPE_SHARDS)
 
     def test_create_user_with_email_successful(self):
         """Test creating a user with an email is successful."""
@@ -71,3 +75,93 @@ class ModelTests(TestCase):
         self.assertEqual(recipe.title, 'Sample Recipe name')
         self.assertEqual(recipe.time_minutes, 5)
         self.assertEqual(recipe.price, Decimal('5.50'))
+
+    def test_recipe_description_stored_out_of_row(self):
+        """Test descriptions are kept compressed in their own table."""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass123'
+        )
+        description = 'Whisk the eggs. ' * 100
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='Omelette',
+            time_minutes=5,
+            price=Decimal('2.00'),
+            description=description,
+        )
+        shard = shard_for_user(user.pk)
+        with connections[shard].cursor() as cursor:
+            cursor.execute(
+                'SELECT text FROM core_recipedescription '
+                'WHERE recipe_id = %s', [recipe.id],
+            )
+            stored = bytes(cursor.fetchone()[0])
+
+        self.assertLess(len(stored), len(description) // 10)
+        recipe = models.Recipe.objects.for_user(user).get(id=recipe.id)
+        with self.assertNumQueries(1, using=shard):
+            self.assertEqual(recipe.description, description)
+        recipe = models.Recipe.objects.for_user(user).select_related(
+            'description_row').get(id=recipe.id)
+        with self.assertNumQueries(0, using=shard):
+            self.assertEqual(recipe.description, description)
+
+    def test_recipe_description_update(self):
+        """Test changing and clearing a recipe's description."""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass123'
+        )
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='Toast',
+            time_minutes=2,
+            price=Decimal('1.00'),
+        )
+        descriptions = models.RecipeDescription.objects.using(
+            shard_for_user(user.pk),
+        )
+        self.assertFalse(descriptions.exists())
+
+        recipe.description = 'Toast the bread.'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.description, 'Toast the bread.')
+
+        recipe.description = ''
+        recipe.save(update_fields=['description'])
+        self.assertEqual(
+            models.Recipe.objects.for_user(user).get(id=recipe.id).description,
+            '',
+        )
+
+    def test_create_tag(self):
+        """Test creating a tag is successful."""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass123'
+        )
+        tag = models.Tag.objects.create(user=user, name='Tag1')
+
+        self.assertEqual(str(tag), tag.name)
+
+    def test_get_or_create_named(self):
+        """Test named objects are reused or created in bulk."""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass123'
+        )
+        existing = models.Ingredient.objects.create(user=user, name='Salt')
+        shard = shard_for_user(user.pk)
+
+        with self.assertNumQueries(3, using=shard):
+            found = models.Ingredient.objects.get_or_create_named(
+                user, ['Salt', 'Pepper', 'Oil', 'Pepper'],
+            )
+
+        self.assertEqual(set(found), {'Salt', 'Pepper', 'Oil'})
+        self.assertEqual(found['Salt'], existing)
+        self.assertEqual(models.Ingredient.objects.for_user(user).count(), 3)
+        with self.assertNumQueries(1, using=shard):
+            models.Ingredient.objects.get_or_create_named(user, ['Oil'])
@@ -0,0 +1,179 @@
+"""
+Tests for read replica routing.
+"""
+import tempfile
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.test import RequestFactory
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import routers
+from core.middleware import ReplicaStickinessMiddleware
+from core.models import Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+@patch('core.routers.get_replica_lag', return_value=0.0)
+class ReplicaRouterTests(SimpleTestCase):
+    """Test the replica router's choice of database."""
+
+    def setUp(self):
+        routers.reset_replica_health()
+        self.router = routers.ReplicaRouter()
+
+    def test_reads_use_primary_by_default(self, patched_lag):
+        """Test reads outside a safe request go to the primary."""
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_safe_request_reads_use_replica(self, patched_lag):
+        """Test reads inside a safe request go to the replica."""
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(Recipe), 'replica1')
+
+    def test_writes_use_primary(self, patched_lag):
+        """Test writes always go to the primary."""
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_write(Recipe), 'default')
+
+    def test_lagging_replica_skipped(self, patched_lag):
+        """Test a replica behind by more than the max lag is skipped."""
+        patched_lag.return_value = 30.0
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_unreachable_replica_skipped(self, patched_lag):
+        """Test a replica that cannot be queried is skipped."""
+        patched_lag.return_value = None
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_health_check_cached(self, patched_lag):
+        """Test replica lag is checked at most once per interval."""
+        with routers.replica_reads():
+            self.router.db_for_read(Recipe)
+            self.router.db_for_read(Recipe)
+        patched_lag.assert_called_once_with('replica1')
+
+    def test_replicas_not_migrated(self, patched_lag):
+        """Test migrations never run against replicas."""
+        self.assertFalse(self.router.allow_migrate('replica1', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRouterTransactionTests(TestCase):
+    """Test reads inside a transaction stay on the primary."""
+
+    def test_reads_in_transaction_use_primary(self):
+        """Test the primary is used while it has an open transaction."""
+        with routers.replica_reads():
+            self.assertEqual(
+                routers.ReplicaRouter().db_for_read(Recipe), 'default'
+            )
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaPinTests(SimpleTestCase):
+    """Test how clients that wrote are pinned to the primary."""
+
+    @override_settings(REPLICA_PIN_CACHE='local', CACHES={
+        'local': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    })
+    def test_pins_need_shared_cache(self):
+        """Test startup fails when pins would be local to each process."""
+        with self.assertRaises(ImproperlyConfigured):
+            ReplicaStickinessMiddleware(lambda request: None)
+
+    @override_settings(REPLICA_PIN_CACHE='shared', CACHES={
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': tempfile.mkdtemp(),
+        },
+    })
+    def test_pin_key_ignores_address(self):
+        """Test clients are not told apart by address alone."""
+        middleware = ReplicaStickinessMiddleware(lambda request: None)
+        request = RequestFactory().post('/', REMOTE_ADDR='10.0.0.1')
+
+        self.assertIsNone(middleware.get_pin_key(request))
+        request.META['HTTP_AUTHORIZATION'] = 'Token abc'
+        self.assertIsNotNone(middleware.get_pin_key(request))
+
+
+@skipUnless('replica1' in settings.DATABASES, 'No read replica configured.')
+# Replicas mirror the primary, so the users' recipes are kept there.
+@override_settings(DATABASE_REPLICAS=['replica1'], RECIPE_SHARDS=['default'])
+class ReplicaStickinessTests(TransactionTestCase):
+    """Test requests against a primary and a replica database."""
+    databases = {'default', 'replica1'}
+
+    def setUp(self):
+        routers.reset_replica_health()
+        caches[settings.REPLICA_PIN_CACHE].clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def count_replica_queries(self, method, *args):
+        """Make a request and return it with the replica query count."""
+        with CaptureQueriesContext(connections['replica1']) as queries:
+            res = getattr(self.client, method)(*args)
+        return res, len(queries)
+
+    def test_safe_reads_served_by_replica(self):
+        """Test list requests read from the replica."""
+        Recipe.objects.create(
+            user=self.user,
+            title='Sample',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+
+        res, replica_queries = self.count_replica_queries('get', RECIPES_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.data), 1)
+        self.assertGreater(replica_queries, 0)
+
+    def test_reads_after_write_use_primary(self):
+        """Test a client that just wrote reads from the primary."""
+        payload = {
+            'title': 'Sample',
+            'time_minutes': 5,
+            'price': Decimal('1.00'),
+            'description': 'Sample description',
+        }
+        res, replica_queries = self.count_replica_queries(
+            'post', RECIPES_URL, payload,
+        )
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(replica_queries, 0)
+
+        res, replica_queries = self.count_replica_queries('get', RECIPES_URL)
+
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(replica_queries, 0)
@@ -0,0 +1,139 @@
+"""
+Tests for the production serving command.
+"""
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, override_settings
+
+from core import serving
+
+PATH = '/api/recipe/recipes/'
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class ServeOptionsTests(SimpleTestCase):
+    """Test the gunicorn settings used by the serve command."""
+
+    @patch('core.serving.os.cpu_count', return_value=6)
+    def test_defaults(self, cpu_count):
+        """Test workers follow the CPU count and the app is preloaded."""
+        options = serving.get_options()
+
+        self.assertEqual(options['workers'], 6)
+        self.assertTrue(options['preload_app'])
+        self.assertEqual(options['worker_class'], 'gthread')
+        self.assertEqual(options['max_requests'], 1000)
+        self.assertEqual(options['keepalive'], 5)
+
+    @override_settings(SERVE_THREADS=1, SERVE_MAX_REQUESTS=50)
+    def test_overrides(self):
+        """Test settings and arguments override the defaults."""
+        options = serving.get_options(workers=3, keepalive=10)
+
+        self.assertEqual(options['workers'], 3)
+        self.assertEqual(options['worker_class'], 'sync')
+        self.assertEqual(options['max_requests'], 50)
+        self.assertEqual(options['keepalive'], 10)
+
+    @patch('core.serving.connections')
+    def test_pre_fork_closes_connections(self, connections):
+        """Test database connections are not inherited by workers."""
+        serving.pre_fork(None, None)
+
+        connections.close_all.assert_called_once()
+
+    def test_upgrade_needs_pidfile(self):
+        """Test --upgrade refuses to run without a pidfile."""
+        with self.assertRaises(CommandError):
+            call_command('serve', upgrade=True)
+
+
+class ServeTests(SimpleTestCase):
+    """Test running and upgrading the server."""
+
+    def setUp(self):
+        self.port = get_free_port()
+        self.pidfile = os.path.join(tempfile.mkdtemp(), 'serve.pid')
+        self.log = tempfile.TemporaryFile()
+        self.server = subprocess.Popen(
+            [sys.executable, 'manage.py', 'serve',
+             '--bind', f'127.0.0.1:{self.port}', '--workers', '2',
+             '--pidfile', self.pidfile],
+            cwd=settings.BASE_DIR,
+            stdout=subprocess.DEVNULL,
+            stderr=self.log,
+        )
+        self.addCleanup(self.stop)
+        serving.wait_for_port('127.0.0.1', self.port, self.server)
+
+    def stop(self):
+        # After an upgrade the new master is no child of this process.
+        for pidfile in [self.pidfile, f'{self.pidfile}.2']:
+            pid = serving.read_pid(pidfile)
+            if pid is not None and pid != self.server.pid:
+                os.kill(pid, signal.SIGTERM)
+        if self.server.poll() is None:
+            self.server.send_signal(signal.SIGTERM)
+        self.server.wait(timeout=30)
+        self.log.close()
+
+    def load(self, duration=1.0, keepalive=True):
+        return serving.run_load('127.0.0.1', self.port, PATH,
+                                concurrency=2, duration=duration,
+                                keepalive=keepalive)
+
+    def test_serves_requests(self):
+        """Test the preforked workers answer requests."""
+        result = self.load()
+
+        self.assertGreater(result['requests_per_second'], 0)
+        self.assertEqual(result['errors'], 0)
+
+    def test_upgrade_without_dropping_requests(self):
+        """Test a graceful upgrade replaces the master under load."""
+        old_pid = serving.read_pid(self.pidfile)
+        result = {}
+
+        # Without keep-alive, every disconnect is a dropped request.
+        thread = threading.Thread(
+            target=lambda: result.update(
+                self.load(duration=3.0, keepalive=False),
+            ),
+        )
+        thread.start()
+        # A request the old workers are still reading must be answered.
+        in_flight = socket.create_connection(('127.0.0.1', self.port))
+        self.addCleanup(in_flight.close)
+        in_flight.sendall(f'GET {PATH} HTTP/1.1\r\n'.encode())
+        new_pid = serving.upgrade(self.pidfile)
+        time.sleep(0.5)
+        in_flight.sendall(b'Host: localhost\r\nConnection: close\r\n\r\n')
+        self.assertRegex(in_flight.recv(64), rb'^HTTP/1\.1 [1-4]\d\d ')
+        thread.join()
+
+        self.assertNotEqual(new_pid, old_pid)
+        self.assertEqual(result['errors'], 0)
+        # The new master takes over the pidfile once the old one exits.
+        self.server.wait(timeout=30)
+        for _ in range(100):
+            if serving.read_pid(self.pidfile) == new_pid:
+                break
+            time.sleep(0.1)
+        self.assertEqual(serving.read_pid(self.pidfile), new_pid)
+        self.assertGreater(result['requests_per_second'], 0)
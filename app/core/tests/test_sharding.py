@@ -0,0 +1,268 @@
+"""
+Tests for user-keyed sharding of recipes.
+"""
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import sharding
+from core.models import Recipe, Tag, UserShard
+
+RECIPES_URL = reverse('recipe:recipe-list')
+SHARDS = settings.RECIPE_SHARDS
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class ShardPlanningTests(SimpleTestCase):
+    """Test shard placement and rebalance planning."""
+
+    @override_settings(RECIPE_SHARDS=['default', 'shard_a', 'shard_b'])
+    def test_place_user_is_stable(self):
+        """Test users are placed on a configured shard consistently."""
+        for user_id in range(1, 50):
+            shard = sharding.place_user(user_id)
+            self.assertIn(shard, ['default', 'shard_a', 'shard_b'])
+            self.assertEqual(shard, sharding.place_user(user_id))
+
+    def test_plan_rebalance_moves_to_lightest(self):
+        """Test the plan moves users from the heaviest shard."""
+        loads = {
+            'default': {1: 40, 2: 30, 3: 10},
+            'shard_a': {4: 5},
+        }
+
+        moves = sharding.plan_rebalance(loads)
+
+        self.assertEqual(moves[0], (2, 'default', 'shard_a'))
+        totals = {alias: sum(users.values()) for alias, users in loads.items()}
+        for user_id, source, target in moves:
+            count = loads[source].pop(user_id)
+            loads[target][user_id] = count
+        after = {alias: sum(users.values()) for alias, users in loads.items()}
+        self.assertLess(
+            max(after.values()) - min(after.values()),
+            max(totals.values()) - min(totals.values()),
+        )
+
+    def test_plan_rebalance_balanced(self):
+        """Test balanced shards need no moves."""
+        loads = {'default': {1: 10}, 'shard_a': {2: 10}}
+
+        self.assertEqual(sharding.plan_rebalance(loads), [])
+
+    def test_single_shard_needs_no_lookup(self):
+        """Test every user maps to default without queries by default."""
+        with override_settings(RECIPE_SHARDS=['default']):
+            self.assertEqual(sharding.shard_for_user(123), 'default')
+
+
+@skipUnless(len(SHARDS) > 1, 'Only one recipe shard is configured.')
+class MultiShardTests(TestCase):
+    """Test recipe APIs and commands across several shard databases."""
+    databases = set(settings.RECIPE_SHARDS)
+
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user('user@example.com', SHARDS[1])
+        self.other = self.create_user('other@example.com', SHARDS[0])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_user(self, email, shard):
+        """Create a user whose recipes live on `shard`."""
+        user = get_user_model().objects.create_user(email, 'testpass123')
+        UserShard.objects.filter(user=user).update(shard=shard)
+        return user
+
+    def create_recipe(self, user, **params):
+        """Create and return a recipe."""
+        defaults = {
+            'title': 'Sample Recipe title',
+            'time_minutes': 10,
+            'price': Decimal('5.00'),
+        }
+        defaults.update(params)
+        return Recipe.objects.create(user=user, **defaults)
+
+    def test_create_writes_to_user_shard(self):
+        """Test recipes created through the API land on the user's shard."""
+        payload = {
+            'title': 'Sample',
+            'time_minutes': 5,
+            'price': Decimal('1.00'),
+            'description': 'Sample description',
+        }
+        res = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(
+            Recipe.objects.using(SHARDS[1]).filter(id=res.data['id']).exists()
+        )
+        self.assertFalse(
+            Recipe.objects.using(SHARDS[0]).filter(id=res.data['id']).exists()
+        )
+
+    def test_admin_counts_recipes_on_every_shard(self):
+        """Test the admin delete confirmation counts recipes on any shard."""
+        self.create_recipe(self.user)
+        self.create_recipe(self.user)
+        self.create_recipe(self.other)
+        admin = get_user_model().objects.create_superuser(
+            'admin@example.com', 'testpass123',
+        )
+        self.client.force_login(admin)
+
+        res = self.client.post(reverse('admin:core_user_changelist'), {
+            'action': 'delete_selected',
+            '_selected_action': [self.user.id, self.other.id],
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(dict(res.context['model_count'])['recipes'], 3)
+
+    def test_tags_written_and_moved_with_recipes(self):
+        """Test nested tags live on, and move with, the user's shard."""
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Sample',
+            'time_minutes': 5,
+            'price': Decimal('1.00'),
+            'description': 'Sample description',
+            'tags': [{'name': 'Quick'}, {'name': 'Cheap'}],
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.using(SHARDS[1]).count(), 2)
+        self.assertFalse(Tag.objects.using(SHARDS[0]).exists())
+
+        call_command(
+            'rebalance_shards', user=self.user.id, to=SHARDS[0], grace=0,
+        )
+
+        self.assertFalse(Tag.objects.using(SHARDS[1]).exists())
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(
+            sorted(tag['name'] for tag in res.data[0]['tags']),
+            ['Cheap', 'Quick'],
+        )
+
+    def test_ids_unique_across_shards(self):
+        """Test primary keys are not reused between shards."""
+        first = self.create_recipe(self.user)
+        second = self.create_recipe(self.other)
+
+        self.assertEqual(first._state.db, SHARDS[1])
+        self.assertEqual(second._state.db, SHARDS[0])
+        self.assertNotEqual(first.id, second.id)
+
+    def test_list_reads_user_shard(self):
+        """Test listing recipes reads from the user's shard."""
+        recipe = self.create_recipe(self.user)
+        self.create_recipe(self.other)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual([item['id'] for item in res.data], [recipe.id])
+
+    def test_update_and_delete_on_shard(self):
+        """Test updating and deleting a recipe on a non-default shard."""
+        recipe = self.create_recipe(self.user)
+
+        res = self.client.patch(detail_url(recipe.id), {'title': 'New'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'New')
+
+        res = self.client.delete(detail_url(recipe.id))
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Recipe.objects.for_user(self.user).exists())
+
+    def test_delete_other_users_recipe_on_other_shard(self):
+        """Test deleting a recipe stored on another shard is forbidden."""
+        recipe = self.create_recipe(self.other)
+
+        res = self.client.delete(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_locked_user_cannot_write(self):
+        """Test writes are refused while a user is being moved."""
+        UserShard.objects.filter(user=self.user).update(locked=True)
+
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Sample',
+            'time_minutes': 5,
+            'price': Decimal('1.00'),
+            'description': 'Sample description',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_write_routed_before_lock_fails(self):
+        """Test a write routed before a move is refused once it is locked."""
+        recipe = self.create_recipe(self.user)
+        UserShard.objects.filter(user=self.user).update(locked=True)
+        recipe.title = 'New'
+
+        with self.assertRaises(sharding.UserShardLocked):
+            recipe.save(using=SHARDS[1])
+
+        recipe = Recipe.objects.using(SHARDS[1]).get(id=recipe.id)
+        self.assertEqual(recipe.title, 'Sample Recipe title')
+
+    def test_write_routed_before_move_fails(self):
+        """Test a write to the shard a user has left is refused."""
+        recipe = self.create_recipe(self.user)
+        sharding.move_user(self.user.id, SHARDS[0], grace=0)
+
+        recipe.title = 'New'
+
+        with self.assertRaises(sharding.UserShardLocked):
+            recipe.save(using=SHARDS[1])
+
+        self.assertFalse(Recipe.objects.using(SHARDS[1]).exists())
+
+    def test_move_user_command(self):
+        """Test moving a user copies their recipes to the new shard."""
+        recipes = [self.create_recipe(self.user) for _ in range(3)]
+        self.create_recipe(self.other)
+
+        call_command(
+            'rebalance_shards', user=self.user.id, to=SHARDS[0],
+            batch_size=2, grace=0,
+        )
+
+        entry = UserShard.objects.get(user=self.user)
+        self.assertEqual(entry.shard, SHARDS[0])
+        self.assertFalse(entry.locked)
+        self.assertFalse(Recipe.objects.using(SHARDS[1]).exists())
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(
+            sorted(item['id'] for item in res.data),
+            sorted(recipe.id for recipe in recipes),
+        )
+
+    def test_rebalance_command(self):
+        """Test rebalancing moves users off the most loaded shard."""
+        for _ in range(4):
+            self.create_recipe(self.other)
+        small = self.create_user('small@example.com', SHARDS[0])
+        self.create_recipe(small)
+
+        call_command('rebalance_shards', grace=0)
+
+        loads = sharding.get_shard_loads()
+        totals = [sum(users.values()) for users in loads.values()]
+        self.assertLessEqual(max(totals) - min(totals), 4)
+        self.assertEqual(sum(totals), 5)
@@ -0,0 +1,100 @@
+"""
+Tests for startup profiling and the lean production settings.
+"""
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from core.startup import group_imports, parse_importtime, profile_startup
+
+FULL_SETTINGS = 'app.settings'
+LEAN_SETTINGS = 'app.settings_production'
+RUNS = 3
+
+
+class ImportTimeTests(SimpleTestCase):
+    """Test parsing `python -X importtime` output."""
+
+    def test_parse_and_group(self):
+        """Test import rows are parsed and grouped by package."""
+        output = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       150 |        150 |   django.utils\n'
+            'import time:      1000 |       1150 | django\n'
+            'some other stderr line\n'
+            'import time:       500 |        500 | numpy\n'
+        )
+
+        rows = parse_importtime(output)
+
+        self.assertEqual(rows, [
+            ('django.utils', 0.00015, 0.00015),
+            ('django', 0.001, 0.00115),
+            ('numpy', 0.0005, 0.0005),
+        ])
+        self.assertEqual(
+            [package for package, _ in group_imports(rows)],
+            ['django', 'numpy'],
+        )
+
+
+class StartupBenchmarkTests(SimpleTestCase):
+    """Benchmark cold starts of the full and lean settings."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.full = [profile_startup(FULL_SETTINGS) for _ in range(RUNS)]
+        cls.lean = [profile_startup(LEAN_SETTINGS) for _ in range(RUNS)]
+
+    def test_lean_settings_skip_docs_and_admin(self):
+        """Test the docs, admin and session stack are not loaded."""
+        modules = set(self.lean[0]['modules'])
+
+        for module in ['drf_spectacular', 'django.contrib.admin.models',
+                       'django.contrib.sessions',
+                       'django.contrib.messages.middleware',
+                       'django.contrib.staticfiles', 'core.admin']:
+            self.assertNotIn(module, modules)
+        self.assertIn('recipe.views', modules)
+
+    def test_full_settings_keep_docs_and_admin(self):
+        """Test the default settings still serve the docs and admin."""
+        modules = set(self.full[0]['modules'])
+
+        self.assertIn('drf_spectacular.views', modules)
+        self.assertIn('core.admin', modules)
+
+    def test_numpy_deferred(self):
+        """Test numpy is only imported once a recipe needs it."""
+        self.assertNotIn('numpy', self.full[0]['modules'])
+        self.assertNotIn('numpy', self.lean[0]['modules'])
+
+    def test_lean_settings_import_less(self):
+        """Test the lean settings import a strict subset of the modules."""
+        full = set(self.full[0]['modules'])
+        lean = set(self.lean[0]['modules']) - {LEAN_SETTINGS}
+        # Wall time is too noisy to assert on directly; the time spent
+        # importing what the lean settings skip is the gain.
+        gain = min(
+            sum(own for module, own, _ in profile['imports']
+                if module not in lean)
+            for profile in self.full
+        )
+
+        self.assertLess(lean, full)
+        self.assertGreater(gain, 0)
+
+    def test_profile_startup_command(self):
+        """Test the command reports imports and app ready times."""
+        out = StringIO()
+
+        call_command('profile_startup', settings_module=LEAN_SETTINGS,
+                     entry_point='asgi', top=5, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('Self import time by package:', output)
+        self.assertIn('App ready():', output)
+        self.assertIn('core', output)
+        self.assertIn('Loaded', output)
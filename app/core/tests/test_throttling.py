@@ -0,0 +1,186 @@
+"""
+Tests for token-bucket throttling.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import throttling
+from core.throttling import (
+    CacheBucketStore,
+    LocalBucketStore,
+    parse_rate,
+    reset_throttles,
+)
+
+TOKEN_URL = reverse('user:token')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def auth_rates(auth='2/min', write='100/min'):
+    """Return REST_FRAMEWORK settings with the given throttle rates."""
+    return {
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {'auth': auth, 'recipe-write': write},
+    }
+
+
+class Clock:
+    """Manually advanced time source."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class BucketStoreTests(TestCase):
+    """Test the token bucket stores."""
+
+    def check_burst_and_refill(self, store):
+        clock = Clock()
+        store.timer = clock
+        interval, burst = parse_rate('6/min:3')
+
+        for _ in range(3):
+            self.assertEqual(store.consume('k', interval, burst), 0)
+        self.assertAlmostEqual(store.consume('k', interval, burst), 10)
+        self.assertEqual(store.consume('other', interval, burst), 0)
+
+        clock.now += 10
+        self.assertEqual(store.consume('k', interval, burst), 0)
+        self.assertGreater(store.consume('k', interval, burst), 0)
+
+        clock.now += 60
+        for _ in range(3):
+            self.assertEqual(store.consume('k', interval, burst), 0)
+        self.assertGreater(store.consume('k', interval, burst), 0)
+
+    def test_local_burst_and_refill(self):
+        """Test a local bucket allows a burst, then refills at the rate."""
+        self.check_burst_and_refill(LocalBucketStore())
+
+    def test_cache_burst_and_refill(self):
+        """Test a cache-backed bucket behaves like a local one."""
+        store = CacheBucketStore('default')
+        store.cache.clear()
+        self.check_burst_and_refill(store)
+
+    def test_local_store_prunes_full_buckets(self):
+        """Test refilled buckets are forgotten once there are too many."""
+        clock = Clock()
+        store = LocalBucketStore(max_keys=2)
+        store.timer = clock
+        store.consume('a', 1, 1)
+        store.consume('b', 1, 1)
+        clock.now += 5
+        store.consume('c', 1, 1)
+
+        self.assertEqual(store.consume('d', 1, 1), 0)
+        self.assertLessEqual(len(store._full_at), 2)
+
+    def test_parse_rate(self):
+        """Test rates with and without an explicit burst."""
+        self.assertEqual(parse_rate('10/min'), (6, 10))
+        self.assertEqual(parse_rate('2/s:5'), (0.5, 5))
+        with self.assertRaises(ValueError):
+            parse_rate('0/min')
+
+
+class ThrottledViewTests(TestCase):
+    """Test throttles on the auth and recipe endpoints."""
+    databases = set(settings.RECIPE_SHARDS)
+
+    def setUp(self):
+        reset_throttles()
+        self.addCleanup(reset_throttles)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+
+    @override_settings(REST_FRAMEWORK=auth_rates())
+    def test_token_throttled_by_ip(self):
+        """Test one address can only burst so many logins."""
+        for email in ['a@example.com', 'b@example.com']:
+            res = self.client.post(TOKEN_URL, {'email': email,
+                                               'password': 'wrong'})
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(TOKEN_URL, {'email': 'c@example.com',
+                                           'password': 'wrong'})
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+        res = self.client.post(TOKEN_URL, {'email': 'c@example.com',
+                                           'password': 'wrong'},
+                               REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(REST_FRAMEWORK=auth_rates())
+    def test_forwarded_for_not_trusted(self):
+        """Test a client cannot get new buckets by forging its address."""
+        for address in ['10.0.0.1', '10.0.0.2', '10.0.0.3']:
+            res = self.client.post(
+                TOKEN_URL, {'email': f'{address}@example.com',
+                            'password': 'wrong'},
+                HTTP_X_FORWARDED_FOR=address,
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(REST_FRAMEWORK=auth_rates())
+    def test_token_with_list_body(self):
+        """Test a JSON body that is not an object is a client error."""
+        res = self.client.post(TOKEN_URL, [], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(REST_FRAMEWORK=auth_rates())
+    def test_token_throttled_by_account(self):
+        """Test guesses at one account from many addresses are limited."""
+        payload = {'email': 'User@example.com', 'password': 'wrong'}
+        for address in ['10.0.0.1', '10.0.0.2']:
+            res = self.client.post(TOKEN_URL, payload, REMOTE_ADDR=address)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(TOKEN_URL, payload, REMOTE_ADDR='10.0.0.3')
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(REST_FRAMEWORK=auth_rates(write='1/min'))
+    def test_recipe_writes_throttled_per_user(self):
+        """Test recipe writes are limited per user and reads are not."""
+        self.client.force_authenticate(self.user)
+        payload = {
+            'title': 'Sample',
+            'time_minutes': 5,
+            'price': Decimal('1.00'),
+            'description': 'Sample',
+        }
+
+        res = self.client.post(RECIPES_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        res = self.client.post(RECIPES_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(other)
+        res = self.client.post(RECIPES_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(THROTTLE_CACHE='default')
+    def test_shared_store(self):
+        """Test THROTTLE_CACHE selects the shared store."""
+        self.assertIsInstance(throttling.get_store(), CacheBucketStore)
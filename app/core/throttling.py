@@ -0,0 +1,159 @@
+"""
+Token-bucket request throttling.
+
+Rates are set per throttle scope in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']
+as `<requests>/<period>[:<burst>]`, e.g. `10/min:20`: a bucket holds up to
+`burst` tokens (default `requests`) and refills at `requests` per period.
+Views pick a scope with `throttle_scope`, like DRF's ScopedRateThrottle.
+
+Buckets are kept with the generic cell rate algorithm, which stores one
+number per key, the time at which the bucket will be full again, so a
+check is a dict lookup and some arithmetic. By default they live in a
+plain dict in each process, so every worker process allows the full rate;
+setting THROTTLE_CACHE to a cache alias shares them between processes.
+Neither store takes a lock: concurrent requests for the same key may
+occasionally both be let through, which is an acceptable error for rate
+limiting.
+"""
+import functools
+import time
+from collections.abc import Mapping
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+DEFAULT_MAX_KEYS = 10000
+
+
+@functools.lru_cache(maxsize=64)
+def parse_rate(rate):
+    """Return (seconds per token, burst) for a `<n>/<period>[:<burst>]`."""
+    requests, _, burst = rate.partition(':')
+    num, period = requests.split('/')
+    num = int(num)
+    burst = int(burst) if burst else num
+    if num < 1 or burst < 1 or period[:1] not in PERIODS:
+        raise ValueError(f'Invalid throttle rate {rate!r}')
+    return PERIODS[period[0]] / num, burst
+
+
+class LocalBucketStore:
+    """Token buckets of this process, one float per key in a dict."""
+    timer = staticmethod(time.monotonic)
+
+    def __init__(self, max_keys=DEFAULT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._full_at = {}
+
+    def consume(self, key, interval, burst):
+        """Take a token for `key`; return the seconds to wait, 0 if taken."""
+        now = self.timer()
+        full_at = max(self._full_at.get(key, now), now)
+        wait = full_at - now - interval * (burst - 1)
+        if wait > 0:
+            return wait
+        self._full_at[key] = full_at + interval
+        if len(self._full_at) > self.max_keys:
+            self.prune(now)
+        return 0
+
+    def prune(self, now):
+        """Forget buckets that have refilled completely."""
+        for key, full_at in list(self._full_at.items()):
+            if full_at <= now:
+                self._full_at.pop(key, None)
+
+    def clear(self):
+        self._full_at.clear()
+
+
+class CacheBucketStore:
+    """Token buckets shared between processes through a Django cache."""
+    timer = staticmethod(time.time)
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def consume(self, key, interval, burst):
+        """Take a token for `key`; return the seconds to wait, 0 if taken."""
+        now = self.timer()
+        key = f'throttle:{key}'
+        full_at = max(self.cache.get(key, now), now)
+        wait = full_at - now - interval * (burst - 1)
+        if wait > 0:
+            return wait
+        full_at += interval
+        self.cache.set(key, full_at, int(full_at - now) + 1)
+        return 0
+
+
+_local_store = LocalBucketStore()
+
+
+def get_store():
+    """Return the bucket store chosen by THROTTLE_CACHE."""
+    alias = getattr(settings, 'THROTTLE_CACHE', None)
+    if alias:
+        return CacheBucketStore(alias)
+    return _local_store
+
+
+def reset_throttles():
+    """Refill every bucket of this process."""
+    _local_store.clear()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttle requests per client with the view's `throttle_scope`."""
+
+    def get_key(self, request, view):
+        """Return the identity of the client, or None not to throttle."""
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        scope = getattr(view, 'throttle_scope', None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+        key = self.get_key(request, view)
+        if key is None:
+            return True
+        interval, burst = parse_rate(rate)
+        wait = get_store().consume(f'{scope}:{key}', interval, burst)
+        if wait:
+            self.retry_after = wait
+            return False
+        return True
+
+    def wait(self):
+        return self.retry_after
+
+
+class ClientIPThrottle(TokenBucketThrottle):
+    """Throttle by client IP address."""
+
+    def get_key(self, request, view):
+        return f'ip:{self.get_ident(request)}'
+
+
+class UserThrottle(TokenBucketThrottle):
+    """Throttle by user: the authenticated one, or the one named.
+
+    Views taking credentials set `throttle_user_field` to the request field
+    naming the account, so guessing one account's password from many
+    addresses is throttled too.
+    """
+
+    def get_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        field = getattr(view, 'throttle_user_field', None)
+        if field and isinstance(request.data, Mapping):
+            value = request.data.get(field)
+            if isinstance(value, str) and value:
+                return f'{field}:{value.strip().lower()}'
+        return None
@@ -0,0 +1,9 @@
+"""
+Views for the core app.
+"""
+from django.http import JsonResponse
+
+
+def health(request):
+    """Report that the process is serving, without touching the database."""
+    return JsonResponse({'status': 'ok'})
@@ -0,0 +1,17 @@
+"""
+Serializers for the job APIs.
+"""
+from rest_framework import serializers
+
+from core.models import Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Serializer for background jobs."""
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'kind', 'status', 'attempts', 'max_attempts', 'result',
+            'last_error', 'created_at', 'finished_at',
+        ]
+        read_only_fields = fields
@@ -0,0 +1,100 @@
+"""
+Tests for the job API.
+"""
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Job
+
+JOBS_URL = reverse('job:job-list')
+
+
+def detail_url(job_id):
+    """Create and return a job detail URL."""
+    return reverse('job:job-detail', args=[job_id])
+
+
+def download_url(job_id):
+    """Create and return a job download URL."""
+    return reverse('job:job-download', args=[job_id])
+
+
+def create_user(**params):
+    """Helper function to create a user."""
+    return get_user_model().objects.create_user(**params)
+
+
+class PublicJobAPITests(TestCase):
+    """Test unauthenticated API requests."""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_auth_required(self):
+        """Test auth is required to call API."""
+        res = self.client.get(JOBS_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class PrivateJobAPITests(TestCase):
+    """Test authenticated API requests."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_list_limited_to_user(self):
+        """Test only the user's own jobs are listed."""
+        other = create_user(email='other@example.com', password='pass1234')
+        Job.objects.create(kind='recipe.export', user=other)
+        job = Job.objects.create(kind='recipe.export', user=self.user)
+
+        res = self.client.get(JOBS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data], [job.id])
+
+    def test_retrieve_job(self):
+        """Test retrieving a job's status."""
+        job = Job.objects.create(kind='recipe.export', user=self.user)
+
+        res = self.client.get(detail_url(job.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['status'], Job.STATUS_QUEUED)
+
+    def test_download_unfinished_job(self):
+        """Test downloading before the job finished returns 404."""
+        job = Job.objects.create(kind='recipe.export', user=self.user)
+
+        res = self.client.get(download_url(job.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_download_finished_job(self):
+        """Test downloading the file produced by a job."""
+        name = default_storage.save('exports/test.csv', ContentFile(b'a,b'))
+        job = Job.objects.create(
+            kind='recipe.export',
+            user=self.user,
+            status=Job.STATUS_SUCCEEDED,
+            result={'file': name},
+        )
+
+        res = self.client.get(download_url(job.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(res.streaming_content), b'a,b')
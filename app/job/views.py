@@ -0,0 +1,43 @@
+"""
+Views for the job app.
+"""
+import os
+
+from django.core.files.storage import default_storage
+from django.http import FileResponse
+from rest_framework import viewsets, status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from core.models import Job
+from job import serializers
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """View the status of background jobs."""
+    serializer_class = serializers.JobSerializer
+    queryset = Job.objects.all()
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        """Retrieve the jobs for the authenticated user."""
+        return self.queryset.filter(user=self.request.user).order_by('-id')
+
+    @action(methods=['GET'], detail=True)
+    def download(self, request, pk=None):
+        """Download the file produced by a finished job."""
+        job = self.get_object()
+        name = (job.result or {}).get('file')
+        if job.status != Job.STATUS_SUCCEEDED or not name:
+            return Response(
+                {'detail': 'This job has no file to download.'},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return FileResponse(
+            default_storage.open(name, 'rb'),
+            as_attachment=True,
+            filename=os.path.basename(name),
+        )
@@ -0,0 +1,188 @@
+"""
+Tests for request profiling and the profiles API.
+"""
+import pstats
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import profiling
+from core.middleware import ProfilingMiddleware
+from core.models import Recipe
+
+PROFILES_URL = reverse('profiling:profile-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def pstats_url(profile_id):
+    return reverse('profiling:profile-pstats', args=[profile_id])
+
+
+def flamegraph_url(profile_id):
+    return reverse('profiling:profile-flamegraph', args=[profile_id])
+
+
+@override_settings(
+    PROFILING_ENABLED=True,
+    PROFILING_SAMPLE_RATE=0,
+    PROFILING_SAMPLE_INTERVAL=0.001,
+    PROFILING_DIR=tempfile.mkdtemp(),
+    MEDIA_ROOT=tempfile.mkdtemp(),
+)
+class ProfilingTests(TestCase):
+    """Test profiling requests on demand."""
+    databases = set(settings.RECIPE_SHARDS)
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'admin@example.com',
+            'testpass123',
+            is_staff=True,
+        )
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=Decimal('5.00'),
+        )
+        for profile in profiling.list_profiles():
+            for extension in ['prof', 'folded', 'json']:
+                profiling.get_storage().delete(
+                    profiling.get_path(profile['id'], extension))
+
+    def test_disabled_middleware_not_used(self):
+        """Test the middleware removes itself when profiling is off."""
+        with override_settings(PROFILING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: None)
+
+    def test_unprofiled_request(self):
+        """Test requests without a token are not profiled."""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertNotIn(profiling.PROFILE_ID_HEADER, res)
+        self.assertEqual(profiling.list_profiles(), [])
+
+    def test_invalid_token_ignored(self):
+        """Test a forged token does not enable profiling."""
+        res = self.client.get(RECIPES_URL, HTTP_X_PROFILE='profile:forged')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn(profiling.PROFILE_ID_HEADER, res)
+
+    def test_signed_header_profiles_request(self):
+        """Test a signed header stores a downloadable profile."""
+        res = self.client.get(
+            RECIPES_URL, HTTP_X_PROFILE=profiling.create_token(),
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        profile_id = res[profiling.PROFILE_ID_HEADER]
+
+        res = self.client.get(PROFILES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data[0]['id'], profile_id)
+        self.assertEqual(res.data[0]['path'], RECIPES_URL)
+        self.assertEqual(res.data[0]['status'], status.HTTP_200_OK)
+
+        res = self.client.get(pstats_url(profile_id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        with tempfile.NamedTemporaryFile() as handle:
+            handle.write(b''.join(res.streaming_content))
+            handle.flush()
+            stats = pstats.Stats(handle.name, stream=StringIO())
+        functions = {name for _, _, name in stats.stats}
+        self.assertIn('get_queryset', functions)
+
+        res = self.client.get(flamegraph_url(profile_id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        for line in b''.join(res.streaming_content).decode().splitlines():
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(stack)
+            self.assertGreater(int(count), 0)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sample_rate_profiles_request(self):
+        """Test sampled requests are profiled without a token."""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertIn(profiling.PROFILE_ID_HEADER, res)
+
+    def test_profiles_kept_out_of_media(self):
+        """Test profiles are stored privately, not in the served media."""
+        res = self.client.get(
+            RECIPES_URL, HTTP_X_PROFILE=profiling.create_token(),
+        )
+        profile_id = res[profiling.PROFILE_ID_HEADER]
+
+        self.assertTrue(
+            Path(settings.PROFILING_DIR, f'{profile_id}.json').exists()
+        )
+        self.assertEqual(
+            list(Path(settings.MEDIA_ROOT).rglob(f'{profile_id}.*')), [],
+        )
+
+    @override_settings(PROFILING_MAX_PROFILES=2)
+    def test_old_profiles_pruned(self):
+        """Test only the newest profiles are kept."""
+        token = profiling.create_token()
+        ids = [
+            self.client.get(RECIPES_URL, HTTP_X_PROFILE=token)[
+                profiling.PROFILE_ID_HEADER]
+            for _ in range(3)
+        ]
+
+        stored = [profile['id'] for profile in profiling.list_profiles()]
+        self.assertEqual(stored, ids[:0:-1])
+
+    @override_settings(PROFILING_MAX_PROFILES=1)
+    def test_pruning_reads_no_profiles(self):
+        """Test pruning picks the oldest profiles without opening them."""
+        token = profiling.create_token()
+        self.client.get(RECIPES_URL, HTTP_X_PROFILE=token)
+
+        with patch('core.profiling.json.load') as load:
+            res = self.client.get(RECIPES_URL, HTTP_X_PROFILE=token)
+
+        load.assert_not_called()
+        self.assertEqual(profiling.list_profile_ids(),
+                         [res[profiling.PROFILE_ID_HEADER]])
+
+    def test_profiles_admin_only(self):
+        """Test other users cannot list or download profiles."""
+        self.user.is_staff = False
+        self.user.save()
+
+        res = self.client.get(PROFILES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_download_unknown_profile(self):
+        """Test downloading a missing profile returns 404."""
+        res = self.client.get(pstats_url('20260101T000000000000-deadbeef'))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_create_profile_token(self):
+        """Test the command prints a valid token."""
+        out = StringIO()
+
+        call_command('create_profile_token', stdout=out, stderr=StringIO())
+
+        self.assertTrue(profiling.is_valid_token(out.getvalue().strip()))
@@ -0,0 +1,15 @@
+"""
+URL mapping for the profiling app.
+"""
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+
+from profiling import views
+
+router = DefaultRouter()
+router.register('profiles', views.ProfileViewSet, basename='profile')
+
+app_name = 'profiling'
+urlpatterns = [
+    path('', include(router.urls)),
+]
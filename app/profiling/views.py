@@ -0,0 +1,43 @@
+"""
+Views for the profiling app.
+"""
+from django.http import FileResponse, Http404
+from rest_framework import viewsets
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from core import profiling
+
+
+class ProfileViewSet(viewsets.ViewSet):
+    """List and download stored request profiles."""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def list(self, request):
+        """Return the stored profiles, newest first."""
+        return Response(profiling.list_profiles())
+
+    @action(methods=['GET'], detail=True)
+    def pstats(self, request, pk=None):
+        """Download the cProfile stats, readable with `pstats.Stats`."""
+        return self.download(pk, 'prof')
+
+    @action(methods=['GET'], detail=True)
+    def flamegraph(self, request, pk=None):
+        """Download the sampled stacks in collapsed stack format."""
+        return self.download(pk, 'folded')
+
+    def download(self, profile_id, extension):
+        storage = profiling.get_storage()
+        name = profiling.get_path(profile_id, extension)
+        if (not profiling.PROFILE_ID_RE.match(profile_id)
+                or not storage.exists(name)):
+            raise Http404
+        return FileResponse(
+            storage.open(name, 'rb'),
+            as_attachment=True,
+            filename=f'{profile_id}.{extension}',
+        )
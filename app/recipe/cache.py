@@ -0,0 +1,178 @@
+"""
+Cache of rendered recipe detail JSON.
+
+Lookups check a small in-process LRU first and Django's cache framework
+second, which must be shared by every process (see CACHES in settings).
+Entries are keyed by owner and recipe and are invalidated by the model
+signals in `recipe.signals`. Other processes may keep serving their own
+LRU entry for up to RECIPE_CACHE_LOCAL_TTL seconds after a change.
+
+Each shared entry is stamped with the recipe's cache version, which every
+invalidation replaces. A request that missed takes the version before
+reading the database and stores its content under it, so content read
+before a concurrent change is never served after it.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+class LRUCache:
+    """Thread-safe LRU mapping whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value for `key`, or None if missing or expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Store `value`, evicting the least recently used entry if full."""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove `key` if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RecipeDetailCache:
+    """Two level cache of recipe detail JSON, see `recipe.rendering`."""
+
+    def __init__(self):
+        self._local = None
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = LRUCache(
+                getattr(settings, 'RECIPE_CACHE_LOCAL_SIZE', 1024),
+                getattr(settings, 'RECIPE_CACHE_LOCAL_TTL', 5),
+            )
+        return self._local
+
+    def make_key(self, user_id, recipe_id):
+        return f'recipe-detail-json:{user_id}:{recipe_id}'
+
+    def make_version_key(self, user_id, recipe_id):
+        return f'recipe-detail-version:{user_id}:{recipe_id}'
+
+    def get_timeout(self):
+        return getattr(settings, 'RECIPE_CACHE_TIMEOUT', 300)
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, user_id, recipe_id):
+        """
+        Return (detail JSON, None) on a hit, or (None, version) on a miss.
+
+        Pass the version to `set` to cache what the caller reads next.
+        """
+        key = self.make_key(user_id, recipe_id)
+        data = self.local.get(key)
+        if data is not None:
+            self._count('local_hits')
+            return data, None
+        version_key = self.make_version_key(user_id, recipe_id)
+        found = cache.get_many([key, version_key])
+        version = found.get(version_key)
+        entry = found.get(key)
+        if entry is not None and version is not None and entry[0] == version:
+            self._count('shared_hits')
+            self.local.set(key, entry[1])
+            return entry[1], None
+        self._count('misses')
+        if version is None:
+            cache.add(version_key, uuid.uuid4().hex, self.get_timeout())
+            version = cache.get(version_key)
+        return None, version
+
+    def set(self, user_id, recipe_id, data, version):
+        """Cache detail JSON read after `get` returned `version`."""
+        if version is None:
+            return
+        key = self.make_key(user_id, recipe_id)
+        cache.set(key, (version, data), self.get_timeout())
+        version_key = self.make_version_key(user_id, recipe_id)
+        if cache.get(version_key) == version:
+            self.local.set(key, data)
+
+    def invalidate(self, user_id, recipe_id, using=None):
+        """Drop the cached detail of one recipe."""
+        self.invalidate_many(user_id, [recipe_id], using)
+
+    def invalidate_many(self, user_id, recipe_ids, using=None):
+        """
+        Drop the cached details of several recipes of one user.
+
+        The details are dropped again once the transaction on `using`
+        commits, as requests may read the old rows until then.
+        """
+        self._invalidate(user_id, recipe_ids)
+        if transaction.get_connection(using).in_atomic_block:
+            transaction.on_commit(
+                lambda: self._invalidate(user_id, recipe_ids), using=using,
+            )
+
+    def _invalidate(self, user_id, recipe_ids):
+        for pk in recipe_ids:
+            self.local.delete(self.make_key(user_id, pk))
+        cache.set_many({
+            self.make_version_key(user_id, pk): uuid.uuid4().hex
+            for pk in recipe_ids
+        }, self.get_timeout())
+
+    def clear(self):
+        """Drop this process's entries and reset the counters."""
+        self.local.clear()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    def stats(self):
+        """Return the hit and miss counters of this process."""
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = sum(stats.values())
+        hits = stats['local_hits'] + stats['shared_hits']
+        stats['hit_rate'] = hits / lookups if lookups else 0.0
+        stats['local_size'] = len(self.local)
+        return stats
+
+
+recipe_cache = RecipeDetailCache()
@@ -0,0 +1,224 @@
+"""
+Near-duplicate recipe detection with MinHash and locality-sensitive
+hashing.
+
+Each recipe's title and description are reduced to a set of word
+shingles and summarised by a MinHash signature of NUM_PERM values, whose
+agreement estimates the Jaccard similarity of two recipes' shingle sets.
+The signature is split into BANDS bands; recipes sharing any band bucket
+are candidate duplicates, which keeps lookups sub-linear. Candidates are
+confirmed by comparing full signatures against DEDUP_THRESHOLD.
+"""
+import hashlib
+import re
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from core.models import Recipe, RecipeLSHBucket, RecipeSignature
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 2
+# Universal hashing modulo a prime just above 2**32 keeps (a * x + b) exact
+# in uint64 for 32-bit shingle hashes.
+PRIME = np.uint64(4294967311)
+_rng = np.random.RandomState(1729)
+PERM_A = _rng.randint(1, 2 ** 32 - 1, NUM_PERM, dtype=np.uint64)
+PERM_B = _rng.randint(0, 2 ** 32 - 1, NUM_PERM, dtype=np.uint64)
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+EMPTY = np.full(NUM_PERM, np.iinfo(np.uint32).max, np.uint32)
+
+
+def get_threshold():
+    return getattr(settings, 'DEDUP_THRESHOLD', 0.8)
+
+
+# The fields recipe_text() reads.
+TEXT_FIELDS = {'title', 'description'}
+
+
+def recipe_text(recipe):
+    """Return the text a recipe's signature is computed from."""
+    return f'{recipe.title}\n{recipe.description or ""}'
+
+
+def shingles(text):
+    """Return the set of hashed word shingles of `text`."""
+    words = TOKEN_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        grams = words
+    else:
+        grams = [
+            ' '.join(words[i:i + SHINGLE_SIZE])
+            for i in range(len(words) - SHINGLE_SIZE + 1)
+        ]
+    return {zlib.crc32(gram.encode()) for gram in grams}
+
+
+def minhash(text):
+    """Return the MinHash signature of `text` as a uint32 array."""
+    hashes = np.fromiter(shingles(text), np.uint64)
+    if not len(hashes):
+        return EMPTY.copy()
+    values = (PERM_A[:, None] * hashes[None, :] + PERM_B[:, None]) % PRIME
+    return (values.min(axis=1) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+
+def band_buckets(signature):
+    """Return the bucket of each LSH band of a signature."""
+    bands = signature.reshape(BANDS, ROWS)
+    return [
+        int.from_bytes(
+            hashlib.blake2b(band.tobytes(), digest_size=8).digest(),
+            'big',
+            signed=True,
+        )
+        for band in bands
+    ]
+
+
+def similarity(first, second):
+    """Estimate the Jaccard similarity of two signatures."""
+    return float(np.mean(first == second))
+
+
+def compute(item):
+    """Return (id, signature bytes, buckets) for an (id, text) pair."""
+    recipe_id, text = item
+    signature = minhash(text)
+    return recipe_id, signature.tobytes(), band_buckets(signature)
+
+
+def store(recipe_id, user_id, signature, buckets, using):
+    """Replace the stored signature and buckets of a recipe."""
+    with transaction.atomic(using=using):
+        RecipeSignature.objects.using(using).update_or_create(
+            recipe_id=recipe_id, defaults={'minhash': signature},
+        )
+        RecipeLSHBucket.objects.using(using).filter(
+            recipe_id=recipe_id,
+        ).delete()
+        RecipeLSHBucket.objects.using(using).bulk_create([
+            RecipeLSHBucket(
+                recipe_id=recipe_id, user_id=user_id, band=band, bucket=bucket,
+            )
+            for band, bucket in enumerate(buckets)
+        ])
+
+
+def index_recipe(recipe):
+    """Compute and store the signature of a saved recipe."""
+    _, signature, buckets = compute((recipe.pk, recipe_text(recipe)))
+    store(recipe.pk, recipe.user_id, signature, buckets, recipe._state.db)
+
+
+def forget(recipe_ids, using):
+    """Drop stored signatures so find_duplicate_recipes recomputes them."""
+    RecipeSignature.objects.using(using).filter(
+        recipe_id__in=recipe_ids,
+    ).delete()
+    RecipeLSHBucket.objects.using(using).filter(
+        recipe_id__in=recipe_ids,
+    ).delete()
+
+
+def find_candidates(user_id, buckets, using):
+    """Return ids of the user's recipes sharing an LSH bucket."""
+    rows = RecipeLSHBucket.objects.using(using).filter(
+        user_id=user_id, bucket__in=buckets,
+    ).values_list('recipe_id', 'band', 'bucket')
+    return {
+        recipe_id for recipe_id, band, bucket in rows
+        if buckets[band] == bucket
+    }
+
+
+def find_duplicates(recipe):
+    """Return ids of the owner's recipes that likely duplicate `recipe`."""
+    using = recipe._state.db
+    signature = minhash(recipe_text(recipe))
+    buckets = band_buckets(signature)
+    candidates = find_candidates(recipe.user_id, buckets, using)
+    candidates.discard(recipe.pk)
+    if not candidates:
+        return []
+    stored = RecipeSignature.objects.using(using).filter(
+        recipe_id__in=candidates,
+    ).values_list('recipe_id', 'minhash')
+    threshold = get_threshold()
+    return sorted(
+        recipe_id for recipe_id, other in stored
+        if similarity(signature, np.frombuffer(other, np.uint32)) >= threshold
+    )
+
+
+def iter_unsigned(using, batch_size, rebuild=False):
+    """Yield batches of (id, user_id, text) for recipes to sign."""
+    queryset = (
+        Recipe.objects.using(using)
+        .select_related('description_row')
+        .order_by('id')
+    )
+    if not rebuild:
+        queryset = queryset.filter(signature__isnull=True)
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return
+        last_id = batch[-1].id
+        yield [(r.id, r.user_id, recipe_text(r)) for r in batch]
+
+
+def find_clusters(using):
+    """Return {user_id: [sorted ids]} clusters of duplicates on `using`."""
+    parent = {}
+
+    def find(node):
+        while parent.setdefault(node, node) != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    rows = (
+        RecipeLSHBucket.objects.using(using)
+        .order_by('user_id', 'band', 'bucket', 'recipe_id')
+        .values_list('user_id', 'band', 'bucket', 'recipe_id')
+        .iterator(chunk_size=5000)
+    )
+    owners = {}
+    pairs = set()
+    group_key, group = None, []
+    for user_id, band, bucket, recipe_id in rows:
+        owners[recipe_id] = user_id
+        if (user_id, band, bucket) != group_key:
+            pairs.update((group[0], other) for other in group[1:])
+            group_key, group = (user_id, band, bucket), []
+        group.append(recipe_id)
+    pairs.update((group[0], other) for other in group[1:])
+
+    signatures = {}
+    needed = {recipe_id for pair in pairs for recipe_id in pair}
+    for recipe_id, value in RecipeSignature.objects.using(using).filter(
+        recipe_id__in=needed,
+    ).values_list('recipe_id', 'minhash').iterator(chunk_size=5000):
+        signatures[recipe_id] = np.frombuffer(value, np.uint32)
+
+    threshold = get_threshold()
+    for first, second in pairs:
+        if similarity(signatures[first], signatures[second]) >= threshold:
+            parent[find(first)] = find(second)
+
+    clusters = {}
+    for recipe_id in list(parent):
+        clusters.setdefault(find(recipe_id), []).append(recipe_id)
+    result = {}
+    for members in clusters.values():
+        if len(members) > 1:
+            user_id = owners[members[0]]
+            result.setdefault(user_id, []).append(sorted(members))
+    return result
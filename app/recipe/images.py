@@ -0,0 +1,123 @@
+"""
+Recipe image storage and thumbnail rendering.
+
+Uploaded images are stored under a name derived from their content, so
+re-uploading the same picture stores nothing new and the files can be
+cached forever. Thumbnails are rendered by the `recipe.thumbnails` job in
+a pool of RECIPE_THUMBNAIL_WORKERS processes, keeping the CPU heavy
+decoding and resizing off the request path and out of the worker's GIL.
+Images over RECIPE_IMAGE_MAX_PIXELS are refused at upload and never
+decoded, and a job thread waits at most RECIPE_THUMBNAIL_TIMEOUT seconds
+for the pool before the job fails and is retried.
+"""
+import atexit
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from recipe import thumbnails
+
+IMAGE_DIR = 'recipes'
+THUMBNAIL_DIR = 'recipes/thumbs'
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif'}
+
+
+def get_max_pixels():
+    """Return the most pixels an image may decode into."""
+    return getattr(settings, 'RECIPE_IMAGE_MAX_PIXELS', 40_000_000)
+
+
+def get_sizes():
+    """Return the thumbnail sizes to render, smallest first."""
+    return sorted(getattr(settings, 'RECIPE_THUMBNAIL_SIZES',
+                          [128, 512, 1024]))
+
+
+def save_image(upload, image_format):
+    """Store an uploaded image under its content hash; return its name."""
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    extension = EXTENSIONS.get(image_format, '.img')
+    name = f'{IMAGE_DIR}/{digest.hexdigest()[:32]}{extension}'
+    if not default_storage.exists(name):
+        upload.seek(0)
+        name = default_storage.save(name, upload)
+    return name
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return this process's thumbnail pool, or None to render inline."""
+    global _pool
+    workers = getattr(settings, 'RECIPE_THUMBNAIL_WORKERS', 2)
+    if not workers:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # Forking a threaded worker can copy held locks into the child.
+            _pool = ProcessPoolExecutor(
+                workers, mp_context=get_context('spawn'),
+            )
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def shutdown_pool():
+    """Shut down this process's thumbnail pool without waiting for it."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        atexit.unregister(pool.shutdown)
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def render_thumbnails(name):
+    """Render and store thumbnails of a stored image.
+
+    Returns {size: thumbnail name}, with sizes as strings for JSON. Raises
+    TimeoutError if the pool takes longer than RECIPE_THUMBNAIL_TIMEOUT.
+    """
+    with default_storage.open(name) as fh:
+        data = fh.read()
+    sizes = get_sizes()
+    max_pixels = get_max_pixels()
+    pool = get_pool()
+    if pool is None:
+        rendered = thumbnails.render(data, sizes, max_pixels)
+    else:
+        future = pool.submit(thumbnails.render, data, sizes, max_pixels)
+        try:
+            rendered = future.result(
+                timeout=getattr(settings, 'RECIPE_THUMBNAIL_TIMEOUT', 60),
+            )
+        except TimeoutError:
+            # The stuck process would hold up every job queued behind it,
+            # so later jobs get a fresh pool.
+            shutdown_pool()
+            raise
+    stored = {}
+    for size, thumb_name, content in rendered:
+        path = f'{THUMBNAIL_DIR}/{thumb_name}'
+        if not default_storage.exists(path):
+            path = default_storage.save(path, ContentFile(content))
+        stored[str(size)] = path
+    return stored
+
+
+def get_thumbnail_urls(recipe, max_size=None):
+    """Return {size: url} of a recipe's thumbnails up to `max_size`."""
+    return {
+        size: default_storage.url(name)
+        for size, name in (recipe.thumbnails or {}).items()
+        if max_size is None or int(size) <= max_size
+    }
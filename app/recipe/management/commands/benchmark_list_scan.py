@@ -0,0 +1,151 @@
+"""
+Django command to compare list scans with inline and out-of-row descriptions.
+"""
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.models import RecipeDescription
+
+COLUMNS = (
+    'id bigint PRIMARY KEY, user_id bigint, title varchar(255), '
+    'time_minutes integer, price numeric(5, 2), link varchar(255), '
+    'change_seq bigint'
+)
+LIST_COLUMNS = 'id, user_id, title, time_minutes, price, link, change_seq'
+INLINE = 'benchmark_inline_recipe'
+OUT_OF_ROW = 'benchmark_recipe'
+SIDE_TABLE = 'benchmark_recipe_description'
+
+
+class Command(BaseCommand):
+    """Django command to benchmark scanning a user's recipes."""
+    help = ('Fill temporary tables laid out with descriptions inline, as '
+            'recipes used to be stored, and out of row, then time listing '
+            'a user\'s recipes from each.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument(
+            '--description-size', type=int, default=2000,
+            help='Length of each description in characters.',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Scans timed per layout; the best is reported.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        try:
+            self.load(options['recipes'], options['users'],
+                      options['description_size'])
+            # The old list endpoint read whole rows, descriptions included.
+            inline = self.scan(
+                f'SELECT * FROM {INLINE} WHERE user_id = 1 '
+                f'ORDER BY id DESC', options['repeat'],
+            )
+            out_of_row = self.scan(
+                f'SELECT {LIST_COLUMNS} FROM {OUT_OF_ROW} '
+                f'WHERE user_id = 1 ORDER BY id DESC', options['repeat'],
+            )
+            sizes = self.table_sizes()
+        finally:
+            with connection.cursor() as cursor:
+                for table in [INLINE, OUT_OF_ROW, SIDE_TABLE]:
+                    cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+        for name, (seconds, fetched) in [
+            ('inline', inline), ('out-of-row', out_of_row),
+        ]:
+            self.stdout.write(
+                f'{name:>10}: {seconds * 1000:8.2f} ms per scan, '
+                f'{fetched / 1024:8.0f} KiB fetched'
+            )
+        for name, size in sizes.items():
+            self.stdout.write(f'{name:>10}: {size / 1024:8.0f} KiB on disk')
+        self.stdout.write(self.style.SUCCESS(
+            f'Out-of-row scans took {out_of_row[0] / inline[0]:.2f}x as '
+            f'long and fetched {out_of_row[1] / inline[1]:.2f}x the data!'))
+
+    def load(self, count, users, description_size):
+        """Fill both layouts with `count` recipes spread over `users`."""
+        field = RecipeDescription._meta.get_field('text')
+        words = ' '.join(
+            uuid.uuid4().hex[:8] for _ in range(description_size // 9 + 1)
+        )
+        rows = [
+            (pk, pk % users + 1, f'Recipe {pk}', 10, '5.00', '', pk)
+            for pk in range(1, count + 1)
+        ]
+        descriptions = [
+            f'{pk} {words}'[:description_size] for pk, *_ in rows
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {INLINE} '
+                f'({COLUMNS}, description text)'
+            )
+            cursor.execute(f'CREATE TEMPORARY TABLE {OUT_OF_ROW} ({COLUMNS})')
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {SIDE_TABLE} ('
+                f'recipe_id bigint PRIMARY KEY, '
+                f'text {field.db_type(connection)})'
+            )
+            for table in [INLINE, OUT_OF_ROW]:
+                cursor.execute(
+                    f'CREATE INDEX {table}_user ON {table} (user_id)'
+                )
+            cursor.executemany(
+                f'INSERT INTO {INLINE} VALUES '
+                f'(%s, %s, %s, %s, %s, %s, %s, %s)',
+                [row + (text,) for row, text in zip(rows, descriptions)],
+            )
+            cursor.executemany(
+                f'INSERT INTO {OUT_OF_ROW} VALUES '
+                f'(%s, %s, %s, %s, %s, %s, %s)',
+                rows,
+            )
+            cursor.executemany(
+                f'INSERT INTO {SIDE_TABLE} VALUES (%s, %s)',
+                [
+                    (row[0], field.compress(text))
+                    for row, text in zip(rows, descriptions)
+                ],
+            )
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'ANALYZE {INLINE}')
+                cursor.execute(f'ANALYZE {OUT_OF_ROW}')
+
+    def scan(self, sql, repeat):
+        """Return the best time and the bytes fetched for running `sql`."""
+        best = None
+        with connection.cursor() as cursor:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                cursor.execute(sql)
+                rows = cursor.fetchall()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+        fetched = sum(len(str(value)) for row in rows for value in row)
+        return best, fetched
+
+    def table_sizes(self):
+        """Return the on-disk size of each table, on PostgreSQL only."""
+        if connection.vendor != 'postgresql':
+            return {}
+        sizes = {}
+        with connection.cursor() as cursor:
+            for name, table in [
+                ('inline', INLINE),
+                ('out-of-row', OUT_OF_ROW),
+                ('side', SIDE_TABLE),
+            ]:
+                cursor.execute(
+                    'SELECT pg_total_relation_size(%s)', [table],
+                )
+                sizes[name] = cursor.fetchone()[0]
+        return sizes
@@ -0,0 +1,17 @@
+"""
+Django command to rebuild the similar recipes index.
+"""
+from django.core.management.base import BaseCommand
+
+from recipe import similarity
+
+
+class Command(BaseCommand):
+    """Django command to build the TF-IDF similarity index."""
+    help = 'Rebuild the TF-IDF index used by the similar recipes endpoint.'
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        self.stdout.write('Building similarity index...')
+        total = similarity.build_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} recipes!'))
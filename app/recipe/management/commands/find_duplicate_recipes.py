@@ -0,0 +1,80 @@
+"""
+Django command to find near-duplicate recipes.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.sharding import get_shards
+from recipe import dedup
+
+
+class Command(BaseCommand):
+    """Django command to sign recipes and report duplicate clusters."""
+    help = ('Compute missing MinHash signatures and list clusters of '
+            'near-duplicate recipes per user.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of recipes signed per batch.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Number of processes computing signatures.',
+        )
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Recompute the signatures of every recipe.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        workers = max(options['workers'], 1)
+        signed = 0
+        for using in get_shards():
+            signed += self.sign(using, options['batch_size'], workers,
+                                options['rebuild'])
+        self.stdout.write(f'Signed {signed} recipes.')
+
+        total = 0
+        for using in get_shards():
+            for user_id, clusters in dedup.find_clusters(using).items():
+                for members in clusters:
+                    total += 1
+                    ids = ', '.join(str(pk) for pk in members)
+                    self.stdout.write(f'User {user_id}: {ids}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Found {total} duplicate clusters!'))
+
+    def sign(self, using, batch_size, workers, rebuild):
+        """Sign the recipes stored on one shard, returning the count."""
+        signed = 0
+        batches = dedup.iter_unsigned(using, batch_size, rebuild)
+        if workers == 1:
+            for batch in batches:
+                signed += self.store(batch, map(dedup.compute,
+                                                self.texts(batch)), using)
+            return signed
+        # Forked workers must not share the parent's database sockets.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for batch in batches:
+                results = pool.map(dedup.compute, self.texts(batch),
+                                   chunksize=max(len(batch) // workers, 1))
+                signed += self.store(batch, results, using)
+        return signed
+
+    def texts(self, batch):
+        return [(recipe_id, text) for recipe_id, _, text in batch]
+
+    def store(self, batch, results, using):
+        owners = {recipe_id: user_id for recipe_id, user_id, _ in batch}
+        count = 0
+        for recipe_id, signature, buckets in results:
+            dedup.store(recipe_id, owners[recipe_id], signature, buckets,
+                        using)
+            count += 1
+        return count
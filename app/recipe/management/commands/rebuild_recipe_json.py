@@ -0,0 +1,37 @@
+"""
+Django command to render the stored JSON of recipes again.
+"""
+from django.core.management.base import BaseCommand
+
+from core.sharding import get_shards
+from recipe import rendering
+
+
+class Command(BaseCommand):
+    """Django command to rebuild pre-rendered recipe JSON."""
+    help = (
+        'Render the stored list and detail JSON of every recipe, e.g. after '
+        'the recipe serializers and rendering VERSION changed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=rendering.DEFAULT_BATCH_SIZE,
+            help='Recipes rendered per transaction.',
+        )
+        parser.add_argument(
+            '--stale-only', action='store_true',
+            help='Skip recipes whose stored JSON is current.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        rendered = 0
+        for alias in get_shards():
+            rendered += rendering.rebuild(
+                alias,
+                batch_size=options['batch_size'],
+                stale_only=options['stale_only'],
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} recipes!'))
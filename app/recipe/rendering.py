@@ -0,0 +1,186 @@
+"""
+Recipe JSON rendered ahead of reads.
+
+Recipes are read far more often than they are written, so each recipe's
+list and detail representations are rendered once, by the same serializers
+and JSON renderer as live responses, and stored in its RecipeRendering row.
+Reads splice the stored fragments into the response body without building
+any serializer fields.
+
+A rendering is current while its `change_seq` matches the recipe's, which
+every save and bulk update bumps, and its `version` matches VERSION. Writes
+through the API render the recipe again at once; other changes leave the
+rendering stale, or delete it, and the next read renders it again.
+Renderings are upserted in a single statement that never replaces a newer
+one, so concurrent reads rendering the same recipe need no locks. Bump
+VERSION whenever the recipe serializers change, and run
+`manage.py rebuild_recipe_json` to render everything ahead of the reads.
+"""
+import json
+
+from django.db import connections, router
+from django.db.models import prefetch_related_objects
+from django.http import HttpResponse
+from django.utils.functional import cached_property
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from core.models import Recipe, RecipeRendering
+from core.sharding import UserShardLocked
+from recipe.serializers import RecipeDetailSerializer, RecipeSerializer
+
+VERSION = 1
+DEFAULT_BATCH_SIZE = 500
+# The key, then the fields deciding which of two renderings is newer.
+UPSERT_FIELDS = ['recipe', 'change_seq', 'version', 'summary', 'detail']
+
+_renderer = JSONRenderer()
+
+
+def to_json(data):
+    """Return `data` as JSON text, exactly as API responses render it."""
+    return _renderer.render(data).decode()
+
+
+def is_current(recipe):
+    """Return whether the recipe's stored rendering is up to date."""
+    try:
+        rendering = recipe.rendering
+    except RecipeRendering.DoesNotExist:
+        return False
+    return (
+        rendering.change_seq == recipe.change_seq
+        and rendering.version == VERSION
+    )
+
+
+def render(recipes):
+    """Render recipes, attaching an unsaved rendering to each."""
+    prefetch_related_objects(recipes, 'tags', 'ingredients')
+    # Descriptions just saved are still held by their recipes.
+    prefetch_related_objects(
+        [recipe for recipe in recipes if '_description' not in vars(recipe)],
+        'description_row',
+    )
+    for recipe in recipes:
+        recipe.rendering = RecipeRendering(
+            recipe=recipe,
+            change_seq=recipe.change_seq,
+            version=VERSION,
+            summary=to_json(RecipeSerializer(recipe).data),
+            detail=to_json(RecipeDetailSerializer(recipe).data),
+        )
+
+
+def refresh(recipes, using=None):
+    """Render recipes of one shard and store their renderings."""
+    recipes = list(recipes)
+    if not recipes:
+        return
+    render(recipes)
+    if using is None:
+        try:
+            using = router.db_for_write(Recipe, instance=recipes[0])
+        except UserShardLocked:
+            # The owner is being moved; serve the renderings unstored.
+            return
+    store([recipe.rendering for recipe in recipes], using)
+
+
+def store(renderings, using):
+    """Insert or replace renderings, unless a newer one is stored."""
+    connection = connections[using]
+    opts = RecipeRendering._meta
+    fields = [opts.get_field(name) for name in UPSERT_FIELDS]
+    table = connection.ops.quote_name(opts.db_table)
+    columns = [connection.ops.quote_name(field.column) for field in fields]
+    key, seq, version = columns[:3]
+    # ON CONFLICT ... DO UPDATE ... WHERE works on PostgreSQL and SQLite.
+    sql_suffix = (
+        f' ON CONFLICT ({key}) DO UPDATE SET '
+        + ', '.join(f'{column} = excluded.{column}' for column in columns[1:])
+        + f' WHERE {table}.{seq} < excluded.{seq}'
+        f' OR ({table}.{seq} = excluded.{seq}'
+        f' AND {table}.{version} < excluded.{version})'
+    )
+    row = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    batch_size = connection.ops.bulk_batch_size(fields, renderings)
+    with connection.cursor() as cursor:
+        for start in range(0, len(renderings), batch_size):
+            batch = renderings[start:start + batch_size]
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(columns)}) VALUES '
+                + ', '.join([row] * len(batch)) + sql_suffix,
+                [
+                    field.get_db_prep_save(
+                        getattr(rendering, field.attname), connection,
+                    )
+                    for rendering in batch
+                    for field in fields
+                ],
+            )
+
+
+def forget(recipe_ids, using):
+    """Delete the renderings of recipes changed without a save."""
+    RecipeRendering.objects.using(using).filter(
+        recipe_id__in=recipe_ids,
+    ).delete()
+
+
+def get_fragments(recipes, field):
+    """Return the stored `summary` or `detail` JSON of each recipe."""
+    stale = [recipe for recipe in recipes if not is_current(recipe)]
+    refresh(stale)
+    return [getattr(recipe.rendering, field) for recipe in recipes]
+
+
+def join_array(fragments):
+    """Return a JSON array of JSON fragments."""
+    return '[' + ','.join(fragments) + ']'
+
+
+def join_object(items):
+    """Return a JSON object of (key, JSON fragment) pairs."""
+    return '{' + ','.join(
+        f'{to_json(key)}:{fragment}' for key, fragment in items
+    ) + '}'
+
+
+def rebuild(using, batch_size=DEFAULT_BATCH_SIZE, stale_only=False):
+    """Render the recipes stored on `using`; return how many were."""
+    queryset = (
+        Recipe.objects.using(using)
+        .select_related('rendering', 'description_row')
+        .order_by('id')
+    )
+    last_id = 0
+    rendered = 0
+    while True:
+        recipes = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not recipes:
+            return rendered
+        last_id = recipes[-1].id
+        if stale_only:
+            recipes = [recipe for recipe in recipes if not is_current(recipe)]
+        refresh(recipes, using=using)
+        rendered += len(recipes)
+
+
+class JSONFragmentResponse(HttpResponse):
+    """JSON response whose body was spliced from stored fragments."""
+
+    def __init__(self, content, **kwargs):
+        super().__init__(content, content_type='application/json', **kwargs)
+
+    @cached_property
+    def data(self):
+        """The decoded body, as a DRF Response would hold it."""
+        return json.loads(self.content)
+
+
+def respond(request, content, **kwargs):
+    """Return spliced JSON as is, or decoded for other renderers."""
+    if request.accepted_renderer.format == 'json':
+        return JSONFragmentResponse(content, **kwargs)
+    return Response(json.loads(content), **kwargs)
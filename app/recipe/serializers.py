@@ -1,32 +1,174 @@
 """
 Serializers for recipe APIs
 """
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import router, transaction
 from rest_framework import serializers
 
-from core.models import Recipe
+from core.models import Ingredient, Recipe, Tag
+from recipe import images
+
+
+class TagSerializer(serializers.ModelSerializer):
+    """Serializer for tags."""
+
+    class Meta:
+        model = Tag
+        fields = ['id', 'name']
+        read_only_fields = ['id']
+
+
+class IngredientSerializer(serializers.ModelSerializer):
+    """Serializer for ingredients."""
+
+    class Meta:
+        model = Ingredient
+        fields = ['id', 'name']
+        read_only_fields = ['id']
 
 
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializer for recipes."""
+    tags = TagSerializer(many=True, required=False)
+    ingredients = IngredientSerializer(many=True, required=False)
+    thumbnails = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
         fields = [
-            'id', 'title', 'time_minutes', 'price', 'link',
-            'description', 'user'
+            'id', 'title', 'time_minutes', 'price', 'link', 'user',
+            'tags', 'ingredients', 'thumbnails',
         ]
         read_only_fields = ['id', 'user']
-        extra_kwargs = {
-            'description': {'required': True}
+
+    def _pop_related(self, validated_data):
+        """Remove and return the nested tags and ingredients given."""
+        return {
+            name: validated_data.pop(name)
+            for name in ['tags', 'ingredients']
+            if name in validated_data
         }
 
+    def _set_related(self, recipe, related):
+        """Link the recipe to its named tags and ingredients."""
+        for name, items in related.items():
+            model = Recipe._meta.get_field(name).related_model
+            names = list(dict.fromkeys(item['name'] for item in items))
+            objs = model.objects.get_or_create_named(recipe.user_id, names)
+            getattr(recipe, name).set([objs[item] for item in names])
+
+    def create(self, validated_data):
+        """Create a recipe with its tags and ingredients."""
+        related = self._pop_related(validated_data)
+        recipe = Recipe(**validated_data)
+        using = router.db_for_write(Recipe, instance=recipe)
+        with transaction.atomic(using=using):
+            recipe.save(force_insert=True)
+            self._set_related(recipe, related)
+        return recipe
+
+    def update(self, instance, validated_data):
+        """Update a recipe, replacing any tags or ingredients given."""
+        related = self._pop_related(validated_data)
+        using = router.db_for_write(Recipe, instance=instance)
+        # Saving after the links bumps the recipe's change sequence and
+        # invalidates its cached detail with the new links in place.
+        with transaction.atomic(using=using):
+            self._set_related(instance, related)
+            return super().update(instance, validated_data)
+
+    def get_thumbnails(self, obj):
+        """Return the URLs of the thumbnails small enough for lists."""
+        return images.get_thumbnail_urls(
+            obj,
+            getattr(settings, 'RECIPE_LIST_THUMBNAIL_MAX_SIZE', 256),
+        )
+
 
 class RecipeDetailSerializer(RecipeSerializer):
     """Serializer for recipe detail view."""
+    # Stored out of row in RecipeDescription, so only detail views read it.
+    description = serializers.CharField(
+        allow_blank=True,
+        style={'base_template': 'textarea.html'},
+    )
+    image = serializers.SerializerMethodField()
+
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ['description']
+        fields = RecipeSerializer.Meta.fields + ['description', 'image']
         read_only_fields = RecipeSerializer.Meta.read_only_fields
-        extra_kwargs = {
-            'description': {'required': True}
-        }
 
+    def get_image(self, obj):
+        """Return the URL of the recipe's image, or None."""
+        return default_storage.url(obj.image.name) if obj.image else None
+
+    def get_thumbnails(self, obj):
+        """Return the URLs of all of the recipe's thumbnails."""
+        return images.get_thumbnail_urls(obj)
+
+
+class RecipeCreateSerializer(RecipeDetailSerializer):
+    """Serializer for creating a recipe, flagging likely duplicates."""
+    possible_duplicates = serializers.SerializerMethodField()
+
+    class Meta(RecipeDetailSerializer.Meta):
+        fields = RecipeDetailSerializer.Meta.fields + ['possible_duplicates']
+
+    def get_possible_duplicates(self, obj):
+        return getattr(obj, 'possible_duplicates', [])
+
+
+class SimilarRecipeSerializer(RecipeSerializer):
+    """Serializer for a recipe with its similarity score."""
+    score = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ['score']
+
+
+class RecipeExportSerializer(serializers.Serializer):
+    """Serializer for requesting an export of the user's recipes."""
+    format = serializers.ChoiceField(
+        choices=['ndjson', 'csv'],
+        default='ndjson',
+    )
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    """Serializer for requesting several recipes by id."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+    )
+
+    def validate_ids(self, value):
+        """Drop repeated ids and enforce the maximum batch size."""
+        ids = list(dict.fromkeys(value))
+        max_size = getattr(settings, 'RECIPE_BATCH_MAX_SIZE', 100)
+        if len(ids) > max_size:
+            raise serializers.ValidationError(
+                f'Ensure this field has no more than {max_size} ids.'
+            )
+        return ids
+
+
+class RecipeImageSerializer(serializers.Serializer):
+    """Serializer for uploading an image of a recipe."""
+    image = serializers.ImageField()
 
+    def validate_image(self, value):
+        """Enforce the maximum upload size and pixel count."""
+        max_size = getattr(settings, 'RECIPE_IMAGE_MAX_SIZE', 10 * 1024 ** 2)
+        if value.size > max_size:
+            raise serializers.ValidationError(
+                f'Ensure the image is no larger than {max_size} bytes.'
+            )
+        # A small, highly compressed file can decode into a huge image.
+        width, height = value.image.size
+        max_pixels = images.get_max_pixels()
+        if width * height > max_pixels:
+            raise serializers.ValidationError(
+                f'Ensure the image has no more than {max_pixels} pixels.'
+            )
+        return value
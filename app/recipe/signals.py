@@ -0,0 +1,101 @@
+"""
+Signal handlers for the recipe app.
+"""
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete,
+)
+from django.dispatch import receiver
+
+from core.models import Ingredient, Recipe, Tag, recipes_bulk_updated
+from recipe import rendering
+from recipe.cache import recipe_cache
+
+# recipe.dedup and recipe.similarity load numpy, which is slow to import, so
+# they are imported by the handlers on first use rather than at startup.
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, using, **kwargs):
+    """Invalidate the cached detail and similarity row of a recipe."""
+    from recipe import similarity
+    recipe_cache.invalidate(instance.user_id, instance.pk, using)
+    similarity.mark_changed(instance.pk, instance.user_id, using)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, raw, **kwargs):
+    """Refresh the MinHash signature of a saved recipe."""
+    from recipe import dedup
+    if not raw:
+        dedup.index_recipe(instance)
+
+
+@receiver(recipes_bulk_updated, sender=Recipe)
+def recipes_changed(sender, pairs, fields, using, **kwargs):
+    """Invalidate recipes changed by a bulk update.
+
+    Signatures are only dropped when their text changed, so updates of
+    other fields keep recipes in duplicate detection.
+    """
+    from recipe import dedup, similarity
+    by_user = {}
+    for recipe_id, user_id in pairs:
+        by_user.setdefault(user_id, []).append(recipe_id)
+        similarity.mark_changed(recipe_id, user_id, using)
+    for user_id, recipe_ids in by_user.items():
+        recipe_cache.invalidate_many(user_id, recipe_ids, using)
+    if fields & dedup.TEXT_FIELDS:
+        dedup.forget([recipe_id for recipe_id, _ in pairs], using)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_links_changed(sender, instance, action, reverse, pk_set,
+                         using, **kwargs):
+    """Drop the rendering and cached detail of recipes relinked."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif action == 'pre_clear':
+        recipe_ids = list(instance.recipes.values_list('pk', flat=True))
+    else:
+        recipe_ids = list(pk_set)
+    if recipe_ids:
+        rendering.forget(recipe_ids, using)
+        recipe_cache.invalidate_many(instance.user_id, recipe_ids, using)
+
+
+def mark_label_recipes_changed(label, using):
+    """Bump the change_seq of the recipes showing a tag or ingredient.
+
+    Their renderings go stale from the new change_seq, the change feed
+    reports them and recipes_changed invalidates their cached details.
+    """
+    recipe_ids = list(label.recipes.using(using).values_list(
+        'pk', flat=True,
+    ))
+    if recipe_ids:
+        Recipe.objects.using(using).filter(pk__in=recipe_ids).update()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def recipe_label_saved(sender, instance, created, raw, using, **kwargs):
+    """Mark the recipes showing a renamed label as changed."""
+    if created or raw:
+        return
+    mark_label_recipes_changed(instance, using)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def recipe_label_deleted(sender, instance, using, **kwargs):
+    """Mark the recipes showing a deleted label as changed.
+
+    The links are removed without m2m_changed, so the recipes are found
+    before the delete. It runs in the delete's transaction, so the new
+    change_seq and the removed links are committed together.
+    """
+    mark_label_recipes_changed(instance, using)
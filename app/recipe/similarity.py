@@ -0,0 +1,353 @@
+"""
+TF-IDF index used to find similar recipes.
+
+The index is a sparse CSR matrix of L2-normalised TF-IDF vectors over each
+recipe's title and description, with rows grouped by owner. It is written
+to SIMILARITY_INDEX_DIR as plain `.npy` arrays which every process maps
+into memory read-only, so workers share one copy through the page cache.
+
+Changes made after a build are written as small delta segments next to
+the base arrays; rows in a delta replace the base rows with the same id.
+Once there are more than SIMILARITY_MAX_DELTAS segments the index is
+rebuilt from scratch.
+
+Each build writes a new generation directory and then points CURRENT at
+it. The previous generation is kept until the next build, so processes
+still loading it are not cut off, and a delta that lands in it after the
+switch is written again to the new one.
+"""
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+
+from core import jobs
+from core.models import Recipe
+from core.sharding import get_shards
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset(
+    'a an and are as at be by for from in into is it of on or the to '
+    'with'.split()
+)
+TITLE_WEIGHT = 2
+BUILD_CHUNK_SIZE = 1000
+
+_local = threading.local()
+_index_lock = threading.Lock()
+_loaded = {'key': None, 'index': None}
+
+
+class IndexNotBuilt(Exception):
+    """Raised when no similarity index has been built yet."""
+
+
+def get_index_dir():
+    return Path(getattr(
+        settings, 'SIMILARITY_INDEX_DIR',
+        Path(settings.MEDIA_ROOT) / 'similarity',
+    ))
+
+
+def tokenize(recipe):
+    """Return the weighted terms of a recipe's title and description."""
+    title = TOKEN_RE.findall(recipe.title.lower())
+    description = TOKEN_RE.findall((recipe.description or '').lower())
+    terms = title * TITLE_WEIGHT + description
+    return [term for term in terms if term not in STOP_WORDS]
+
+
+def vectorize(terms, vocab, idf):
+    """Return (columns, weights) of the normalised TF-IDF vector."""
+    counts = Counter(term for term in terms if term in vocab)
+    if not counts:
+        return np.empty(0, np.int32), np.empty(0, np.float32)
+    columns = np.fromiter((vocab[t] for t in counts), np.int32, len(counts))
+    tf = np.fromiter(counts.values(), np.float32, len(counts))
+    weights = (1 + np.log(tf)) * idf[columns]
+    order = np.argsort(columns)
+    columns, weights = columns[order], weights[order]
+    return columns, weights / np.linalg.norm(weights)
+
+
+def _stack_rows(rows):
+    """Return CSR arrays (indptr, indices, data) for (cols, vals) rows."""
+    indptr = np.zeros(len(rows) + 1, np.int64)
+    indptr[1:] = np.cumsum([len(cols) for cols, _ in rows])
+    if rows:
+        indices = np.concatenate([cols for cols, _ in rows]).astype(np.int32)
+        data = np.concatenate([vals for _, vals in rows]).astype(np.float32)
+    else:
+        indices = np.empty(0, np.int32)
+        data = np.empty(0, np.float32)
+    return indptr, indices, data
+
+
+def iter_all_recipes():
+    """Yield every recipe on every shard, ordered by owner and id."""
+    for alias in get_shards():
+        queryset = (
+            Recipe.objects.using(alias)
+            .select_related('description_row')
+            .order_by('user_id', 'id')
+        )
+        yield from queryset.iterator(chunk_size=BUILD_CHUNK_SIZE)
+
+
+def build_index(index_dir=None):
+    """Build a new index generation and make it current."""
+    index_dir = Path(index_dir or get_index_dir())
+    index_dir.mkdir(parents=True, exist_ok=True)
+
+    documents = []
+    df = Counter()
+    for recipe in iter_all_recipes():
+        terms = tokenize(recipe)
+        documents.append((recipe.user_id, recipe.id, terms))
+        df.update(set(terms))
+    documents.sort(key=lambda doc: (doc[0], doc[1]))
+
+    vocab = {term: column for column, term in enumerate(sorted(df))}
+    total = len(documents)
+    idf = np.array(
+        [math.log((1 + total) / (1 + df[term])) + 1 for term in sorted(df)],
+        np.float32,
+    )
+    rows = [vectorize(terms, vocab, idf) for _, _, terms in documents]
+    indptr, indices, data = _stack_rows(rows)
+
+    generation = f'gen-{time.time_ns()}'
+    tmp = index_dir / f'{generation}.tmp'
+    tmp.mkdir()
+    np.save(tmp / 'users.npy', np.array([d[0] for d in documents], np.int64))
+    np.save(tmp / 'ids.npy', np.array([d[1] for d in documents], np.int64))
+    np.save(tmp / 'indptr.npy', indptr)
+    np.save(tmp / 'indices.npy', indices)
+    np.save(tmp / 'data.npy', data)
+    np.save(tmp / 'idf.npy', idf)
+    (tmp / 'vocab.json').write_text(json.dumps(vocab))
+    (tmp / 'delta').mkdir()
+    os.replace(tmp, index_dir / generation)
+
+    previous = _read_current(index_dir)
+    current = index_dir / f'CURRENT.{generation}.tmp'
+    current.write_text(generation)
+    os.replace(current, index_dir / 'CURRENT')
+    # Readers may still be loading the previous generation; older ones
+    # have had a whole build to finish.
+    keep = {generation, previous}
+    for child in index_dir.glob('gen-*'):
+        if child.suffix != '.tmp' and child.name not in keep:
+            shutil.rmtree(child, ignore_errors=True)
+    return total
+
+
+def _read_current(index_dir):
+    try:
+        return (index_dir / 'CURRENT').read_text().strip()
+    except FileNotFoundError:
+        return None
+
+
+class SimilarityIndex:
+    """A memory-mapped base index plus in-memory delta segments."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        load = {'mmap_mode': 'r'}
+        self.users = np.load(self.path / 'users.npy', **load)
+        self.ids = np.load(self.path / 'ids.npy', **load)
+        self.indptr = np.load(self.path / 'indptr.npy', **load)
+        self.indices = np.load(self.path / 'indices.npy', **load)
+        self.data = np.load(self.path / 'data.npy', **load)
+        self.idf = np.load(self.path / 'idf.npy', **load)
+        self.vocab = json.loads((self.path / 'vocab.json').read_text())
+        self.deltas = {}
+        for name in sorted(os.listdir(self.path / 'delta')):
+            with np.load(self.path / 'delta' / name) as segment:
+                self._apply_delta(segment)
+
+    def _apply_delta(self, segment):
+        indptr = segment['indptr']
+        for row, recipe_id in enumerate(segment['ids'].tolist()):
+            start, end = indptr[row], indptr[row + 1]
+            self.deltas[recipe_id] = (
+                int(segment['users'][row]),
+                segment['indices'][start:end],
+                segment['data'][start:end],
+            )
+        for recipe_id in segment['removed'].tolist():
+            self.deltas[recipe_id] = None
+
+    def get_vector(self, recipe):
+        """Return the (columns, weights) vector of a recipe."""
+        if recipe.id in self.deltas and self.deltas[recipe.id] is not None:
+            _, columns, weights = self.deltas[recipe.id]
+            return columns, weights
+        lo, hi = self._user_rows(recipe.user_id)
+        position = lo + np.searchsorted(self.ids[lo:hi], recipe.id)
+        if position < hi and self.ids[position] == recipe.id:
+            start, end = self.indptr[position], self.indptr[position + 1]
+            return self.indices[start:end], self.data[start:end]
+        return vectorize(tokenize(recipe), self.vocab, self.idf)
+
+    def _user_rows(self, user_id):
+        lo = np.searchsorted(self.users, user_id, side='left')
+        hi = np.searchsorted(self.users, user_id, side='right')
+        return int(lo), int(hi)
+
+    def similar(self, recipe, limit=10):
+        """Return [(recipe_id, score)] of the owner's most similar recipes."""
+        columns, weights = self.get_vector(recipe)
+        query = np.zeros(len(self.idf), np.float32)
+        query[columns] = weights
+
+        lo, hi = self._user_rows(recipe.user_id)
+        start, end = self.indptr[lo], self.indptr[hi]
+        products = self.data[start:end] * query[self.indices[start:end]]
+        sums = np.concatenate(([0.0], np.cumsum(products, dtype=np.float64)))
+        offsets = self.indptr[lo:hi + 1] - start
+        scores = sums[offsets[1:]] - sums[offsets[:-1]]
+        ids = np.asarray(self.ids[lo:hi])
+
+        if self.deltas:
+            stale = np.isin(ids, np.fromiter(self.deltas, np.int64))
+            scores[stale] = 0.0
+            extra_ids, extra_scores = [], []
+            for recipe_id, row in self.deltas.items():
+                if row is not None and row[0] == recipe.user_id:
+                    extra_ids.append(recipe_id)
+                    extra_scores.append(float(np.dot(row[2], query[row[1]])))
+            ids = np.concatenate((ids, np.array(extra_ids, np.int64)))
+            scores = np.concatenate((scores, np.array(extra_scores)))
+
+        scores[ids == recipe.id] = 0.0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            top = np.argpartition(-scores[candidates], limit - 1)[:limit]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(ids[i]), float(scores[i])) for i in candidates]
+
+
+def get_index():
+    """Return the current index, reloading it when it has changed."""
+    index_dir = get_index_dir()
+    generation = _read_current(index_dir)
+    if generation is None:
+        raise IndexNotBuilt()
+    path = index_dir / generation
+    try:
+        key = (str(path), os.stat(path / 'delta').st_mtime_ns)
+        with _index_lock:
+            if _loaded['key'] != key:
+                _loaded['index'] = SimilarityIndex(path)
+                _loaded['key'] = key
+            return _loaded['index']
+    except FileNotFoundError:
+        # Two builds finished since CURRENT was read; load the new one.
+        if _read_current(index_dir) == generation:
+            raise IndexNotBuilt()
+        return get_index()
+
+
+def write_delta(changes):
+    """Record new vectors for changed recipes as a delta segment.
+
+    Return the number of segments of the current generation.
+    """
+    index_dir = get_index_dir()
+    while True:
+        generation = _read_current(index_dir)
+        if generation is None:
+            return 0
+        try:
+            segments = _write_delta(index_dir / generation, changes)
+        except FileNotFoundError:
+            segments = None
+        # A build that switched generations meanwhile may not have seen
+        # these changes, so write them to the new generation as well.
+        if segments is not None and _read_current(index_dir) == generation:
+            return segments
+
+
+def _write_delta(path, changes):
+    """Write a delta segment for `changes` to the generation at `path`."""
+    index = SimilarityIndex(path)
+
+    by_user = {}
+    for recipe_id, user_id in changes:
+        by_user.setdefault(user_id, set()).add(recipe_id)
+    found = []
+    for user_id, recipe_ids in by_user.items():
+        recipes = (
+            Recipe.objects.for_user(user_id)
+            .filter(id__in=recipe_ids)
+            .select_related('description_row')
+        )
+        found.extend(recipes)
+    removed = sorted({recipe_id for recipe_id, _ in changes} -
+                     {recipe.id for recipe in found})
+
+    rows = [vectorize(tokenize(r), index.vocab, index.idf) for r in found]
+    indptr, indices, data = _stack_rows(rows)
+    name = f'{time.time_ns()}-{os.getpid()}.npz'
+    tmp = path / f'{name}.tmp'
+    with open(tmp, 'wb') as fh:
+        np.savez(
+            fh,
+            ids=np.array([r.id for r in found], np.int64),
+            users=np.array([r.user_id for r in found], np.int64),
+            indptr=indptr,
+            indices=indices,
+            data=data,
+            removed=np.array(removed, np.int64),
+        )
+    os.replace(tmp, path / 'delta' / name)
+    return len(os.listdir(path / 'delta'))
+
+
+class _PendingChanges:
+    """Changed recipes of one transaction, queued when it commits."""
+
+    def __init__(self):
+        self.changes = set()
+        self.queued = False
+
+    def __call__(self):
+        self.queued = True
+        jobs.enqueue(
+            'recipe.similarity_update',
+            {'changes': sorted(self.changes)},
+        )
+
+
+def mark_changed(recipe_id, user_id, using):
+    """Queue a delta update for a recipe once the transaction commits."""
+    if _read_current(get_index_dir()) is None:
+        # The first build will include the recipe.
+        return
+    connection = connections[using]
+    pending = getattr(_local, using, None)
+    open_batch = (
+        pending is not None
+        and not pending.queued
+        and connection.in_atomic_block
+        and any(func is pending for _, func in connection.run_on_commit)
+    )
+    if open_batch:
+        pending.changes.add((recipe_id, user_id))
+        return
+    pending = _PendingChanges()
+    pending.changes.add((recipe_id, user_id))
+    setattr(_local, using, pending)
+    transaction.on_commit(pending, using=using)
@@ -0,0 +1,111 @@
+"""
+Background job handlers for the recipe app.
+"""
+import csv
+import json
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from core import jobs
+from core.models import Recipe
+from recipe import images, rendering, similarity
+from recipe.serializers import RecipeDetailSerializer
+
+EXPORT_CHUNK_SIZE = 500
+EXPORT_FIELDS = [
+    'id', 'title', 'time_minutes', 'price', 'link', 'description',
+]
+
+
+def iter_chunks(queryset):
+    """Yield the objects in id order, loading EXPORT_CHUNK_SIZE at a time."""
+    # iterator() ignores prefetch_related, so chunks are sliced by id.
+    last_id = 0
+    while True:
+        chunk = list(
+            queryset.filter(id__gt=last_id).order_by('id')[:EXPORT_CHUNK_SIZE]
+        )
+        if not chunk:
+            return
+        yield from chunk
+        last_id = chunk[-1].id
+
+
+def write_ndjson(recipes, fh):
+    """Write one JSON document per recipe."""
+    for recipe in recipes:
+        data = RecipeDetailSerializer(recipe).data
+        fh.write(json.dumps(data, cls=DjangoJSONEncoder))
+        fh.write('\n')
+
+
+def write_csv(recipes, fh):
+    """Write recipes as CSV rows with a header."""
+    writer = csv.DictWriter(fh, fieldnames=EXPORT_FIELDS,
+                            extrasaction='ignore')
+    writer.writeheader()
+    for recipe in recipes:
+        writer.writerow(RecipeDetailSerializer(recipe).data)
+
+
+WRITERS = {
+    'ndjson': write_ndjson,
+    'csv': write_csv,
+}
+
+
+@jobs.register('recipe.export')
+def export_recipes(job):
+    """Export all of the job user's recipes to a downloadable file."""
+    fmt = job.payload.get('format', 'ndjson')
+    queryset = Recipe.objects.for_user(job.user_id)
+    recipes = iter_chunks(
+        queryset.select_related('description_row')
+        .prefetch_related('tags', 'ingredients')
+    )
+    with tempfile.TemporaryFile('w+', newline='') as fh:
+        WRITERS[fmt](recipes, fh)
+        count = queryset.count()
+        fh.seek(0)
+        name = default_storage.save(
+            f'exports/recipes-{job.pk}.{fmt}', File(fh),
+        )
+    return {'file': name, 'format': fmt, 'count': count}
+
+
+@jobs.register('recipe.similarity_update')
+def update_similarity_index(job):
+    """Apply changed recipes to the similarity index."""
+    deltas = similarity.write_delta(
+        [tuple(change) for change in job.payload['changes']]
+    )
+    if deltas > getattr(settings, 'SIMILARITY_MAX_DELTAS', 50):
+        return {'rebuilt': similarity.build_index()}
+    return {'deltas': deltas}
+
+
+@jobs.register('recipe.thumbnails')
+def render_recipe_thumbnails(job):
+    """Render thumbnails of a recipe's uploaded image."""
+    name = job.payload['image']
+    queryset = Recipe.objects.for_user(job.user_id).filter(
+        pk=job.payload['recipe_id'], image=name,
+    )
+    if not queryset.exists():
+        return {'skipped': 'The image has been replaced.'}
+    stored = images.render_thumbnails(name)
+    locked = queryset.select_for_update()
+    with transaction.atomic(using=locked.db):
+        # Lock the recipe, so a newer image is never given these thumbnails.
+        recipe = locked.first()
+        if recipe is None:
+            return {'skipped': 'The image has been replaced.'}
+        recipe.thumbnails = stored
+        recipe.save(update_fields=['thumbnails'])
+        rendering.refresh([recipe])
+    return {'thumbnails': stored}
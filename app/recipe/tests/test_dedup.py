@@ -0,0 +1,165 @@
+"""
+Tests for near-duplicate recipe detection.
+"""
+from decimal import Decimal
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, RecipeLSHBucket, RecipeSignature, Tag
+from core.sharding import shard_for_user
+from recipe import dedup
+
+RECIPES_URL = reverse('recipe:recipe-list')
+DESCRIPTION = (
+    'Boil the spaghetti in salted water, fry the pancetta until crisp, '
+    'whisk eggs with grated pecorino and toss everything off the heat '
+    'with plenty of black pepper'
+)
+
+
+def create_recipe(user, title, description=DESCRIPTION):
+    """Create and return a recipe."""
+    return Recipe.objects.create(
+        user=user,
+        title=title,
+        description=description,
+        time_minutes=10,
+        price=Decimal('5.00'),
+    )
+
+
+class MinHashTests(TestCase):
+    """Test MinHash signatures."""
+
+    def test_identical_text_same_signature(self):
+        """Test identical text always hashes to the same signature."""
+        first = dedup.minhash(DESCRIPTION)
+        second = dedup.minhash(DESCRIPTION)
+
+        self.assertEqual(len(first), dedup.NUM_PERM)
+        self.assertEqual(dedup.similarity(first, second), 1.0)
+
+    def test_similarity_tracks_overlap(self):
+        """Test small edits stay similar while unrelated text does not."""
+        original = dedup.minhash(DESCRIPTION)
+        edited = dedup.minhash(DESCRIPTION + ' and serve')
+        other = dedup.minhash('Slow roast lamb shoulder with rosemary')
+
+        self.assertGreaterEqual(dedup.similarity(original, edited), 0.8)
+        self.assertLess(dedup.similarity(original, other), 0.2)
+
+
+class DuplicateDetectionTests(TestCase):
+    """Test flagging duplicates of saved recipes."""
+    databases = set(settings.RECIPE_SHARDS)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        shard = shard_for_user(self.user.pk)
+        self.signatures = RecipeSignature.objects.using(shard)
+        self.buckets = RecipeLSHBucket.objects.using(shard)
+
+    def test_saving_recipe_stores_signature(self):
+        """Test saving a recipe stores its signature and LSH buckets."""
+        recipe = create_recipe(self.user, 'Carbonara')
+
+        self.assertTrue(
+            self.signatures.filter(recipe=recipe).exists())
+        self.assertEqual(
+            self.buckets.filter(recipe=recipe).count(),
+            dedup.BANDS,
+        )
+
+        recipe.title = 'Spaghetti carbonara'
+        recipe.save()
+
+        self.assertEqual(
+            self.buckets.filter(recipe=recipe).count(),
+            dedup.BANDS,
+        )
+
+    def test_create_flags_possible_duplicates(self):
+        """Test creating a recipe returns the owner's likely duplicates."""
+        original = create_recipe(self.user, 'Carbonara')
+        create_recipe(self.user, 'Lamb', 'Slow roast lamb with rosemary')
+        other_user = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        create_recipe(other_user, 'Carbonara')
+        payload = {
+            'title': 'Carbonara',
+            'time_minutes': 10,
+            'price': Decimal('5.00'),
+            'description': DESCRIPTION + ' and serve',
+        }
+
+        res = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['possible_duplicates'], [original.id])
+
+    def test_create_unique_recipe(self):
+        """Test a recipe unlike any other has no possible duplicates."""
+        create_recipe(self.user, 'Carbonara')
+        payload = {
+            'title': 'Lamb',
+            'time_minutes': 90,
+            'price': Decimal('12.00'),
+            'description': 'Slow roast lamb shoulder with rosemary',
+        }
+
+        res = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['possible_duplicates'], [])
+
+    def test_bulk_update_keeps_signature_unless_text_changes(self):
+        """Test only bulk updates of the signed text drop signatures."""
+        recipe = create_recipe(self.user, 'Carbonara')
+        tag = Tag.objects.create(user=self.user, name='Pasta')
+        recipe.tags.add(tag)
+        recipes = Recipe.objects.for_user(self.user).filter(id=recipe.id)
+
+        recipes.update(time_minutes=20)
+        tag.name = 'Italian'
+        tag.save()
+        self.assertTrue(self.signatures.filter(recipe=recipe).exists())
+        self.assertEqual(self.buckets.filter(recipe=recipe).count(),
+                         dedup.BANDS)
+
+        recipes.update(title='Spaghetti carbonara')
+        self.assertFalse(self.signatures.filter(recipe=recipe).exists())
+
+    def test_find_duplicate_recipes_command(self):
+        """Test the command signs stale recipes and prints clusters."""
+        first = create_recipe(self.user, 'Carbonara')
+        second = create_recipe(self.user, 'Carbonara again')
+        create_recipe(self.user, 'Lamb', 'Slow roast lamb with rosemary')
+        Recipe.objects.for_user(self.user).filter(id=second.id).update(
+            title='Carbonara',
+        )
+        self.assertFalse(
+            self.signatures.filter(recipe=second).exists())
+        out = StringIO()
+
+        call_command('find_duplicate_recipes', workers=1, stdout=out)
+
+        self.assertTrue(
+            self.signatures.filter(recipe=second).exists())
+        self.assertIn(f'User {self.user.id}: {first.id}, {second.id}',
+                      out.getvalue())
+        self.assertIn('Found 1 duplicate clusters', out.getvalue())
@@ -0,0 +1,279 @@
+"""
+Query-count and memory contracts for the recipe API.
+"""
+import tempfile
+import uuid
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import sync
+from core.models import Ingredient, Recipe, RecipeRendering, Tag
+from core.testing import KB, PerformanceContractMixin
+from core.throttling import reset_throttles
+from recipe import rendering, similarity
+from recipe.cache import recipe_cache
+
+RECIPES_URL = reverse('recipe:recipe-list')
+EXPORT_URL = reverse('recipe:recipe-export')
+CACHE_STATS_URL = reverse('recipe:recipe-cache-stats')
+CHANGES_URL = reverse('recipe:recipe-changes')
+BATCH_URL = reverse('recipe:recipe-batch')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def similar_url(recipe_id):
+    """Create and return a similar recipes URL."""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+# The budgets are for a single recipe shard. Sharding adds directory
+# lookups and id block reservations, which core/tests/test_sharding.py
+# covers.
+@override_settings(RECIPE_SHARDS=['default'])
+class RecipePerformanceTests(PerformanceContractMixin, TestCase):
+    """Test the recipe endpoints stay within their budgets."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.count = 0
+        recipe_cache.clear()
+        reset_throttles()
+
+    def grow(self, size):
+        """Give the user `size` recipes, the newest becoming the target."""
+        while self.count < size:
+            self.count += 1
+            self.target = Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe number {self.count}',
+                time_minutes=10,
+                price=Decimal('5.00'),
+                description=f'Steps for recipe number {self.count}',
+            )
+            self.target.tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {self.count}'),
+            )
+            self.target.ingredients.add(Ingredient.objects.create(
+                user=self.user, name=f'Ingredient {self.count}',
+            ))
+            rendering.refresh([self.target])
+
+    def payload(self):
+        return {
+            'title': 'Updated recipe',
+            'time_minutes': 20,
+            'price': Decimal('7.50'),
+            'description': 'Updated description',
+        }
+
+    def test_list(self):
+        """Test listing recipes runs a fixed number of queries."""
+        self.assertPerformance(
+            self.grow,
+            lambda: self.client.get(RECIPES_URL),
+            queries=2,
+            memory_per_item=12 * KB,
+            status_code=status.HTTP_200_OK,
+        )
+
+    def test_list_renders_stale(self):
+        """Test stale recipes are rendered again without an N+1."""
+        def grow(size):
+            self.grow(size)
+            RecipeRendering.objects.all().delete()
+
+        self.assertPerformance(
+            grow,
+            lambda: self.client.get(RECIPES_URL),
+            queries=6,
+            memory_per_item=16 * KB,
+            status_code=status.HTTP_200_OK,
+        )
+
+    def test_create(self):
+        """Test creating a recipe does not scan the user's recipes."""
+        self.assertPerformance(
+            self.grow,
+            lambda: self.client.post(RECIPES_URL, {
+                **self.payload(),
+                # Unrelated text, so no duplicate candidates are found.
+                'title': uuid.uuid4().hex,
+                'description': uuid.uuid4().hex,
+            }),
+            queries=23,
+            status_code=status.HTTP_201_CREATED,
+        )
+
+    def test_create_with_tags(self):
+        """Test nested tags and ingredients are created in bulk."""
+        def request():
+            names = [uuid.uuid4().hex for _ in range(self.count)]
+            return self.client.post(RECIPES_URL, {
+                **self.payload(),
+                'title': uuid.uuid4().hex,
+                'description': uuid.uuid4().hex,
+                'tags': [{'name': name} for name in names],
+                'ingredients': [{'name': name} for name in names],
+            }, format='json')
+
+        self.assertPerformance(
+            self.grow,
+            request,
+            queries=37,
+            memory_per_item=4 * KB,
+            status_code=status.HTTP_201_CREATED,
+        )
+
+    def test_retrieve(self):
+        """Test retrieving a recipe with a cold cache."""
+        def request():
+            recipe_cache.clear()
+            return self.client.get(detail_url(self.target.id))
+
+        self.assertPerformance(
+            self.grow,
+            request,
+            queries=2,
+            status_code=status.HTTP_200_OK,
+        )
+
+    def test_retrieve_cached(self):
+        """Test a cached recipe is served with only the auth query."""
+        def grow(size):
+            self.grow(size)
+            self.client.get(detail_url(self.target.id))
+
+        self.assertPerformance(
+            grow,
+            lambda: self.client.get(detail_url(self.target.id)),
+            queries=1,
+            status_code=status.HTTP_200_OK,
+        )
+
+    def test_update(self):
+        """Test replacing a recipe."""
+        self.assertPerformance(
+            self.grow,
+            lambda: self.client.put(detail_url(self.target.id),
+                                    self.payload()),
+            queries=21,
+            status_code=status.HTTP_200_OK,
+        )
+
+    def test_partial_update(self):
+        """Test patching a recipe."""
+        self.assertPerformance(
+            self.grow,
+            lambda: self.client.patch(detail_url(self.target.id),
+                                      {'title': 'Patched'}),
+            queries=20,
+            status_code=status.HTTP_200_OK,
+        )
+
+    def test_destroy(self):
+        """Test deleting a recipe."""
+        self.assertPerformance(
+            self.grow,
+            lambda: self.client.delete(detail_url(self.target.id)),
+            queries=16,
+            status_code=status.HTTP_204_NO_CONTENT,
+        )
+
+    def test_export(self):
+        """Test queueing an export does no work per recipe."""
+        self.assertPerformance(
+            self.grow,
+            lambda: self.client.post(EXPORT_URL, {'format': 'csv'}),
+            queries=2,
+            status_code=status.HTTP_202_ACCEPTED,
+        )
+
+    def test_cache_stats(self):
+        """Test reading the cache counters."""
+        self.user.is_staff = True
+        self.user.save()
+
+        self.assertPerformance(
+            self.grow,
+            lambda: self.client.get(CACHE_STATS_URL),
+            queries=1,
+            status_code=status.HTTP_200_OK,
+        )
+
+    def test_batch(self):
+        """Test a batch of recipes is spliced from their stored JSON."""
+        def grow(size):
+            self.grow(size)
+            ids = Recipe.objects.values_list('id', flat=True)
+            self.ids = ','.join(map(str, ids))
+
+        self.assertPerformance(
+            grow,
+            lambda: self.client.get(BATCH_URL, {'ids': self.ids}),
+            queries=2,
+            memory_per_item=12 * KB,
+            status_code=status.HTTP_200_OK,
+        )
+
+    def test_changes(self):
+        """Test a sync reads only the changes since its token."""
+        def request():
+            since = sync.make_token(self.target.change_seq - 1, 0)
+            return self.client.get(CHANGES_URL, {'since': since})
+
+        self.assertPerformance(
+            self.grow,
+            request,
+            queries=4,
+            status_code=status.HTTP_200_OK,
+        )
+
+    @override_settings(SIMILARITY_INDEX_DIR=tempfile.mkdtemp())
+    def test_similar(self):
+        """Test similar recipes are loaded with their tags in fixed queries."""
+        def grow(size):
+            self.grow(size)
+            similarity.build_index()
+
+        self.assertPerformance(
+            grow,
+            lambda: self.client.get(similar_url(self.target.id)),
+            queries=5,
+            sizes=[2, 10, 50],
+            status_code=status.HTTP_200_OK,
+        )
+
+
+class ListScanBenchmarkTests(TestCase):
+    """Test the list scan benchmark command."""
+
+    def test_benchmark_list_scan(self):
+        """Test the benchmark reports both layouts and cleans up."""
+        out = StringIO()
+        call_command('benchmark_list_scan', recipes=50, repeat=1, stdout=out)
+
+        self.assertIn('inline:', out.getvalue())
+        self.assertIn('out-of-row:', out.getvalue())
+        self.assertNotIn(
+            'benchmark_recipe', connection.introspection.table_names(),
+        )
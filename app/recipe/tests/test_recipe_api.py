@@ -2,22 +2,29 @@
 Tests for recipe API
 """
 
+import json
+import tempfile
 from decimal import Decimal
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Recipe
+from core.models import Ingredient, Job, Recipe, Tag
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
 )
 
 RECIPES_URL = reverse('recipe:recipe-list')
+EXPORT_URL = reverse('recipe:recipe-export')
+BATCH_URL = reverse('recipe:recipe-batch')
 
 
 def detail_url(recipe_id):
@@ -57,6 +64,8 @@ class PublicRecipeAPITests(TestCase):
 
 class PrivateRecipeAPITests(TestCase):
     """ Test authenticated API requests """
+    databases = set(settings.RECIPE_SHARDS)
+
     def setUp(self):
         self.client = APIClient()
         self.user = create_user(
@@ -71,7 +80,7 @@ class PrivateRecipeAPITests(TestCase):
         url = reverse('recipe:recipe-detail', args=[recipe.id])
         res = self.client.get(url)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, RecipeSerializer(recipe).data)
+        self.assertEqual(res.data, RecipeDetailSerializer(recipe).data)
 
     def test_recipe_list_limited_to_user(self):
         """ Test list of recipes is limited to authenticate user """
@@ -82,7 +91,7 @@ class PrivateRecipeAPITests(TestCase):
         create_recipe(user=other_user)
         create_recipe(user=self.user)
         res = self.client.get(RECIPES_URL)
-        recipes = Recipe.objects.filter(user=self.user)
+        recipes = Recipe.objects.for_user(self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
@@ -107,7 +116,7 @@ class PrivateRecipeAPITests(TestCase):
         }
         res = self.client.post(RECIPES_URL, payload)
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        recipe = Recipe.objects.get(id=res.data['id'])
+        recipe = Recipe.objects.for_user(self.user).get(id=res.data['id'])
         for key in payload.keys():
             self.assertEqual(payload[key], getattr(recipe, key))
         self.assertEqual(recipe.user, self.user)
@@ -159,7 +168,9 @@ class PrivateRecipeAPITests(TestCase):
         res = self.client.delete(url)
 
         self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
-        self.assertFalse(Recipe.objects.filter(id=recipe.id).exists())
+        self.assertFalse(
+            Recipe.objects.for_user(self.user).filter(id=recipe.id).exists()
+        )
 
     def test_delete_other_users_recipe(self):
         """ Test trying to delete another user's recipe fails """
@@ -184,3 +195,199 @@ class PrivateRecipeAPITests(TestCase):
         res = self.client.delete(url)
 
         self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class RecipeTagsIngredientsTests(TestCase):
+    """ Test nested tags and ingredients of recipes """
+    databases = set(settings.RECIPE_SHARDS)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_create_recipe_with_tags_and_ingredients(self):
+        """ Test creating a recipe creates its tags and ingredients """
+        Tag.objects.create(user=self.user, name='Dinner')
+        payload = {
+            'title': 'Curry',
+            'time_minutes': 30,
+            'price': Decimal('6.00'),
+            'description': 'Spicy',
+            'tags': [{'name': 'Dinner'}, {'name': 'Indian'}],
+            'ingredients': [{'name': 'Rice'}, {'name': 'Rice'}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.for_user(self.user).get(id=res.data['id'])
+        self.assertEqual(
+            sorted(tag.name for tag in recipe.tags.all()),
+            ['Dinner', 'Indian'],
+        )
+        self.assertEqual(Tag.objects.for_user(self.user).count(), 2)
+        self.assertEqual(
+            [item['name'] for item in res.data['ingredients']], ['Rice'],
+        )
+
+    def test_tags_are_per_user(self):
+        """ Test users never share tags with the same name """
+        other_user = create_user(
+            email='other@example.com',
+            password='password123',
+        )
+        other_tag = Tag.objects.create(user=other_user, name='Vegan')
+        recipe = create_recipe(user=self.user)
+        res = self.client.patch(detail_url(recipe.id),
+                                {'tags': [{'name': 'Vegan'}]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data['tags'][0]['id'], other_tag.id)
+
+    def test_update_replaces_tags(self):
+        """ Test updating the tags replaces them, leaving others alone """
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Lunch'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Bread'),
+        )
+        res = self.client.patch(detail_url(recipe.id),
+                                {'tags': [{'name': 'Snack'}]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([tag['name'] for tag in res.data['tags']],
+                         ['Snack'])
+        self.assertEqual(recipe.ingredients.count(), 1)
+
+        res = self.client.patch(detail_url(recipe.id), {'tags': []},
+                                format='json')
+        self.assertEqual(recipe.tags.count(), 0)
+
+    def test_list_includes_tags(self):
+        """ Test listed recipes show their tags and ingredients """
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Quick'))
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data[0]['tags'][0]['name'], 'Quick')
+        self.assertEqual(res.data[0]['ingredients'], [])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeExportTests(TestCase):
+    """ Test exporting recipes through the job queue """
+    databases = set(settings.RECIPE_SHARDS)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        other_user = create_user(
+            email='other@example.com',
+            password='password123',
+        )
+        create_recipe(user=other_user)
+        self.recipes = [
+            create_recipe(user=self.user, title=f'Recipe {i}')
+            for i in range(3)
+        ]
+
+    def run_export(self, fmt):
+        """Request an export, run the worker and return the file."""
+        res = self.client.post(EXPORT_URL, {'format': fmt})
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        call_command('run_worker', burst=True)
+        job = Job.objects.get(id=res.data['id'])
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+        self.assertEqual(job.result['count'], 3)
+        with default_storage.open(job.result['file']) as fh:
+            return fh.read().decode()
+
+    def test_export_ndjson(self):
+        """ Test exporting recipes as NDJSON """
+        lines = self.run_export('ndjson').splitlines()
+
+        self.assertEqual(
+            [json.loads(line)['id'] for line in lines],
+            [recipe.id for recipe in self.recipes],
+        )
+
+    def test_export_csv(self):
+        """ Test exporting recipes as CSV """
+        lines = self.run_export('csv').splitlines()
+
+        self.assertEqual(
+            lines[0], 'id,title,time_minutes,price,link,description'
+        )
+        self.assertEqual(len(lines), 4)
+
+    def test_export_invalid_format(self):
+        """ Test an unknown export format is rejected """
+        res = self.client.post(EXPORT_URL, {'format': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Job.objects.exists())
+
+
+class RecipeBatchTests(TestCase):
+    """ Test fetching several recipes in one request """
+    databases = set(settings.RECIPE_SHARDS)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipes = [
+            create_recipe(user=self.user, title=f'Recipe {i}')
+            for i in range(3)
+        ]
+
+    def test_batch_get_keeps_order(self):
+        """ Test recipes come back in the order they were asked for """
+        ids = [self.recipes[2].id, self.recipes[0].id]
+        res = self.client.get(BATCH_URL, {'ids': ','.join(map(str, ids))})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['recipes']], ids)
+        self.assertEqual(
+            res.data['recipes'][0],
+            RecipeDetailSerializer(self.recipes[2]).data,
+        )
+        self.assertEqual(res.data['missing'], [])
+
+    def test_batch_post_reports_missing(self):
+        """ Test unknown and other users' recipes are reported missing """
+        other = create_user(email='other@example.com', password='test123')
+        theirs = create_recipe(user=other)
+        ids = [self.recipes[1].id, theirs.id, 9999, self.recipes[1].id]
+        res = self.client.post(BATCH_URL, {'ids': ids}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [r['id'] for r in res.data['recipes']], [self.recipes[1].id]
+        )
+        self.assertEqual(res.data['missing'], [theirs.id, 9999])
+
+    @override_settings(RECIPE_BATCH_MAX_SIZE=2)
+    def test_batch_too_large(self):
+        """ Test asking for more than the maximum batch size fails """
+        ids = ','.join(str(recipe.id) for recipe in self.recipes)
+        res = self.client.get(BATCH_URL, {'ids': ids})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_invalid_ids(self):
+        """ Test malformed or missing ids are rejected """
+        for ids in ['', '1,abc', '0']:
+            res = self.client.get(BATCH_URL, {'ids': ids})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,200 @@
+"""
+Tests for the recipe detail cache.
+"""
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+from recipe import rendering
+from recipe.cache import LRUCache, recipe_cache
+
+CACHE_STATS_URL = reverse('recipe:recipe-cache-stats')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a recipe."""
+    defaults = {
+        'title': 'Sample Recipe title',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+        'description': 'Sample description',
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class LRUCacheTests(SimpleTestCase):
+    """ Test the in-process LRU cache """
+
+    def test_evicts_least_recently_used(self):
+        """ Test the oldest unused entry is evicted when full """
+        lru = LRUCache(maxsize=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('c'), 3)
+
+    @patch('recipe.cache.time.monotonic')
+    def test_entries_expire(self, patched_monotonic):
+        """ Test entries are dropped after their TTL """
+        patched_monotonic.return_value = 100.0
+        lru = LRUCache(maxsize=2, ttl=5)
+        lru.set('a', 1)
+
+        patched_monotonic.return_value = 104.0
+        self.assertEqual(lru.get('a'), 1)
+        patched_monotonic.return_value = 106.0
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(len(lru), 0)
+
+
+class RecipeCacheAPITests(TestCase):
+    """ Test caching recipe detail responses """
+    databases = set(settings.RECIPE_SHARDS)
+
+    def setUp(self):
+        cache.clear()
+        recipe_cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def test_second_retrieve_is_cached(self):
+        """ Test a repeated retrieve is served without queries """
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(res['X-Cache'], 'MISS')
+
+        with self.assertNumQueries(0):
+            res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Cache'], 'HIT')
+        self.assertEqual(res.data['title'], self.recipe.title)
+        self.assertEqual(recipe_cache.stats()['local_hits'], 1)
+
+    def test_shared_cache_used_after_local_miss(self):
+        """ Test the Django cache backs the in-process cache """
+        self.client.get(detail_url(self.recipe.id))
+        recipe_cache.local.clear()
+
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(res['X-Cache'], 'HIT')
+        self.assertEqual(recipe_cache.stats()['shared_hits'], 1)
+
+    def test_no_stale_read_after_update(self):
+        """ Test updating a recipe invalidates its cached detail """
+        self.client.get(detail_url(self.recipe.id))
+
+        self.client.patch(detail_url(self.recipe.id), {'title': 'New'})
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['title'], 'New')
+
+    def test_no_stale_read_after_bulk_update(self):
+        """ Test a queryset update invalidates cached details """
+        self.client.get(detail_url(self.recipe.id))
+
+        Recipe.objects.for_user(self.user).update(title='Bulk')
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(res.data['title'], 'Bulk')
+
+    def test_no_stale_set_after_concurrent_update(self):
+        """ Test a read racing an update does not cache the old detail """
+        get_fragments = rendering.get_fragments
+
+        def read_then_update(recipes, field):
+            fragments = get_fragments(recipes, field)
+            # Another request updates the recipe after this one read it.
+            Recipe.objects.for_user(self.user).filter(
+                id=self.recipe.id,
+            ).update(title='New')
+            return fragments
+
+        with patch('recipe.views.rendering.get_fragments',
+                   side_effect=read_then_update):
+            res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(res.data['title'], self.recipe.title)
+        recipe_cache.local.clear()
+
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['title'], 'New')
+
+    def test_no_stale_read_after_label_deleted(self):
+        """ Test deleting a tag or ingredient invalidates cached details """
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        self.recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Tofu'),
+        )
+        self.client.get(detail_url(self.recipe.id))
+
+        Tag.objects.for_user(self.user).get(name='Vegan').delete()
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['tags'], [])
+
+        Ingredient.objects.for_user(self.user).get(name='Tofu').delete()
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['ingredients'], [])
+
+    def test_no_stale_read_after_delete(self):
+        """ Test deleting a recipe invalidates its cached detail """
+        self.client.get(detail_url(self.recipe.id))
+
+        self.client.delete(detail_url(self.recipe.id))
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_other_users_recipe_not_cached(self):
+        """ Test recipes of other users are never cached """
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        recipe = create_recipe(user=other)
+
+        self.client.get(detail_url(recipe.id))
+        res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+
+    def test_cache_stats_admin_only(self):
+        """ Test the cache counters are only shown to staff """
+        res = self.client.get(CACHE_STATS_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.get(detail_url(self.recipe.id))
+        res = self.client.get(CACHE_STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['misses'], 1)
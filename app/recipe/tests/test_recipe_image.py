@@ -0,0 +1,208 @@
+"""
+Tests for recipe image uploads and thumbnails.
+"""
+import tempfile
+from concurrent.futures import TimeoutError
+from decimal import Decimal
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import jobs
+from core.models import Job, Recipe
+from recipe import images, thumbnails
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def image_upload_url(recipe_id):
+    """Create and return an image upload URL."""
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a recipe."""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def make_image(size=(1200, 800), fmt='JPEG', color='red'):
+    """Return an encoded image file."""
+    mode = 'RGBA' if fmt == 'PNG' else 'RGB'
+    fh = BytesIO()
+    Image.new(mode, size, color).save(fh, fmt)
+    fh.name = f'image.{fmt.lower()}'
+    fh.seek(0)
+    return fh
+
+
+class ThumbnailRenderTests(TestCase):
+    """Test rendering thumbnails."""
+
+    def test_render_sizes(self):
+        """Test thumbnails keep the aspect ratio and are never enlarged."""
+        rendered = thumbnails.render(make_image((600, 300)).read(),
+                                     [128, 1024])
+
+        sizes = {}
+        for size, name, content in rendered:
+            self.assertTrue(name.endswith(f'-{size}.jpg'))
+            sizes[size] = Image.open(BytesIO(content)).size
+        self.assertEqual(sizes, {128: (128, 64), 1024: (600, 300)})
+
+    def test_render_transparent(self):
+        """Test transparent images are flattened onto white."""
+        data = make_image((100, 100), 'PNG', (0, 0, 0, 0)).read()
+        [(_, _, content)] = thumbnails.render(data, [64])
+
+        pixel = Image.open(BytesIO(content)).getpixel((32, 32))
+        self.assertGreater(min(pixel), 240)
+
+    def test_render_too_many_pixels(self):
+        """Test images over the pixel limit are refused, not decoded."""
+        data = make_image((600, 300)).read()
+
+        with self.assertRaises(ValueError):
+            thumbnails.render(data, [128], max_pixels=600 * 300 - 1)
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    RECIPE_THUMBNAIL_SIZES=[128, 512],
+    RECIPE_LIST_THUMBNAIL_MAX_SIZE=256,
+    RECIPE_THUMBNAIL_WORKERS=0,
+)
+class RecipeImageUploadTests(TestCase):
+    """Test uploading recipe images."""
+    databases = set(settings.RECIPE_SHARDS)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def upload(self, recipe_id, image):
+        return self.client.post(image_upload_url(recipe_id),
+                                {'image': image}, format='multipart')
+
+    def test_upload_and_render_thumbnails(self):
+        """Test an upload is stored and thumbnailed in the background."""
+        res = self.upload(self.recipe.id, make_image())
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.recipe.refresh_from_db()
+        self.assertTrue(default_storage.exists(self.recipe.image.name))
+        self.assertEqual(self.recipe.thumbnails, {})
+
+        jobs.work_once('worker-1')
+        job = Job.objects.get(id=res.data['job']['id'])
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+        self.recipe.refresh_from_db()
+        self.assertEqual(set(self.recipe.thumbnails), {'128', '512'})
+        for name in self.recipe.thumbnails.values():
+            self.assertTrue(default_storage.exists(name))
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(list(res.data[0]['thumbnails']), ['128'])
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(set(res.data['thumbnails']), {'128', '512'})
+        self.assertTrue(res.data['image'].startswith('/media/recipes/'))
+
+    def test_same_image_stored_once(self):
+        """Test identical uploads share one content-hashed file."""
+        other = create_recipe(user=self.user)
+        self.upload(self.recipe.id, make_image())
+        self.upload(other.id, make_image())
+
+        self.recipe.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, other.image.name)
+
+    def test_replaced_image_skips_stale_job(self):
+        """Test thumbnails of a replaced image are not applied."""
+        self.upload(self.recipe.id, make_image(color='red'))
+        self.upload(self.recipe.id, make_image(color='blue'))
+
+        first = jobs.work_once('worker-1')
+        self.assertIn('skipped', first.result)
+        jobs.work_once('worker-1')
+        self.recipe.refresh_from_db()
+        self.assertEqual(set(self.recipe.thumbnails), {'128', '512'})
+
+    def test_upload_invalid_image(self):
+        """Test uploading a file that is not an image fails."""
+        res = self.upload(self.recipe.id, BytesIO(b'not an image'))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=100)
+    def test_upload_too_large(self):
+        """Test images over the maximum size are rejected."""
+        res = self.upload(self.recipe.id, make_image())
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=1000)
+    def test_upload_too_many_pixels(self):
+        """Test images decoding into too many pixels are rejected."""
+        res = self.upload(self.recipe.id, make_image())
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Job.objects.exists())
+
+    def test_upload_other_users_recipe(self):
+        """Test uploading an image to another user's recipe fails."""
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        recipe = create_recipe(user=other)
+        res = self.upload(recipe.id, make_image())
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        recipe.refresh_from_db()
+        self.assertFalse(recipe.image)
+
+    @override_settings(RECIPE_THUMBNAIL_WORKERS=1)
+    def test_render_in_process_pool(self):
+        """Test thumbnails can be rendered in the process pool."""
+        name = default_storage.save('recipes/test.jpg', make_image())
+
+        stored = images.render_thumbnails(name)
+
+        self.assertEqual(set(stored), {'128', '512'})
+
+    @override_settings(RECIPE_THUMBNAIL_WORKERS=1, RECIPE_THUMBNAIL_TIMEOUT=0)
+    def test_render_timeout_replaces_pool(self):
+        """Test a render timing out fails and discards the pool."""
+        name = default_storage.save('recipes/test.jpg', make_image())
+        pool = images.get_pool()
+
+        with self.assertRaises(TimeoutError):
+            images.render_thumbnails(name)
+
+        self.assertIsNot(images.get_pool(), pool)
+        images.shutdown_pool()
@@ -0,0 +1,210 @@
+"""
+Tests for pre-rendered recipe JSON.
+"""
+import json
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, RecipeRendering, Tag
+from core.sharding import shard_for_user
+from recipe import rendering
+from recipe.cache import recipe_cache
+from recipe.serializers import RecipeDetailSerializer, RecipeSerializer
+
+RECIPES_URL = reverse('recipe:recipe-list')
+BATCH_URL = reverse('recipe:recipe-batch')
+CHANGES_URL = reverse('recipe:recipe-changes')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a recipe."""
+    defaults = {
+        'title': 'Crème brûlée',
+        'time_minutes': 45,
+        'price': Decimal('3.50'),
+        'description': 'Caramelise the sugar "just so".',
+        'link': 'http://example.com/recipe.pdf',
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeRenderingTests(TestCase):
+    """Test recipes are served from their stored JSON."""
+    databases = set(settings.RECIPE_SHARDS)
+
+    def setUp(self):
+        recipe_cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        self.renderings = RecipeRendering.objects.using(
+            shard_for_user(self.user.pk),
+        )
+        self.recipe = create_recipe(user=self.user)
+        self.recipe.tags.add(
+            Tag.objects.create(user=self.user, name='Dessert'),
+        )
+        self.recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Sugar'),
+        )
+
+    def live_json(self, serializer_class, recipe):
+        """Return the JSON the live serializer gives for a recipe."""
+        recipe = Recipe.objects.for_user(recipe.user_id).get(id=recipe.id)
+        return JSONRenderer().render(serializer_class(recipe).data)
+
+    def test_parity_with_serializers(self):
+        """Test spliced responses match the live serializers exactly."""
+        other = create_recipe(user=self.user, title='Plain', description='')
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/json')
+        self.assertEqual(
+            res.content,
+            b'[' + self.live_json(RecipeSerializer, other) + b','
+            + self.live_json(RecipeSerializer, self.recipe) + b']',
+        )
+
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(
+            res.content, self.live_json(RecipeDetailSerializer, self.recipe),
+        )
+
+    def test_rendering_stored_on_write(self):
+        """Test API writes store the recipe's rendering at once."""
+        res = self.client.patch(detail_url(self.recipe.id),
+                                {'title': 'Updated'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['title'], 'Updated')
+        stored = self.renderings.get(recipe=self.recipe)
+        self.assertEqual(json.loads(stored.detail), res.data)
+        self.recipe.refresh_from_db()
+        self.assertTrue(rendering.is_current(self.recipe))
+
+    def test_stale_after_orm_changes(self):
+        """Test saves, bulk updates, links and renames are picked up."""
+        self.client.get(RECIPES_URL)
+
+        Recipe.objects.for_user(self.user).filter(id=self.recipe.id).update(
+            title='Bulk',
+        )
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data[0]['title'], 'Bulk')
+
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Cold'))
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(len(res.data['tags']), 2)
+
+        sugar = Ingredient.objects.for_user(self.user).get(name='Sugar')
+        sugar.name = 'Brown sugar'
+        sugar.save()
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(res.data['ingredients'][0]['name'], 'Brown sugar')
+
+    def test_stale_after_label_deleted(self):
+        """Test deleted tags and ingredients leave the stored JSON."""
+        self.client.get(RECIPES_URL)
+        self.client.get(detail_url(self.recipe.id))
+
+        Tag.objects.for_user(self.user).get(name='Dessert').delete()
+        Ingredient.objects.for_user(self.user).filter(name='Sugar').delete()
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data[0]['tags'], [])
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(res.data['tags'], [])
+        self.assertEqual(res.data['ingredients'], [])
+
+    def test_new_version_renders_again(self):
+        """Test renderings of an older version are treated as stale."""
+        self.client.get(RECIPES_URL)
+
+        with patch.object(rendering, 'VERSION', rendering.VERSION + 1):
+            self.recipe = Recipe.objects.for_user(self.user).select_related(
+                'rendering',
+            ).get(id=self.recipe.id)
+            self.assertFalse(rendering.is_current(self.recipe))
+            self.client.get(RECIPES_URL)
+            self.assertEqual(
+                self.renderings.get(recipe=self.recipe).version,
+                rendering.VERSION,
+            )
+
+    def test_concurrent_refresh_keeps_newest(self):
+        """Test a slower read never replaces a newer stored rendering."""
+        shard = shard_for_user(self.user.pk)
+        stale = Recipe.objects.for_user(self.user).get(id=self.recipe.id)
+        Recipe.objects.for_user(self.user).filter(id=self.recipe.id).update(
+            title='Newer',
+        )
+        self.client.get(detail_url(self.recipe.id))
+
+        rendering.render([stale])
+        with self.assertNumQueries(1, using=shard) as ctx:
+            rendering.store([stale.rendering], using=shard)
+
+        self.assertNotIn('DELETE', ctx.captured_queries[0]['sql'])
+        stored = self.renderings.get(recipe=self.recipe)
+        self.assertEqual(json.loads(stored.detail)['title'], 'Newer')
+
+        self.recipe.refresh_from_db()
+        with patch.object(rendering, 'VERSION', rendering.VERSION + 1):
+            rendering.refresh([self.recipe], using=shard)
+            self.assertEqual(
+                self.renderings.get(recipe=self.recipe).version,
+                rendering.VERSION,
+            )
+
+    def test_batch_and_changes_spliced(self):
+        """Test the batch and change feed endpoints splice fragments."""
+        res = self.client.get(BATCH_URL, {'ids': f'{self.recipe.id},999'})
+        self.assertEqual(res.data['missing'], [999])
+        self.assertEqual(res.data['recipes'][0]['tags'][0]['name'],
+                         'Dessert')
+
+        res = self.client.get(CHANGES_URL)
+        self.assertEqual(res.data['changed'][0]['id'], self.recipe.id)
+        self.assertEqual(res.data['deleted'], [])
+        self.assertIs(res.data['has_more'], False)
+
+    def test_browsable_api(self):
+        """Test other renderers get the decoded fragments."""
+        res = self.client.get(RECIPES_URL, HTTP_ACCEPT='text/html')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('Dessert', res.content.decode())
+
+    def test_rebuild_command(self):
+        """Test the command renders every recipe again."""
+        create_recipe(user=self.user)
+        self.renderings.all().delete()
+        out = StringIO()
+
+        call_command('rebuild_recipe_json', batch_size=1, stdout=out)
+
+        self.assertIn('Rendered 2 recipes', out.getvalue())
+        self.assertEqual(self.renderings.count(), 2)
+        call_command('rebuild_recipe_json', stale_only=True, stdout=out)
+        self.assertIn('Rendered 0 recipes', out.getvalue())
@@ -0,0 +1,211 @@
+"""
+Tests for the recipe change feed.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import sync
+from core.deletion import run_user_deletion, schedule_user_deletion
+from core.models import Recipe, RecipeChangeCounter, RecipeTombstone, Tag
+from core.sharding import shard_for_user
+
+CHANGES_URL = reverse('recipe:recipe-changes')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a recipe."""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+        'description': 'Sample description',
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeSyncTests(TestCase):
+    """Test syncing recipes through the change feed."""
+    databases = set(settings.RECIPE_SHARDS)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        self.shard = shard_for_user(self.user.pk)
+
+    def sync(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        res = self.client.get(CHANGES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_initial_sync_returns_everything(self):
+        """Test syncing without a token returns all the user's recipes."""
+        recipes = [create_recipe(self.user, title=f'R{i}') for i in range(3)]
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        create_recipe(other)
+
+        data = self.sync()
+
+        self.assertEqual([r['id'] for r in data['changed']],
+                         [r.id for r in recipes])
+        self.assertEqual(data['deleted'], [])
+        self.assertFalse(data['has_more'])
+
+    def test_sync_returns_only_new_changes(self):
+        """Test a token only returns what changed after it."""
+        first = create_recipe(self.user, title='First')
+        second = create_recipe(self.user, title='Second')
+        token = self.sync()['token']
+
+        self.client.patch(detail_url(first.id), {'title': 'Renamed'})
+        self.client.delete(detail_url(second.id))
+        third = create_recipe(self.user, title='Third')
+        data = self.sync(token)
+
+        self.assertEqual([r['id'] for r in data['changed']],
+                         [first.id, third.id])
+        self.assertEqual(data['changed'][0]['title'], 'Renamed')
+        self.assertEqual(data['deleted'], [second.id])
+        self.assertEqual(self.sync(data['token'])['changed'], [])
+
+    def test_sync_pages(self):
+        """Test changes are paged with `limit` without losing any."""
+        recipes = [create_recipe(self.user, title=f'R{i}') for i in range(5)]
+        Recipe.objects.for_user(self.user).filter(
+            id__in=[r.id for r in recipes[:3]],
+        ).update(
+            time_minutes=30,
+        )
+        Recipe.objects.for_user(self.user).filter(id=recipes[3].id).delete()
+
+        seen, deleted, token = [], [], None
+        while True:
+            data = self.sync(token, limit=2)
+            seen += [r['id'] for r in data['changed']]
+            deleted += data['deleted']
+            token = data['token']
+            if not data['has_more']:
+                break
+
+        self.assertEqual(seen, [recipes[4].id] + [r.id for r in recipes[:3]])
+        self.assertEqual(deleted, [recipes[3].id])
+
+    def test_bulk_update_shares_change_seq(self):
+        """Test rows changed by one bulk update share a sequence."""
+        recipes = [create_recipe(self.user) for _ in range(3)]
+        Recipe.objects.for_user(self.user).update(time_minutes=5)
+
+        seqs = set(
+            Recipe.objects.for_user(self.user)
+            .values_list('change_seq', flat=True)
+        )
+        self.assertEqual(len(seqs), 1)
+        self.assertGreater(seqs.pop(), recipes[-1].change_seq)
+
+    def test_renamed_tag_reported(self):
+        """Test renaming a tag reports the recipes showing it."""
+        tagged = create_recipe(self.user, title='Tagged')
+        create_recipe(self.user, title='Untagged')
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        tagged.tags.add(tag)
+        token = self.sync()['token']
+
+        tag.name = 'Brunch'
+        tag.save()
+        data = self.sync(token)
+
+        self.assertEqual([r['id'] for r in data['changed']], [tagged.id])
+        self.assertEqual(data['changed'][0]['tags'][0]['name'], 'Brunch')
+
+    def test_deleted_tag_reported(self):
+        """Test deleting a tag reports the recipes that showed it."""
+        tagged = create_recipe(self.user, title='Tagged')
+        create_recipe(self.user, title='Untagged')
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        tagged.tags.add(tag)
+        token = self.sync()['token']
+
+        tag.delete()
+        data = self.sync(token)
+
+        self.assertEqual([r['id'] for r in data['changed']], [tagged.id])
+        self.assertEqual(data['changed'][0]['tags'], [])
+        self.assertEqual(data['deleted'], [])
+
+    def test_invalid_token(self):
+        """Test a malformed token is rejected."""
+        res = self.client.get(CHANGES_URL, {'since': 'abc'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_pruned_token_expires(self):
+        """Test tokens older than the pruned tombstones get a 410."""
+        recipe = create_recipe(self.user)
+        token = self.sync()['token']
+        recipe.delete()
+        RecipeTombstone.objects.using(self.shard).update(
+            deleted_at=timezone.now() - timedelta(days=60),
+        )
+
+        call_command('prune_tombstones', stdout=StringIO())
+
+        self.assertFalse(RecipeTombstone.objects.using(self.shard).exists())
+        res = self.client.get(CHANGES_URL, {'since': token})
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+        self.assertEqual(self.sync()['changed'], [])
+
+    def test_user_deletion_forgets_feed(self):
+        """Test deleting a user removes their counter and tombstones."""
+        create_recipe(self.user)
+        Recipe.objects.for_user(self.user).delete()
+        create_recipe(self.user)
+
+        run_user_deletion(schedule_user_deletion(self.user))
+
+        self.assertFalse(
+            RecipeTombstone.objects.using(self.shard).exists(),
+        )
+        self.assertFalse(
+            RecipeChangeCounter.objects.using(self.shard).exists(),
+        )
+
+    def test_get_changes_limit(self):
+        """Test the feed can be read directly, one change at a time."""
+        first = create_recipe(self.user)
+        second = create_recipe(self.user)
+
+        changed, deleted, token, has_more = sync.get_changes(
+            self.user.id, limit=1,
+        )
+        self.assertEqual(changed, [first])
+        self.assertTrue(has_more)
+        changed, deleted, token, has_more = sync.get_changes(
+            self.user.id, token, limit=1,
+        )
+        self.assertEqual(changed, [second])
+        self.assertFalse(has_more)
@@ -0,0 +1,209 @@
+"""
+Tests for the similar recipes endpoint and TF-IDF index.
+"""
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Job, Recipe
+from core.sharding import shard_for_user
+from recipe import similarity
+
+
+def similar_url(recipe_id):
+    """Create and return a similar recipes URL."""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+def create_recipe(user, title, description=''):
+    """Create and return a recipe."""
+    return Recipe.objects.create(
+        user=user,
+        title=title,
+        description=description,
+        time_minutes=10,
+        price=Decimal('5.00'),
+    )
+
+
+class SimilarRecipeTests(TestCase):
+    """ Test finding similar recipes """
+    databases = set(settings.RECIPE_SHARDS)
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        settings_override = override_settings(
+            SIMILARITY_INDEX_DIR=self.index_dir,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        # Recipe changes are queued when the user's shard commits.
+        self.shard = shard_for_user(self.user.pk)
+        with self.captureOnCommitCallbacks(using=self.shard, execute=True):
+            self.create_recipes()
+
+    def create_recipes(self):
+        """Create the recipes shared by the tests."""
+        self.carbonara = create_recipe(
+            self.user, 'Spaghetti carbonara', 'Pasta with egg and bacon',
+        )
+        self.bolognese = create_recipe(
+            self.user, 'Spaghetti bolognese', 'Pasta with beef ragu',
+        )
+        self.curry = create_recipe(
+            self.user, 'Chicken curry', 'Rice and spicy chicken',
+        )
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        self.other_pasta = create_recipe(
+            other, 'Spaghetti carbonara', 'Pasta with egg and bacon',
+        )
+
+    def test_index_not_built(self):
+        """ Test a helpful error is returned before the first build """
+        res = self.client.get(similar_url(self.carbonara.id))
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_similar_recipes_ranked(self):
+        """ Test similar recipes of the user are returned by score """
+        call_command('build_similarity_index')
+
+        res = self.client.get(similar_url(self.carbonara.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [item['id'] for item in res.data]
+        self.assertEqual(ids, [self.bolognese.id])
+        self.assertGreater(res.data[0]['score'], 0)
+
+    def test_limit(self):
+        """ Test the number of results can be limited """
+        create_recipe(self.user, 'Spaghetti pesto', 'Pasta with basil')
+        similarity.build_index()
+
+        res = self.client.get(similar_url(self.carbonara.id), {'limit': 1})
+
+        self.assertEqual(len(res.data), 1)
+
+    def test_other_users_recipe_not_found(self):
+        """ Test similar recipes of another user's recipe are hidden """
+        similarity.build_index()
+
+        res = self.client.get(similar_url(self.other_pasta.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_index_is_memory_mapped(self):
+        """ Test the loaded index shares its arrays through mmap """
+        similarity.build_index()
+
+        index = similarity.get_index()
+
+        self.assertIsInstance(index.data, np.memmap)
+        self.assertIsInstance(index.indices, np.memmap)
+        self.assertIs(similarity.get_index(), index)
+
+    def test_delta_adds_and_removes_recipes(self):
+        """ Test incremental updates change results without a rebuild """
+        similarity.build_index()
+        pesto = create_recipe(self.user, 'Spaghetti pesto', 'Basil pasta')
+        bolognese_id = self.bolognese.id
+        self.bolognese.delete()
+
+        similarity.write_delta([
+            (pesto.id, self.user.id),
+            (bolognese_id, self.user.id),
+        ])
+        res = self.client.get(similar_url(self.carbonara.id))
+
+        self.assertEqual([item['id'] for item in res.data], [pesto.id])
+
+    def test_changes_queue_one_job_per_transaction(self):
+        """ Test saving recipes queues a single index update on commit """
+        similarity.build_index()
+        with self.captureOnCommitCallbacks(using=self.shard, execute=True):
+            self.carbonara.title = 'Carbonara'
+            self.carbonara.save()
+            self.curry.save()
+
+        job = Job.objects.filter(kind='recipe.similarity_update').last()
+        self.assertEqual(
+            sorted(tuple(change) for change in job.payload['changes']),
+            sorted([
+                (self.carbonara.id, self.user.id),
+                (self.curry.id, self.user.id),
+            ]),
+        )
+
+    def test_no_job_before_first_build(self):
+        """ Test changes are not queued while there is no index """
+        with self.captureOnCommitCallbacks(using=self.shard, execute=True):
+            self.curry.save()
+
+        self.assertFalse(
+            Job.objects.filter(kind='recipe.similarity_update').exists()
+        )
+
+    def test_rebuild_keeps_previous_generation(self):
+        """ Test a rebuild leaves the generation readers may be loading """
+        similarity.build_index()
+        first = similarity._read_current(Path(self.index_dir))
+        similarity.build_index()
+
+        similarity.SimilarityIndex(Path(self.index_dir) / first)
+        similarity.build_index()
+        self.assertFalse((Path(self.index_dir) / first).exists())
+
+    def test_delta_written_again_after_rebuild(self):
+        """ Test a delta racing a rebuild lands in the new generation """
+        similarity.build_index()
+        pesto = create_recipe(self.user, 'Spaghetti pesto', 'Pasta')
+        stack_rows = similarity._stack_rows
+        rebuilt = []
+
+        def rebuild_first(rows):
+            if not rebuilt:
+                rebuilt.append(True)
+                # The rebuild reads the recipes before `pesto` commits.
+                with patch('recipe.similarity.iter_all_recipes',
+                           return_value=[self.carbonara, self.bolognese]):
+                    similarity.build_index()
+            return stack_rows(rows)
+
+        with patch('recipe.similarity._stack_rows',
+                   side_effect=rebuild_first):
+            similarity.write_delta([(pesto.id, self.user.id)])
+
+        res = self.client.get(similar_url(self.carbonara.id))
+        self.assertIn(pesto.id, [item['id'] for item in res.data])
+
+    def test_update_job_applies_delta(self):
+        """ Test the queued job writes a delta segment """
+        similarity.build_index()
+        with self.captureOnCommitCallbacks(using=self.shard, execute=True):
+            pesto = create_recipe(self.user, 'Spaghetti pesto', 'Pasta')
+
+        call_command('run_worker', burst=True)
+
+        res = self.client.get(similar_url(self.carbonara.id))
+        self.assertIn(pesto.id, [item['id'] for item in res.data])
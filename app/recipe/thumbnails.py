@@ -0,0 +1,49 @@
+"""
+Thumbnail rendering, run in worker processes.
+
+This module only depends on Pillow, so pool processes started with the
+`spawn` method can import it without setting up Django.
+"""
+import hashlib
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+QUALITY = 85
+
+
+def render(data, sizes, max_pixels=None):
+    """Return [(size, name, jpeg bytes)] thumbnails of an encoded image.
+
+    Each thumbnail fits within a `size` pixel square, keeps the aspect
+    ratio and is never larger than the original. Names are content hashes.
+    Raises ValueError, before decoding anything, if the image has more
+    than `max_pixels` pixels.
+    """
+    image = Image.open(BytesIO(data))
+    width, height = image.size
+    if max_pixels is not None and width * height > max_pixels:
+        raise ValueError(
+            f'The image has {width * height} pixels, over {max_pixels}.'
+        )
+    # JPEGs can be decoded at a fraction of their size, which is much
+    # faster than decoding everything and scaling down.
+    image.draft('RGB', (max(sizes), max(sizes)))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        # Transparent areas become white rather than black.
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    thumbnails = []
+    # Scaling each thumbnail down from the last one keeps the work small.
+    for size in sorted(sizes, reverse=True):
+        image.thumbnail((size, size), Image.LANCZOS)
+        out = BytesIO()
+        image.save(out, 'JPEG', quality=QUALITY, optimize=True,
+                   progressive=True)
+        content = out.getvalue()
+        digest = hashlib.sha256(content).hexdigest()[:32]
+        thumbnails.append((size, f'{digest}-{size}.jpg', content))
+    return thumbnails
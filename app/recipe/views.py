@@ -1,40 +1,130 @@
 """
 Views for the recipe app.
 """
-from rest_framework import viewsets
+from django.core.files.storage import default_storage
+from django.http import Http404
+from rest_framework import viewsets, status
 from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import (
+    SAFE_METHODS,
+    IsAdminUser,
+    IsAuthenticated,
+)
+from rest_framework.response import Response
 
+from core import jobs, sync
+from core.idempotency import IdempotentCreateMixin
 from core.models import Recipe
-from recipe import serializers
+from core.sharding import find_on_shards
+from core.throttling import UserThrottle
+from job.serializers import JobSerializer
+from recipe import images, rendering, serializers
+from recipe.cache import recipe_cache
 
+SIMILAR_MAX_LIMIT = 50
+# Actions showing descriptions, which load them with the recipes.
+DESCRIPTION_ACTIONS = {'update', 'partial_update'}
+# Actions serializing recipes, which prefetch their tags and ingredients.
+RELATED_ACTIONS = {'similar'}
+# Actions splicing together the recipes' stored JSON, see recipe/rendering.py.
+RENDERED_ACTIONS = {'list', 'retrieve', 'batch'}
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     """Manage recipes in the database."""
-    serializer_class = serializers.RecipeSerializer
+    idempotency_scope = 'recipe-create'
+    serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [UserThrottle]
+    throttle_scope = 'recipe-write'
+
+    def get_throttles(self):
+        """Rate limit writes only."""
+        if self.request.method in SAFE_METHODS:
+            return []
+        return super().get_throttles()
 
     def get_queryset(self):
         """Retrieve the recipes for the authenticated user."""
-        return self.queryset.filter(user=self.request.user).order_by('-id')
+        queryset = self.queryset.for_user(self.request.user).order_by('-id')
+        if self.action in DESCRIPTION_ACTIONS:
+            queryset = queryset.select_related('description_row')
+        if self.action in RELATED_ACTIONS:
+            queryset = queryset.prefetch_related('tags', 'ingredients')
+        if self.action in RENDERED_ACTIONS:
+            queryset = queryset.select_related('rendering')
+        return queryset
 
     def perform_create(self, serializer):
-        """Create a new recipe."""
-        serializer.save(user=self.request.user)
+        """Create a new recipe and flag likely duplicates of it."""
+        # Imported on first use to keep numpy out of startup.
+        from recipe import dedup
+        recipe = serializer.save(user=self.request.user)
+        rendering.refresh([recipe])
+        recipe.possible_duplicates = dedup.find_duplicates(recipe)
+
+    def update(self, request, *args, **kwargs):
+        """Update a recipe, responding with its freshly stored JSON."""
+        partial = kwargs.pop('partial', False)
+        serializer = self.get_serializer(
+            self.get_object(), data=request.data, partial=partial,
+        )
+        serializer.is_valid(raise_exception=True)
+        recipe = serializer.save()
+        rendering.refresh([recipe])
+        return rendering.respond(request, recipe.rendering.detail)
 
     def get_serializer_class(self):
         """Return the appropriate serializer class."""
-        if self.action == 'list' or self.action == 'retrieve':
-            return serializers.RecipeDetailSerializer
+        if self.action == 'list':
+            return serializers.RecipeSerializer
+        elif self.action == 'create':
+            return serializers.RecipeCreateSerializer
+        elif self.action == 'export':
+            return serializers.RecipeExportSerializer
+        elif self.action == 'similar':
+            return serializers.SimilarRecipeSerializer
+        elif self.action == 'batch':
+            return serializers.RecipeBatchSerializer
+        elif self.action == 'upload_image':
+            return serializers.RecipeImageSerializer
         return super().get_serializer_class()
 
     def get_object(self):
         """Retrieve and return a recipe instance by pk."""
-        from rest_framework.generics import get_object_or_404
         pk = self.kwargs.get('pk')
-        return get_object_or_404(Recipe, pk=pk)
+        recipe = self.get_queryset().filter(pk=pk).first()
+        if recipe is None:
+            # Other users' recipes may be stored on another shard.
+            recipe = find_on_shards(Recipe, pk=pk)
+        if recipe is None:
+            raise Http404
+        return recipe
+
+    def list(self, request, *args, **kwargs):
+        """Return the user's recipes, spliced from their stored JSON."""
+        recipes = list(self.filter_queryset(self.get_queryset()))
+        return rendering.respond(request, rendering.join_array(
+            rendering.get_fragments(recipes, 'summary'),
+        ))
+
+    def retrieve(self, request, *args, **kwargs):
+        """Return a recipe, from the detail cache when possible."""
+        pk = self.kwargs.get('pk')
+        content, version = recipe_cache.get(request.user.id, pk)
+        if content is not None:
+            return rendering.respond(request, content,
+                                     headers={'X-Cache': 'HIT'})
+        recipe = self.get_object()
+        [content] = rendering.get_fragments([recipe], 'detail')
+        if recipe.user_id == request.user.id:
+            recipe_cache.set(request.user.id, pk, content, version)
+        return rendering.respond(request, content,
+                                 headers={'X-Cache': 'MISS'})
 
     def destroy(self, request, *args, **kwargs):
         """Delete a recipe only if the user owns it, else return 403."""
@@ -46,4 +136,132 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 {'detail': 'You do not have permission to delete this recipe.'},
                 status=status.HTTP_403_FORBIDDEN
             )
-        return super().destroy(request, *args, **kwargs)
\ No newline at end of file
+        return super().destroy(request, *args, **kwargs)
+
+    @action(methods=['POST'], detail=False)
+    def export(self, request):
+        """Queue an export of the user's recipes to a file."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = jobs.enqueue(
+            'recipe.export',
+            {'format': serializer.validated_data['format']},
+            user=request.user,
+        )
+        return Response(JobSerializer(job).data,
+                        status=status.HTTP_202_ACCEPTED)
+
+    @action(methods=['POST'], detail=True, url_path='upload-image',
+            parser_classes=[MultiPartParser])
+    def upload_image(self, request, pk=None):
+        """Store an image of a recipe and queue rendering its thumbnails."""
+        recipe = self.get_queryset().filter(pk=pk).first()
+        if recipe is None:
+            raise Http404
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.validated_data['image']
+        name = images.save_image(upload, upload.image.format)
+        recipe.image = name
+        recipe.thumbnails = {}
+        recipe.save(update_fields=['image', 'thumbnails'])
+        job = jobs.enqueue(
+            'recipe.thumbnails',
+            {'recipe_id': recipe.id, 'image': name},
+            user=request.user,
+        )
+        return Response({
+            'id': recipe.id,
+            'image': default_storage.url(name),
+            'job': JobSerializer(job).data,
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @action(methods=['GET'], detail=False, url_path='cache-stats',
+            permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        """Return this process's recipe detail cache counters."""
+        return Response(recipe_cache.stats())
+
+    @action(methods=['GET', 'POST'], detail=False)
+    def batch(self, request):
+        """Return several of the user's recipes, in the order asked for."""
+        if request.method == 'GET':
+            ids = request.query_params.get('ids', '')
+            data = {'ids': [part for part in ids.split(',') if part]}
+        else:
+            data = request.data
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        found = self.get_queryset().filter(id__in=ids).in_bulk()
+        recipes = [found[pk] for pk in ids if pk in found]
+        return rendering.respond(request, rendering.join_object([
+            ('recipes', rendering.join_array(
+                rendering.get_fragments(recipes, 'detail'),
+            )),
+            ('missing', rendering.to_json(
+                [pk for pk in ids if pk not in found],
+            )),
+        ]))
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """Return the user's recipes most similar to this one."""
+        from recipe import similarity
+        queryset = self.get_queryset().prefetch_related(None)
+        recipe = queryset.filter(pk=pk).first()
+        if recipe is None:
+            raise Http404
+        try:
+            limit = min(int(request.query_params.get('limit', 10)),
+                        SIMILAR_MAX_LIMIT)
+        except ValueError:
+            limit = 10
+        try:
+            matches = similarity.get_index().similar(recipe, max(limit, 1))
+        except similarity.IndexNotBuilt:
+            return Response(
+                {'detail': 'The similarity index has not been built yet.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        scores = dict(matches)
+        recipes = self.get_queryset().filter(id__in=scores)
+        recipes = sorted(recipes, key=lambda r: -scores[r.id])
+        for item in recipes:
+            item.score = scores[item.id]
+        serializer = self.get_serializer(recipes, many=True)
+        return Response(serializer.data)
+
+    @action(methods=['GET'], detail=False)
+    def changes(self, request):
+        """Return the user's recipe changes since a sync token."""
+        params = request.query_params
+        try:
+            limit = min(int(params.get('limit', sync.DEFAULT_LIMIT)),
+                        sync.MAX_LIMIT)
+        except ValueError:
+            limit = sync.DEFAULT_LIMIT
+        try:
+            changed, deleted, token, has_more = sync.get_changes(
+                request.user.id,
+                params.get('since'),
+                max(limit, 1),
+            )
+        except sync.InvalidSyncToken:
+            return Response(
+                {'detail': 'Invalid sync token.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except sync.SyncTokenExpired:
+            return Response(
+                {'detail': 'The sync token has expired, sync from scratch.'},
+                status=status.HTTP_410_GONE,
+            )
+        return rendering.respond(request, rendering.join_object([
+            ('changed', rendering.join_array(
+                rendering.get_fragments(changed, 'detail'),
+            )),
+            ('deleted', rendering.to_json(deleted)),
+            ('token', rendering.to_json(token)),
+            ('has_more', rendering.to_json(has_more)),
+        ]))
@@ -0,0 +1,142 @@
+"""
+Query-count and memory contracts for the user API.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Job, Recipe, UserDeletion
+from core.testing import PerformanceContractMixin
+from core.throttling import reset_throttles
+
+CREATE_USER_URL = reverse('user:create')
+TOKEN_URL = reverse('user:token')
+ME_URL = reverse('user:me')
+
+
+# The budgets are for a single recipe shard, see recipe/tests/
+# test_performance.py.
+@override_settings(RECIPE_SHARDS=['default'])
+class PublicUserPerformanceTests(PerformanceContractMixin, TestCase):
+    """Test the public user endpoints stay within their budgets."""
+
+    def setUp(self):
+        self.client = APIClient()
+        reset_throttles()
+        self.count = 0
+
+    def grow(self, size):
+        """Bring the number of users up to `size`."""
+        while self.count < size:
+            self.count += 1
+            get_user_model().objects.create_user(
+                f'user{self.count}@example.com',
+                'testpass123',
+            )
+
+    def test_create_user(self):
+        """Test signing up does not depend on the number of users."""
+        def request():
+            return self.client.post(CREATE_USER_URL, {
+                'email': f'new{self.count}@example.com',
+                'password': 'testpass123',
+                'name': 'New User',
+            })
+
+        self.assertPerformance(
+            self.grow,
+            request,
+            queries=6,
+            status_code=status.HTTP_201_CREATED,
+        )
+
+    def test_create_token(self):
+        """Test logging in looks up the user and creates a token."""
+        def grow(size):
+            self.grow(size)
+            Token.objects.all().delete()
+
+        self.assertPerformance(
+            grow,
+            lambda: self.client.post(TOKEN_URL, {
+                'email': 'user1@example.com',
+                'password': 'testpass123',
+            }),
+            queries=5,
+            status_code=status.HTTP_200_OK,
+        )
+
+
+@override_settings(RECIPE_SHARDS=['default'])
+class PrivateUserPerformanceTests(PerformanceContractMixin, TestCase):
+    """Test the authenticated user endpoints stay within their budgets."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+            name='Test Name',
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.count = 0
+
+    def grow(self, size):
+        """Give the user `size` recipes."""
+        Recipe.objects.bulk_create([
+            Recipe(
+                user=self.user,
+                title=f'Recipe {number}',
+                time_minutes=10,
+                price=Decimal('5.00'),
+            )
+            for number in range(self.count, size)
+        ])
+        self.count = max(self.count, size)
+
+    def test_retrieve_profile(self):
+        """Test reading the profile ignores the user's recipes."""
+        self.assertPerformance(
+            self.grow,
+            lambda: self.client.get(ME_URL),
+            queries=1,
+            status_code=status.HTTP_200_OK,
+        )
+
+    def test_update_profile(self):
+        """Test updating the profile."""
+        self.assertPerformance(
+            self.grow,
+            lambda: self.client.patch(ME_URL, {'name': 'Updated'}),
+            queries=2,
+            status_code=status.HTTP_200_OK,
+        )
+
+    def test_delete_profile(self):
+        """Test deleting the account defers the recipe deletion."""
+        def grow(size):
+            self.grow(size)
+            # Undo the previous run so each size schedules a new deletion.
+            UserDeletion.objects.all().delete()
+            Job.objects.all().delete()
+            get_user_model().objects.filter(pk=self.user.pk).update(
+                is_active=True,
+            )
+            token, _ = Token.objects.get_or_create(user=self.user)
+            self.client.credentials(
+                HTTP_AUTHORIZATION=f'Token {token.key}',
+            )
+
+        self.assertPerformance(
+            grow,
+            lambda: self.client.delete(ME_URL),
+            queries=9,
+            status_code=status.HTTP_202_ACCEPTED,
+        )
@@ -1,6 +1,7 @@
 """
 Tests for user API
 """
+from django.conf import settings
 from django.test import TestCase
 from django.urls import reverse
 from django.contrib.auth import get_user_model
@@ -8,6 +9,9 @@ from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core.models import UserDeletion
+from core.throttling import reset_throttles
+
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
@@ -23,6 +27,7 @@ class PublicUserApiTests(TestCase):
 
     def setUp(self):
         self.client = APIClient()
+        reset_throttles()
 
     def test_create_user_success(self):
         """Test creating a user is successful."""
@@ -108,6 +113,7 @@ class PublicUserApiTests(TestCase):
 
 class PrivateUserApiTests(TestCase):
     """Test API requests that require authentication."""
+    databases = set(settings.RECIPE_SHARDS)
 
     def setUp(self):
         self.user = create_user(
@@ -143,4 +149,16 @@ class PrivateUserApiTests(TestCase):
         self.user.refresh_from_db()
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_delete_user_deactivates_and_schedules(self):
+        """Test deleting the profile deactivates the user."""
+        response = self.client.delete(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'pending')
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertTrue(
+            UserDeletion.objects.filter(user=self.user).exists()
+        )
@@ -3,31 +3,42 @@ Views for the user app.
 """
 
 
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, authentication, permissions, status
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+
+from core.deletion import schedule_user_deletion
+from core.idempotency import IdempotentCreateMixin
+from core.throttling import ClientIPThrottle, UserThrottle
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer
 )
 
 
-class CreateUserView(generics.CreateAPIView):
+class CreateUserView(IdempotentCreateMixin, generics.CreateAPIView):
     """Create a new user in the system."""
+    idempotency_scope = 'user-create'
     serializer_class = UserSerializer
     permission_classes = []  # Allow any user to access this view
     authentication_classes = []  # No authentication required for user creation
+    throttle_classes = [ClientIPThrottle]
+    throttle_scope = 'auth'
 
 class createTokenView(ObtainAuthToken):
     """Create a new auth token for the user."""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    throttle_classes = [ClientIPThrottle, UserThrottle]
+    throttle_scope = 'auth'
+    throttle_user_field = 'email'
 
     def post(self, request, *args, **kwargs):
         """Handle POST request to create a token."""
         return super().post(request, *args, **kwargs)
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     """Manage the authenticated user."""
     serializer_class = UserSerializer
     authentication_classes = [authentication.TokenAuthentication]
@@ -40,3 +51,15 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     def perform_update(self, serializer):
         """Update the user with the provided serializer data."""
         serializer.save()
+
+    def destroy(self, request, *args, **kwargs):
+        """Deactivate the user and delete their data in the background."""
+        deletion = schedule_user_deletion(self.get_object())
+        return Response(
+            {
+                'status': deletion.status,
+                'total_recipes': deletion.total_recipes,
+                'deleted_recipes': deletion.deleted_recipes,
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )